@@ -1,16 +1,21 @@
 # admin.py
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.core.cache import cache
+from django.http import HttpResponseRedirect
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from django.db.models import Count, Q
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
-import qrcode
-from io import BytesIO
 import base64
 
+from .exports import streaming_export_response
+from .qr import qr_cache
+from .workflow import InvalidTransition, bulk_transition, check_transition, transition
 from .models import (
     CustomUser, County, SubCounty, Division, Location, SubLocation, Village,
     ChiefOffice, Chief, ChiefStaff, DOOffice, DOOfficer, DOStaff,
@@ -18,7 +23,7 @@ from .models import (
     IDApplication, ApplicationDocument, ChiefEligibilityLetter,
     BiometricAppointment, BiometricData, WaitingCard, NationalID,
     ApplicationStatusHistory, NotificationTemplate, Notification,
-    Fee, Payment, SystemSettings, AuditLog, SecurityIncident, Report
+    Fee, Payment, PaymentCallback, SystemSettings, AuditLog, HistoryArchive, SecurityIncident, Report
 )
 
 
@@ -29,6 +34,62 @@ class KenyanIDAdminSite(admin.AdminSite):
     index_title = "System Administration Dashboard"
 
 
+# Count columns
+class CountColumn:
+    """A list_display column counting related rows, e.g. CountColumn('chiefs', 'Active Chiefs', is_active=True)"""
+    
+    def __init__(self, relation, description, **filters):
+        self.relation = relation
+        self.description = description
+        self.filters = filters
+    
+    def join_count(self):
+        """Count over a join; cheap when it is the only count on the query"""
+        condition = Q(**{f'{self.relation}__{key}': value for key, value in self.filters.items()})
+        return Count(self.relation, filter=condition if self.filters else None, distinct=True)
+    
+    def subquery_count(self, model):
+        """Correlated count; several of these do not multiply each other's rows"""
+        rel = model._meta.get_field(self.relation)
+        counted = rel.related_model._default_manager.filter(
+            **{rel.field.name: OuterRef('pk')}, **self.filters
+        ).order_by().values(rel.field.name).annotate(n=Count('pk')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+class AnnotatedCountsMixin:
+    """
+    Declare ``count_columns = {'column_name': CountColumn(...)}`` on a ModelAdmin to get
+    sortable list_display columns computed in the changelist query instead of one COUNT
+    per row. A single column uses Count(..., distinct=True); with several, each is a
+    correlated subquery so their joins don't fan out.
+    """
+    count_columns = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, column in cls.__dict__.get('count_columns', {}).items():
+            setattr(cls, name, cls._count_display(name, column))
+    
+    @staticmethod
+    def _count_display(name, column):
+        def display(self, obj):
+            return getattr(obj, f'_{name}', 0)
+        display.__name__ = name
+        display.short_description = column.description
+        display.admin_order_field = f'_{name}'
+        return display
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if len(self.count_columns) == 1:
+            (name, column), = self.count_columns.items()
+            return qs.annotate(**{f'_{name}': column.join_count()})
+        return qs.annotate(**{
+            f'_{name}': column.subquery_count(self.model) for name, column in self.count_columns.items()
+        })
+
+
 # User Management
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -53,190 +114,189 @@ class CustomUserAdmin(UserAdmin):
 
 # Location Management
 @admin.register(County)
-class CountyAdmin(admin.ModelAdmin):
+class CountyAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'code', 'sub_counties_count', 'applications_count', 'created_at')
     search_fields = ('name', 'code')
     ordering = ('name',)
     
-    def sub_counties_count(self, obj):
-        return obj.sub_counties.count()
-    sub_counties_count.short_description = 'Sub Counties'
-    
-    def applications_count(self, obj):
-        return obj.current_applications.count()
-    applications_count.short_description = 'Applications'
+    count_columns = {
+        'sub_counties_count': CountColumn('sub_counties', 'Sub Counties'),
+        'applications_count': CountColumn('current_applications', 'Applications'),
+    }
 
 
 @admin.register(SubCounty)
-class SubCountyAdmin(admin.ModelAdmin):
+class SubCountyAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'county', 'code', 'divisions_count', 'created_at')
     list_filter = ('county',)
+    list_select_related = ('county',)
     search_fields = ('name', 'code', 'county__name')
     ordering = ('county__name', 'name')
     
-    def divisions_count(self, obj):
-        return obj.divisions.count()
-    divisions_count.short_description = 'Divisions'
+    count_columns = {
+        'divisions_count': CountColumn('divisions', 'Divisions'),
+    }
 
 
 @admin.register(Division)
-class DivisionAdmin(admin.ModelAdmin):
+class DivisionAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'sub_county', 'county', 'locations_count')
-    list_filter = ('sub_county__county',)
+    list_filter = ('county',)
+    list_select_related = ('sub_county__county', 'county')
     search_fields = ('name', 'sub_county__name')
     
-    def county(self, obj):
-        return obj.sub_county.county.name
-    county.short_description = 'County'
-    
-    def locations_count(self, obj):
-        return obj.locations.count()
-    locations_count.short_description = 'Locations'
+    count_columns = {
+        'locations_count': CountColumn('locations', 'Locations'),
+    }
 
 
 @admin.register(Location)
-class LocationAdmin(admin.ModelAdmin):
+class LocationAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'division', 'sub_county', 'county', 'sub_locations_count')
-    list_filter = ('division__sub_county__county',)
+    list_filter = ('county',)
+    list_select_related = ('division__sub_county', 'county')
     search_fields = ('name', 'division__name')
     
+    count_columns = {
+        'sub_locations_count': CountColumn('sub_locations', 'Sub Locations'),
+    }
+    
     def sub_county(self, obj):
         return obj.division.sub_county.name
     sub_county.short_description = 'Sub County'
-    
-    def county(self, obj):
-        return obj.division.sub_county.county.name
-    county.short_description = 'County'
-    
-    def sub_locations_count(self, obj):
-        return obj.sub_locations.count()
-    sub_locations_count.short_description = 'Sub Locations'
 
 
 @admin.register(SubLocation)
-class SubLocationAdmin(admin.ModelAdmin):
+class SubLocationAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'location', 'division', 'villages_count')
+    list_filter = ('county',)
+    list_select_related = ('location__division',)
     search_fields = ('name', 'location__name')
     
+    count_columns = {
+        'villages_count': CountColumn('villages', 'Villages'),
+    }
+    
     def division(self, obj):
         return obj.location.division.name
     division.short_description = 'Division'
-    
-    def villages_count(self, obj):
-        return obj.villages.count()
-    villages_count.short_description = 'Villages'
 
 
 @admin.register(Village)
 class VillageAdmin(admin.ModelAdmin):
-    list_display = ('name', 'sub_location', 'location', 'full_address')
+    list_display = ('name', 'sub_location', 'location', 'full_name')
+    list_filter = ('county',)
+    list_select_related = ('sub_location__location',)
     search_fields = ('name', 'sub_location__name')
     
     def location(self, obj):
         return obj.sub_location.location.name
     location.short_description = 'Location'
-    
-    def full_address(self, obj):
-        return f"{obj.name}, {obj.sub_location.location.division.sub_county.county.name}"
-    full_address.short_description = 'Full Address'
 
 
 # Administrative Offices
 @admin.register(ChiefOffice)
-class ChiefOfficeAdmin(admin.ModelAdmin):
+class ChiefOfficeAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'location', 'sub_location', 'contact_phone', 'chiefs_count', 'is_active')
-    list_filter = ('is_active', 'location__division__sub_county__county')
+    list_filter = ('is_active', 'location__county')
+    list_select_related = ('location__division', 'sub_location__location')
     search_fields = ('name', 'location__name', 'contact_phone')
     
-    def chiefs_count(self, obj):
-        return obj.chiefs.filter(is_active=True).count()
-    chiefs_count.short_description = 'Active Chiefs'
+    count_columns = {
+        'chiefs_count': CountColumn('chiefs', 'Active Chiefs', is_active=True),
+    }
 
 
 @admin.register(Chief)
-class ChiefAdmin(admin.ModelAdmin):
+class ChiefAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('user', 'office', 'employee_id', 'stamp_serial', 'appointment_date', 'applications_count', 'is_active')
-    list_filter = ('is_active', 'appointment_date', 'office__location__division__sub_county__county')
+    list_filter = ('is_active', 'appointment_date', 'office__location__county')
+    list_select_related = ('user', 'office')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'employee_id', 'stamp_serial')
     date_hierarchy = 'appointment_date'
     
-    def applications_count(self, obj):
-        return obj.idapplication_set.count()
-    applications_count.short_description = 'Applications Handled'
+    count_columns = {
+        'applications_count': CountColumn('idapplication', 'Applications Handled'),
+    }
 
 
 @admin.register(ChiefStaff)
 class ChiefStaffAdmin(admin.ModelAdmin):
     list_display = ('user', 'chief_office', 'position', 'reporting_chief', 'employee_id', 'is_active')
-    list_filter = ('is_active', 'position', 'chief_office__location__division__sub_county__county')
+    list_filter = ('is_active', 'position', 'chief_office__location__county')
+    list_select_related = ('user', 'chief_office', 'reporting_chief__user', 'reporting_chief__office')
     search_fields = ('user__username', 'employee_id', 'position')
 
 
 @admin.register(DOOffice)
-class DOOfficeAdmin(admin.ModelAdmin):
+class DOOfficeAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'county', 'contact_phone', 'email', 'officers_count', 'applications_count', 'is_active')
     list_filter = ('is_active', 'county')
+    list_select_related = ('county',)
     search_fields = ('name', 'county__name', 'contact_phone', 'email')
     
-    def officers_count(self, obj):
-        return obj.officers.filter(is_active=True).count()
-    officers_count.short_description = 'Active Officers'
-    
-    def applications_count(self, obj):
-        return obj.idapplication_set.count()
-    applications_count.short_description = 'Applications Processed'
+    count_columns = {
+        'officers_count': CountColumn('officers', 'Active Officers', is_active=True),
+        'applications_count': CountColumn('idapplication', 'Applications Processed'),
+    }
 
 
 @admin.register(DOOfficer)
-class DOOfficerAdmin(admin.ModelAdmin):
+class DOOfficerAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('user', 'do_office', 'employee_id', 'appointment_date', 'applications_processed', 'is_active')
     list_filter = ('is_active', 'appointment_date', 'do_office__county')
+    list_select_related = ('user', 'do_office')
     search_fields = ('user__username', 'employee_id')
     date_hierarchy = 'appointment_date'
     
-    def applications_processed(self, obj):
-        return obj.idapplication_set.count()
-    applications_processed.short_description = 'Applications Processed'
+    count_columns = {
+        'applications_processed': CountColumn('idapplication', 'Applications Processed'),
+    }
 
 
 @admin.register(DOStaff)
 class DOStaffAdmin(admin.ModelAdmin):
     list_display = ('user', 'do_office', 'position', 'reporting_officer', 'employee_id', 'is_active')
     list_filter = ('is_active', 'position', 'do_office__county')
+    list_select_related = ('user', 'do_office', 'reporting_officer__user')
     search_fields = ('user__username', 'employee_id', 'position')
 
 
 @admin.register(HudumaCentre)
-class HudumaCentreAdmin(admin.ModelAdmin):
+class HudumaCentreAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('name', 'county', 'sub_county', 'contact_phone', 'staff_count', 'applications_count', 'is_active')
     list_filter = ('is_active', 'county')
+    list_select_related = ('county', 'sub_county__county')
     search_fields = ('name', 'county__name', 'contact_phone')
     
-    def staff_count(self, obj):
-        return obj.staff.filter(is_active=True).count()
-    staff_count.short_description = 'Active Staff'
-    
-    def applications_count(self, obj):
-        return obj.idapplication_set.count()
-    applications_count.short_description = 'Applications'
+    count_columns = {
+        'staff_count': CountColumn('staff', 'Active Staff', is_active=True),
+        'applications_count': CountColumn('idapplication', 'Applications'),
+    }
 
 
 @admin.register(HudumaStaff)
 class HudumaStaffAdmin(admin.ModelAdmin):
     list_display = ('user', 'huduma_centre', 'position', 'employee_id', 'is_active')
     list_filter = ('is_active', 'position', 'huduma_centre__county')
+    list_select_related = ('user', 'huduma_centre')
     search_fields = ('user__username', 'employee_id', 'position')
 
 
 # Birth Certificate Management
 @admin.register(BirthCertificate)
-class BirthCertificateAdmin(admin.ModelAdmin):
+class BirthCertificateAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     list_display = ('certificate_number', 'full_name', 'date_of_birth', 'gender', 'county_of_birth', 'is_active', 'applications_count')
     list_filter = ('gender', 'is_active', 'is_verified', 'county_of_birth', 'registration_date')
     search_fields = ('certificate_number', 'serial_number', 'full_name', 'father_name', 'mother_name')
     date_hierarchy = 'date_of_birth'
+    list_select_related = ('county_of_birth',)
     readonly_fields = ('serial_number', 'created_at', 'updated_at')
     
+    count_columns = {
+        'applications_count': CountColumn('idapplication', 'ID Applications'),
+    }
+    
     fieldsets = (
         ('Certificate Details', {
             'fields': ('certificate_number', 'serial_number', 'registration_date', 'issuing_office')
@@ -257,10 +317,6 @@ class BirthCertificateAdmin(admin.ModelAdmin):
             'fields': ('is_active', 'is_verified')
         }),
     )
-    
-    def applications_count(self, obj):
-        return obj.idapplication_set.count()
-    applications_count.short_description = 'ID Applications'
 
 
 # Document Management
@@ -332,16 +388,51 @@ class IDApplicationAdmin(admin.ModelAdmin):
         return "N/A"
     processing_days.short_description = 'Processing Time'
     
+    # Dropdown choices whose __str__ follows a foreign key; load it up front
+    # instead of one query per option (locations below sub-county store their full name)
+    choice_select_related = {
+        SubCounty: ('county',),
+        Chief: ('user', 'office'),
+        DOOfficer: ('user',),
+    }
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        related = self.choice_select_related.get(db_field.related_model)
+        if related and 'queryset' not in kwargs:
+            kwargs['queryset'] = db_field.related_model._default_manager.select_related(*related)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def save_model(self, request, obj, form, change):
+        # A status edited on the change form goes through the workflow like any other change.
+        # IDApplicationForm refuses moves the workflow does not allow; this catches the status
+        # changing underneath the form between validation and save.
+        target = obj.status
+        moving = change and 'status' in form.changed_data
+        if moving:
+            obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if moving:
+            try:
+                transition(obj, target, request.user, reason='Changed from admin')
+            except InvalidTransition as e:
+                self.message_user(request, f'Status not changed: {e}.', messages.ERROR)
+    
+    def response_change(self, request, obj):
+        if 'status' in request.POST and obj.status != request.POST['status']:
+            # The transition was refused: stay on the form instead of reporting success
+            return HttpResponseRedirect(request.path)
+        return super().response_change(request, obj)
+    
     actions = ['approve_applications', 'reject_applications', 'export_applications']
     
     def approve_applications(self, request, queryset):
-        updated = queryset.filter(status='chief_review').update(status='chief_approved')
-        self.message_user(request, f'{updated} applications approved.')
+        moved = bulk_transition(queryset, {'chief_review': 'chief_approved'}, request.user, reason='Approved from admin')
+        self.message_user(request, f'{sum(moved.values())} applications approved.')
     approve_applications.short_description = "Approve selected applications"
     
     def reject_applications(self, request, queryset):
-        updated = queryset.filter(status='chief_review').update(status='chief_rejected')
-        self.message_user(request, f'{updated} applications rejected.')
+        moved = bulk_transition(queryset, {'chief_review': 'chief_rejected'}, request.user, reason='Rejected from admin')
+        self.message_user(request, f'{sum(moved.values())} applications rejected.')
     reject_applications.short_description = "Reject selected applications"
 
 
@@ -356,7 +447,7 @@ class ApplicationDocumentAdmin(admin.ModelAdmin):
 @admin.register(ChiefEligibilityLetter)
 class ChiefEligibilityLetterAdmin(admin.ModelAdmin):
     list_display = ('letter_number', 'application', 'chief', 'full_name', 'is_eligible', 'is_valid_now', 'qr_code_preview', 'issued_at')
-    list_filter = ('is_eligible', 'is_used', 'issued_at', 'chief__office__location__division__sub_county__county')
+    list_filter = ('is_eligible', 'is_used', 'issued_at', 'chief__office__location__county')
     search_fields = ('letter_number', 'application__application_number', 'full_name', 'verification_code')
     readonly_fields = ('verification_code', 'qr_code_preview', 'issued_at')
     date_hierarchy = 'issued_at'
@@ -367,8 +458,8 @@ class ChiefEligibilityLetterAdmin(admin.ModelAdmin):
     is_valid_now.short_description = 'Currently Valid'
     
     def qr_code_preview(self, obj):
-        if obj.qr_code:
-            return format_html('<img src="{}" width="50" height="50" />', obj.qr_code.url)
+        if obj.pk:
+            return format_html('<img src="{}" width="50" height="50" loading="lazy" />', obj.qr_url)
         return "No QR Code"
     qr_code_preview.short_description = 'QR Code'
 
@@ -399,11 +490,11 @@ class WaitingCardAdmin(admin.ModelAdmin):
     list_display = ('serial_number', 'application', 'expected_collection_date', 'collection_location', 'is_active', 'qr_code_preview', 'issued_at')
     list_filter = ('is_active', 'is_collected', 'collection_location', 'expected_collection_date')
     search_fields = ('serial_number', 'application__application_number', 'application__full_name')
-    readonly_fields = ('issued_at',)
+    readonly_fields = ('qr_code_preview', 'issued_at')
     
     def qr_code_preview(self, obj):
-        if obj.qr_code:
-            return format_html('<img src="{}" width="50" height="50" />', obj.qr_code.url)
+        if obj.pk:
+            return format_html('<img src="{}" width="50" height="50" loading="lazy" />', obj.qr_url)
         return "No QR Code"
     qr_code_preview.short_description = 'QR Code'
 
@@ -438,7 +529,9 @@ class ApplicationStatusHistoryAdmin(admin.ModelAdmin):
     list_filter = ('new_status', 'previous_status', 'location_type', 'timestamp')
     search_fields = ('application__application_number', 'application__full_name', 'changed_by__username')
     readonly_fields = ('timestamp',)
+    list_select_related = ('application', 'changed_by')
     date_hierarchy = 'timestamp'
+    show_full_result_count = False  # the table is large; older months are moved out by archive_history
 
 
 # Notification Management
@@ -451,10 +544,10 @@ class NotificationTemplateAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('recipient', 'notification_type', 'recipient_contact', 'status', 'delivery_status', 'created_at')
+    list_display = ('recipient', 'notification_type', 'recipient_contact', 'status', 'delivery_status', 'attempts', 'created_at')
     list_filter = ('notification_type', 'status', 'created_at')
     search_fields = ('recipient__username', 'recipient_contact', 'subject', 'application__application_number')
-    readonly_fields = ('sent_at', 'delivered_at', 'read_at', 'created_at')
+    readonly_fields = ('attempts', 'next_attempt_at', 'locked_until', 'sent_at', 'delivered_at', 'read_at', 'created_at')
     
     def delivery_status(self, obj):
         if obj.status == 'delivered':
@@ -466,6 +559,15 @@ class NotificationAdmin(admin.ModelAdmin):
         else:
             return format_html('<span style="color: orange;">⏳ Pending</span>')
     delivery_status.short_description = 'Delivery Status'
+    
+    actions = ['retry_notifications']
+    
+    def retry_notifications(self, request, queryset):
+        retried = queryset.filter(status='failed').update(
+            status='pending', attempts=0, next_attempt_at=None, locked_until=None,
+        )
+        self.message_user(request, f'{retried} notifications queued for another delivery.')
+    retry_notifications.short_description = "Retry selected failed notifications"
 
 
 # Fee Management
@@ -485,6 +587,25 @@ class PaymentAdmin(admin.ModelAdmin):
     date_hierarchy = 'paid_at'
 
 
+@admin.register(PaymentCallback)
+class PaymentCallbackAdmin(admin.ModelAdmin):
+    list_display = ('external_reference', 'account_reference', 'amount', 'payer_phone', 'status', 'payment', 'received_at')
+    list_filter = ('status', 'provider', 'received_at')
+    search_fields = ('external_reference', 'account_reference', 'payer_phone', 'payer_name')
+    readonly_fields = (
+        'provider', 'external_reference', 'account_reference', 'amount', 'payer_phone', 'payer_name',
+        'transaction_time', 'payload', 'payment', 'received_at', 'processed_at',
+    )
+    list_select_related = ('payment',)
+    date_hierarchy = 'received_at'
+    actions = ['match_again']
+    
+    def match_again(self, request, queryset):
+        requeued = queryset.filter(status='unmatched').update(status='pending', error_message='', processed_at=None)
+        self.message_user(request, f'{requeued} callbacks queued for matching.')
+    match_again.short_description = "Match selected callbacks again"
+
+
 # System Settings
 @admin.register(SystemSettings)
 class SystemSettingsAdmin(admin.ModelAdmin):
@@ -507,7 +628,9 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_filter = ('action', 'content_type', 'location_type', 'timestamp')
     search_fields = ('user__username', 'object_repr', 'ip_address', 'notes')
     readonly_fields = ('timestamp',)
+    list_select_related = ('user',)
     date_hierarchy = 'timestamp'
+    show_full_result_count = False  # the table is large; older months are moved out by archive_history
     
     def has_add_permission(self, request):
         return False  # Audit logs should not be manually created
@@ -519,6 +642,20 @@ class AuditLogAdmin(admin.ModelAdmin):
         return False  # Audit logs should not be deleted
 
 
+@admin.register(HistoryArchive)
+class HistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ('table', 'month', 'rows', 'first_timestamp', 'last_timestamp', 'path', 'created_at')
+    list_filter = ('table', 'month')
+    search_fields = ('path',)
+    readonly_fields = ('table', 'month', 'path', 'rows', 'first_timestamp', 'last_timestamp', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False  # Archives are written by archive_history
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(SecurityIncident)
 class SecurityIncidentAdmin(admin.ModelAdmin):
     list_display = ('title', 'incident_type', 'severity', 'affected_user', 'is_resolved', 'resolution_status', 'created_at')
@@ -553,37 +690,38 @@ class ReportAdmin(admin.ModelAdmin):
 # Custom Admin Actions
 def export_to_csv(modeladmin, request, queryset):
     """Export selected items to CSV"""
-    import csv
-    from django.http import HttpResponse
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{modeladmin.model._meta.verbose_name_plural}.csv"'
-    
-    writer = csv.writer(response)
-    # Write headers
-    field_names = [field.name for field in modeladmin.model._meta.fields]
-    writer.writerow(field_names)
-    
-    # Write data
-    for obj in queryset:
-        writer.writerow([getattr(obj, field) for field in field_names])
-    
-    return response
+    return streaming_export_response(queryset, modeladmin.model._meta.verbose_name_plural, 'csv')
 
 export_to_csv.short_description = "Export selected items to CSV"
 
 
+def export_to_csv_gzip(modeladmin, request, queryset):
+    """Export selected items to gzip-compressed CSV"""
+    return streaming_export_response(queryset, modeladmin.model._meta.verbose_name_plural, 'csv', compress=True)
+
+export_to_csv_gzip.short_description = "Export selected items to CSV (gzip)"
+
+
+def export_to_jsonl(modeladmin, request, queryset):
+    """Export selected items to JSON Lines"""
+    return streaming_export_response(queryset, modeladmin.model._meta.verbose_name_plural, 'jsonl')
+
+export_to_jsonl.short_description = "Export selected items to JSON Lines"
+
+
 # Add export action to all admin classes
 admin_classes = [
     CustomUserAdmin, CountyAdmin, SubCountyAdmin, IDApplicationAdmin,
     BirthCertificateAdmin, ChiefEligibilityLetterAdmin, NationalIDAdmin
 ]
 
+export_actions = [export_to_csv, export_to_csv_gzip, export_to_jsonl]
+
 for admin_class in admin_classes:
     if hasattr(admin_class, 'actions'):
-        admin_class.actions = list(admin_class.actions) + [export_to_csv]
+        admin_class.actions = list(admin_class.actions) + export_actions
     else:
-        admin_class.actions = [export_to_csv]
+        admin_class.actions = export_actions
 
 
 # Dashboard customization
@@ -653,6 +791,22 @@ def admin_index_context(request):
     return context
 
 
+ADMIN_STATS_CACHE_KEY = 'huduma:admin_index_stats'
+
+
+def admin_index_snapshot(request):
+    """Admin index statistics, recomputed at most once every HUDUMA_ADMIN_STATS_TTL seconds"""
+    context = cache.get(ADMIN_STATS_CACHE_KEY)
+    if context is None:
+        context = admin_index_context(request)
+        # Evaluate the querysets so the snapshot can be cached
+        context['recent_applications'] = list(context['recent_applications'])
+        context['county_stats'] = list(context['county_stats'])
+        context['stats_generated_at'] = timezone.now()
+        cache.set(ADMIN_STATS_CACHE_KEY, context, getattr(settings, 'HUDUMA_ADMIN_STATS_TTL', 300))
+    return context
+
+
 # Custom filters
 class StatusFilter(admin.SimpleListFilter):
     """Custom filter for application status grouping"""
@@ -732,6 +886,10 @@ class ApplicationStatusHistoryInline(admin.TabularInline):
     fields = ('timestamp', 'previous_status', 'new_status', 'changed_by', 'change_reason', 'notes')
     ordering = ('-timestamp',)
     
+    def get_queryset(self, request):
+        # Each row shows its user and, in its title, its application number
+        return super().get_queryset(request).select_related('application', 'changed_by')
+    
     def has_add_permission(self, request, obj=None):
         return False
 
@@ -778,17 +936,6 @@ class ImagePreviewWidget(AdminFileWidget):
         return mark_safe(output)
 
 
-class QRCodePreviewWidget(forms.widgets.Widget):
-    """Widget to show QR code preview"""
-    def render(self, name, value, attrs=None, renderer=None):
-        if value:
-            return format_html(
-                '<div><img src="{}" style="width: 100px; height: 100px;" /><br><small>QR Code</small></div>',
-                value.url
-            )
-        return '<div><small>No QR Code generated yet</small></div>'
-
-
 # Custom forms for specific models
 class BirthCertificateForm(forms.ModelForm):
     class Meta:
@@ -809,6 +956,15 @@ class IDApplicationForm(forms.ModelForm):
             'date_of_birth': forms.DateInput(attrs={'type': 'date'}),
         }
 
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        if self.instance.pk and 'status' in self.changed_data:
+            try:
+                check_transition(self.initial['status'], status)
+            except InvalidTransition as e:
+                raise forms.ValidationError(f'{e}.')
+        return status
+
 
 class BiometricDataForm(forms.ModelForm):
     class Meta:
@@ -824,8 +980,8 @@ class ChiefEligibilityLetterForm(forms.ModelForm):
     class Meta:
         model = ChiefEligibilityLetter
         fields = '__all__'
+        exclude = ('qr_code', 'qr_payload')  # shown through qr_code_preview
         widgets = {
-            'qr_code': QRCodePreviewWidget,
             'date_of_birth': forms.DateInput(attrs={'type': 'date'}),
             'expires_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
@@ -835,8 +991,8 @@ class WaitingCardForm(forms.ModelForm):
     class Meta:
         model = WaitingCard
         fields = '__all__'
+        exclude = ('qr_code', 'qr_payload')  # shown through qr_code_preview
         widgets = {
-            'qr_code': QRCodePreviewWidget,
             'expected_collection_date': forms.DateInput(attrs={'type': 'date'}),
         }
 
@@ -856,7 +1012,7 @@ class ManagementCommandAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         extra_context['management_commands'] = [
             {'name': 'Generate Daily Report', 'command': 'generate_daily_report'},
-            {'name': 'Send Pending Notifications', 'command': 'send_notifications'},
+            {'name': 'Send Pending Notifications', 'command': 'dispatch_notifications'},
             {'name': 'Update Application Status', 'command': 'update_statuses'},
             {'name': 'Backup Database', 'command': 'backup_db'},
             {'name': 'Generate ID Numbers', 'command': 'generate_id_numbers'},
@@ -882,33 +1038,21 @@ class BulkOperationsAdmin:
     
     def bulk_approve(self, request, queryset):
         """Bulk approve applications"""
-        count = 0
-        for obj in queryset:
-            if obj.status in ['chief_review', 'do_review']:
-                if obj.status == 'chief_review':
-                    obj.status = 'chief_approved'
-                elif obj.status == 'do_review':
-                    obj.status = 'do_approved'
-                obj.save()
-                count += 1
-        
-        self.message_user(request, f'{count} applications approved successfully.')
+        moved = bulk_transition(
+            queryset, {'chief_review': 'chief_approved', 'do_review': 'do_approved'},
+            request.user, reason='Bulk approved from admin'
+        )
+        self.message_user(request, f'{sum(moved.values())} applications approved successfully.')
     
     bulk_approve.short_description = "Bulk approve selected applications"
     
     def bulk_reject(self, request, queryset):
         """Bulk reject applications"""
-        count = 0
-        for obj in queryset:
-            if obj.status in ['chief_review', 'do_review']:
-                if obj.status == 'chief_review':
-                    obj.status = 'chief_rejected'
-                elif obj.status == 'do_review':
-                    obj.status = 'do_rejected'
-                obj.save()
-                count += 1
-        
-        self.message_user(request, f'{count} applications rejected successfully.')
+        moved = bulk_transition(
+            queryset, {'chief_review': 'chief_rejected', 'do_review': 'do_rejected'},
+            request.user, reason='Bulk rejected from admin'
+        )
+        self.message_user(request, f'{sum(moved.values())} applications rejected successfully.')
     
     bulk_reject.short_description = "Bulk reject selected applications"
     
@@ -937,11 +1081,12 @@ admin.site.index_title = "System Administration Dashboard"
 
 # Add custom CSS and JavaScript
 class KenyanIDAdminSite(admin.AdminSite):
-    def each_context(self, request):
-        context = super().each_context(request)
-        # Add dashboard statistics
-        context.update(admin_index_context(request))
-        return context
+    def index(self, request, extra_context=None):
+        # Dashboard statistics are only shown on the index, from a cached snapshot;
+        # each_context runs for every admin page and must stay cheap.
+        context = dict(admin_index_snapshot(request))
+        context.update(extra_context or {})
+        return super().index(request, extra_context=context)
 
 # Replace default admin site
 admin_site = KenyanIDAdminSite(name='kenyan_id_admin')
@@ -953,16 +1098,9 @@ for model, admin_class in admin.site._registry.items():
 
 # Additional utility functions for admin
 def generate_qr_code_for_admin(data, size=(200, 200)):
-    """Generate QR code for admin display"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    
-    return base64.b64encode(buffer.getvalue()).decode()
+    """Generate QR code for admin display (base64 PNG, from the shared QR cache)"""
+    _, image = qr_cache().get(data, 'png')
+    return base64.b64encode(image).decode()
 
 
 def format_processing_time(start_date, end_date=None):
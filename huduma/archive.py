@@ -0,0 +1,192 @@
+# archive.py
+"""
+Archival of old audit and status history rows to compressed files.
+
+``AuditLog`` and ``ApplicationStatusHistory`` only ever grow, and old rows
+are read rarely. ``archive_history(before)`` (``manage.py archive_history
+--before``) moves the rows older than ``before`` out of the database, one
+calendar month (of ``TIME_ZONE``) at a time, into gzip-compressed JSON-lines
+files under ``HUDUMA_ARCHIVE['directory']``::
+
+    <directory>/<table>/<YYYY-MM>/<part>.jsonl.gz
+
+A part holds at most ``file_rows`` rows. It is written and synced first, and
+then one transaction records it as a ``HistoryArchive`` row and deletes its
+rows from the table. The index is the source of truth: a part file without
+a ``HistoryArchive`` row was left by an interrupted run, and its rows are
+still in the table. ``ArchivedObject`` lists, per part, the objects (the
+application of a status change, the object of an audit event) with rows in
+it. ``archived_rows`` can then rebuild an application's archived history
+by opening only the files that hold it.
+"""
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ApplicationStatusHistory, ArchivedObject, AuditLog, CustomUser, HistoryArchive
+
+
+ARCHIVE_DEFAULTS = {
+    'directory': None,
+    'file_rows': 100_000,
+}
+
+# HistoryArchive.table -> model archived under that name
+ARCHIVED_MODELS = {
+    'audit_log': AuditLog,
+    'status_history': ApplicationStatusHistory,
+}
+
+
+def archive_config():
+    """Return the effective history archival configuration"""
+    config = dict(ARCHIVE_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_ARCHIVE', {}))
+    return config
+
+
+def archive_dir(config=None):
+    config = config or archive_config()
+    return Path(config['directory'] or Path(settings.BASE_DIR) / 'archive')
+
+
+def object_key(table, row):
+    """``(content_type, object_id)`` a row is indexed under"""
+    if table == 'status_history':
+        return 'IDApplication', str(row['application_id'])
+    return row['content_type'], row['object_id']
+
+
+def month_start(moment):
+    local = timezone.localtime(moment)
+    return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+
+def months(model, before):
+    """Start of every local month holding rows older than ``before``, oldest first"""
+    oldest = model.objects.filter(timestamp__lt=before).order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return
+    start = month_start(oldest)
+    while start < before:
+        yield start
+        start = next_month(start)
+
+
+def write_part(path, rows):
+    """Write ``rows`` to a new gzip JSON-lines file and sync it to disk"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as handle:
+            for row in rows:
+                handle.write(json.dumps(row, cls=DjangoJSONEncoder).encode() + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_part(table, start, rows, directory):
+    """Write one part and move its rows out of the table; returns the ``HistoryArchive``"""
+    model = ARCHIVED_MODELS[table]
+    relative = Path(table) / start.strftime('%Y-%m') / f'{uuid.uuid4().hex[:12]}.jsonl.gz'
+    write_part(directory / relative, rows)
+
+    counts = {}
+    for row in rows:
+        key = object_key(table, row)
+        counts[key] = counts.get(key, 0) + 1
+    with transaction.atomic():
+        archive = HistoryArchive.objects.create(
+            table=table, month=start.date(), path=str(relative), rows=len(rows),
+            first_timestamp=rows[0]['timestamp'], last_timestamp=rows[-1]['timestamp'],
+        )
+        ArchivedObject.objects.bulk_create([
+            ArchivedObject(archive=archive, content_type=content_type[:100], object_id=object_id[:100], rows=count)
+            for (content_type, object_id), count in counts.items()
+        ], batch_size=1000)
+        pks = [row['id'] for row in rows]
+        for offset in range(0, len(pks), 1000):
+            model.objects.filter(pk__in=pks[offset:offset + 1000]).delete()
+    return archive
+
+
+def archive_history(before, tables=None, dry_run=False, config=None):
+    """
+    Archive rows older than ``before`` (a datetime) from ``tables`` (default both).
+
+    Yields ``(table, month start, rows)`` per month; nothing is written with ``dry_run``.
+    """
+    config = config or archive_config()
+    directory = archive_dir(config)
+    for table in tables or ARCHIVED_MODELS:
+        model = ARCHIVED_MODELS[table]
+        fields = [field.attname for field in model._meta.concrete_fields]
+        for start in list(months(model, before)):
+            end = min(next_month(start), before)
+            queryset = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            if dry_run:
+                yield table, start, queryset.count()
+                continue
+            moved = 0
+            while True:
+                # Rows are taken oldest first, and archived rows leave the table, so every pass starts at the front
+                rows = list(queryset.order_by('timestamp', 'pk').values(*fields)[:config['file_rows']])
+                if not rows:
+                    break
+                archive_part(table, start, rows, directory)
+                moved += len(rows)
+            yield table, start, moved
+
+
+def read_part(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def archived_rows(table, content_type, object_id, directory=None):
+    """Unsaved model instances of the archived rows of one object, newest first"""
+    model = ARCHIVED_MODELS[table]
+    directory = Path(directory) if directory else archive_dir()
+    paths = (
+        HistoryArchive.objects.filter(table=table, entries__content_type=content_type, entries__object_id=str(object_id))
+        .values_list('path', flat=True).distinct()
+    )
+    instances = []
+    for path in paths:
+        for row in read_part(directory / path):
+            if object_key(table, row) == (content_type, str(object_id)):
+                row['timestamp'] = parse_datetime(row['timestamp'])
+                instances.append(model(**row))
+    instances.sort(key=lambda instance: (instance.timestamp, instance.pk), reverse=True)
+    return instances
+
+
+def archived_status_history(application):
+    """Archived ``ApplicationStatusHistory`` of an application, newest first, with ``changed_by`` loaded"""
+    history = archived_rows('status_history', 'IDApplication', application.pk)
+    users = CustomUser.objects.in_bulk({row.changed_by_id for row in history})
+    for row in history:
+        row.changed_by = users.get(row.changed_by_id)
+    return history
+
+
+def parse_before(value):
+    """Aware datetime of a ``--before`` date (local midnight) or date and time"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed = datetime.strptime(value, '%Y-%m-%d')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
@@ -0,0 +1,402 @@
+# audit.py
+"""
+Audit trail of changes to applications, birth certificates and national IDs.
+
+Every create, update and delete of an audited model is recorded as an
+``AuditLog`` row with the changed fields in ``changes`` as
+``{field: [old, new]}``; a creation records ``[None, new]`` for every field
+set and a deletion ``[old, None]``. Old values come from a copy of the
+instance's values taken when it is loaded (``post_init``), so a save costs
+no extra query.
+Bulk writes send no signals, so the bulk paths that change audited rows
+record their own ``update`` events with ``record_updates``, one per row:
+``workflow.bulk_transition`` and ``payments.mark_paid`` (callback matching
+and statement reconciliation). The rows ``seed_scale`` bulk-loads into a
+development database are left out on purpose.
+``AuditMiddleware`` puts the current request in a context variable, from
+which the user, address, user agent and session of the event are taken.
+Changes made outside a request (management commands, workers) are recorded
+without a user.
+
+Nothing is written on the request path: once the transaction commits, the
+event is appended to an in-process queue and a background thread writes
+the queue with one ``bulk_create`` every ``flush_interval`` seconds or
+``batch_size`` events, whichever comes first, and once more when the
+process exits. When a write fails or takes longer than ``slow_flush``
+seconds, or the queue grows past ``max_queue`` events, batches are appended
+to a JSON-lines spool instead for ``spool_for`` seconds;
+``manage.py replay_audit_spool`` loads the spool into the table::
+
+    HUDUMA_AUDIT = {
+        'enabled': True,
+        'background': True,    # False writes each event when its transaction commits
+        'flush_interval': 0.5, # seconds
+        'batch_size': 500,
+        'max_queue': 50_000,
+        'slow_flush': 1.0,     # seconds
+        'spool_for': 30,       # seconds
+        'spool_dir': None,     # defaults to BASE_DIR/audit_spool
+    }
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog, BirthCertificate, IDApplication, NationalID
+
+
+logger = logging.getLogger(__name__)
+
+AUDIT_DEFAULTS = {
+    'enabled': True,
+    'background': True,
+    'flush_interval': 0.5,
+    'batch_size': 500,
+    'max_queue': 50_000,
+    'slow_flush': 1.0,
+    'spool_for': 30,
+    'spool_dir': None,
+}
+
+AUDITED_MODELS = (IDApplication, BirthCertificate, NationalID)
+
+# user_type -> AuditLog.location_type of the office the user works from
+USER_LOCATIONS = {
+    'chief': 'chief_office',
+    'chief_staff': 'chief_office',
+    'do_officer': 'do_office',
+    'do_staff': 'do_office',
+    'huduma_staff': 'huduma_centre',
+}
+
+_request = ContextVar('huduma_audit_request', default=None)
+_tracked = {}
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def audit_config():
+    """Return the effective audit trail configuration"""
+    config = dict(AUDIT_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_AUDIT', {}))
+    return config
+
+
+def spool_dir(config=None):
+    config = config or audit_config()
+    return Path(config['spool_dir'] or Path(settings.BASE_DIR) / 'audit_spool')
+
+
+class AuditMiddleware:
+    """Makes the current request available to audit events recorded while it is handled"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+
+def request_details(request=None, user=None):
+    """``AuditLog`` field values describing who made the current request"""
+    request = request or _request.get()
+    if request is None:
+        return {'user_id': None, 'ip_address': None, 'user_agent': None, 'session_key': None, 'location_type': None}
+    user = user or getattr(request, 'user', None)
+    authenticated = user is not None and user.is_authenticated
+    session = getattr(request, 'session', None)
+    return {
+        'user_id': user.pk if authenticated else None,
+        'ip_address': request.META.get('REMOTE_ADDR') or None,
+        'user_agent': request.META.get('HTTP_USER_AGENT') or None,
+        'session_key': session.session_key if session is not None else None,
+        'location_type': USER_LOCATIONS.get(user.user_type, 'online') if authenticated else 'online',
+    }
+
+
+# Change tracking
+def tracked_fields(model):
+    """``(name, attname)`` of the fields whose changes are recorded; ``auto_now`` timestamps are left out"""
+    if model not in _tracked:
+        _tracked[model] = tuple(
+            (field.name, field.attname) for field in model._meta.concrete_fields
+            if not getattr(field, 'auto_now', False)
+        )
+    return _tracked[model]
+
+
+def snapshot(model, values):
+    """Tracked field values in an instance ``__dict__``; deferred fields are left out"""
+    return {name: values[attname] for name, attname in tracked_fields(model) if attname in values}
+
+
+def _json_value(value):
+    if isinstance(value, FieldFile):
+        return value.name or None
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    try:
+        return DjangoJSONEncoder().default(value)
+    except TypeError:
+        return str(value)
+
+
+def _same(old, new):
+    if isinstance(old, FieldFile) or isinstance(new, FieldFile):
+        return (getattr(old, 'name', old) or None) == (getattr(new, 'name', new) or None)
+    return old == new
+
+
+def diff(old, new):
+    """``{field: [old, new]}`` of the fields that differ between two snapshots"""
+    return {
+        name: [_json_value(old.get(name)), _json_value(value)]
+        for name, value in new.items()
+        if not _same(old.get(name), value)
+    }
+
+
+def remember(instance):
+    """Keep the loaded values the next save of ``instance`` is compared with (a plain copy, cheap on load)"""
+    values = instance.__dict__.copy()
+    values.pop('_audit_values', None)
+    instance._audit_values = values
+
+
+def audit_save(instance, created, update_fields=None):
+    """Record the changes a save made to ``instance``"""
+    model = type(instance)
+    current = snapshot(model, instance.__dict__)
+    if update_fields:
+        current = {name: value for name, value in current.items() if name in update_fields}
+    previous = {} if created else snapshot(model, getattr(instance, '_audit_values', {}))
+    changes = diff(previous, current)
+    if update_fields and hasattr(instance, '_audit_values'):
+        # fields changed in memory but not saved still count as changes next time
+        attnames = {name: attname for name, attname in tracked_fields(model)}
+        instance._audit_values.update({attnames[name]: value for name, value in current.items()})
+    else:
+        remember(instance)
+    if changes or created:
+        record('create' if created else 'update', instance, changes)
+
+
+def audit_delete(instance):
+    """Record the deletion of ``instance`` with the values it had"""
+    changes = {
+        name: [_json_value(value), None]
+        for name, value in snapshot(type(instance), instance.__dict__).items() if value is not None
+    }
+    record('delete', instance, changes)
+
+
+# Writing
+def build_event(action, instance=None, changes=None, notes=None, request=None, user=None):
+    """``AuditLog`` field values of an event, with the request details taken now"""
+    event = request_details(request, user)
+    event.update({
+        'action': action,
+        'content_type': type(instance).__name__ if instance is not None else '',
+        'object_id': str(instance.pk) if instance is not None else '',
+        'object_repr': str(instance)[:200] if instance is not None else '',
+        'changes': changes or None,
+        'notes': notes,
+        'timestamp': timezone.now(),
+    })
+    return event
+
+
+def record_updates(changes, notes=None, request=None, user=None):
+    """
+    Queue one ``update`` event per instance of ``changes`` (``{instance: {field: [old, new]}}``).
+
+    For ``update()`` and ``bulk_update``, which send no signals; the instances
+    only need their pk and the fields their ``__str__`` shows.
+    """
+    config = audit_config()
+    if not config['enabled'] or not changes:
+        return
+    events = []
+    for instance, fields in changes.items():
+        fields = {name: [_json_value(old), _json_value(new)] for name, (old, new) in fields.items()}
+        events.append(build_event('update', instance, fields, notes, request, user))
+    if config['background']:
+        transaction.on_commit(lambda: audit_writer().put_many(events))
+    else:
+        transaction.on_commit(lambda: AuditLog.objects.bulk_create([AuditLog(**event) for event in events]))
+
+
+def record(action, instance=None, changes=None, notes=None, request=None, user=None):
+    """Queue an audit event once the current transaction commits (or at once, outside one)"""
+    config = audit_config()
+    if not config['enabled']:
+        return
+    event = build_event(action, instance, changes, notes, request, user)
+    if config['background']:
+        transaction.on_commit(lambda: audit_writer().put(event))
+    else:
+        transaction.on_commit(lambda: AuditLog.objects.create(**event))
+
+
+class AuditWriter:
+    """Queue of audit events written to the database in batches by a background thread"""
+
+    def __init__(self, config):
+        self.config = config
+        self.queue = deque()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.spool_until = 0.0
+        self.written = self.spooled = 0
+
+    def put(self, event):
+        self.put_many([event])
+
+    def put_many(self, events):
+        self.queue.extend(events)
+        if self.thread is None:
+            self.start()
+        if len(self.queue) >= self.config['batch_size']:
+            self.wake.set()
+
+    def start(self):
+        with _writer_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='audit-writer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stopping:
+                self.wake.wait(self.config['flush_interval'])
+                self.wake.clear()
+                self.flush()
+            self.flush()
+        finally:
+            connection.close()
+
+    def stop(self, timeout=10):
+        """Write what is queued and stop the thread"""
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def flush(self):
+        """Write every queued event; called from the writer thread"""
+        while self.queue:
+            batch = []
+            while self.queue and len(batch) < self.config['batch_size']:
+                batch.append(self.queue.popleft())
+            self.write(batch)
+
+    def write(self, batch):
+        if time.monotonic() < self.spool_until or len(self.queue) > self.config['max_queue']:
+            self.spool(batch)
+            return
+        started = time.monotonic()
+        try:
+            close_old_connections()
+            AuditLog.objects.bulk_create([AuditLog(**event) for event in batch])
+        except DatabaseError:
+            logger.exception("Could not write %s audit events, spooling for %ss", len(batch), self.config['spool_for'])
+            self.spool_until = time.monotonic() + self.config['spool_for']
+            self.spool(batch)
+            return
+        self.written += len(batch)
+        elapsed = time.monotonic() - started
+        if elapsed > self.config['slow_flush']:
+            logger.warning("Writing %s audit events took %.1fs, spooling for %ss",
+                           len(batch), elapsed, self.config['spool_for'])
+            self.spool_until = time.monotonic() + self.config['spool_for']
+
+    def spool(self, batch):
+        directory = spool_dir(self.config)
+        directory.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(json.dumps(event, cls=DjangoJSONEncoder) + '\n' for event in batch)
+        with open(directory / f'audit-{os.getpid()}.jsonl', 'a', encoding='utf-8') as handle:
+            handle.write(lines)
+        self.spooled += len(batch)
+
+
+def audit_writer():
+    """The process-wide ``AuditWriter``"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditWriter(audit_config())
+    return _writer
+
+
+def shutdown():
+    """Write the queued events and stop the writer thread; runs at interpreter exit"""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def _forget_writer():
+    # A forked worker has the parent's queue but not its thread
+    global _writer
+    _writer = None
+
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_forget_writer)
+
+
+def replay_spool(directory=None, batch_size=1000):
+    """
+    Load spooled events into ``AuditLog`` and delete the spool files.
+
+    Yields ``(file name, events loaded)`` per file. A file is renamed to
+    ``.replaying`` before it is read, so a writer that spools meanwhile starts a
+    new one; a replay that is interrupted leaves that file behind to be checked
+    and renamed back by hand, as part of it may already be loaded.
+    """
+    directory = Path(directory) if directory else spool_dir()
+    if not directory.is_dir():
+        return
+    for path in sorted(directory.glob('audit-*.jsonl')):
+        claimed = path.with_suffix('.replaying')
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            continue  # another replay took it
+        loaded = 0
+        with open(claimed, encoding='utf-8') as handle:
+            batch = []
+            for line in handle:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                event['timestamp'] = parse_datetime(event['timestamp'])
+                batch.append(AuditLog(**event))
+                if len(batch) >= batch_size:
+                    AuditLog.objects.bulk_create(batch)
+                    loaded += len(batch)
+                    batch = []
+            AuditLog.objects.bulk_create(batch)
+            loaded += len(batch)
+        claimed.unlink()
+        yield path.name, loaded
@@ -0,0 +1,245 @@
+# dispatch.py
+"""
+Delivery of queued notifications.
+
+Status changes only insert ``pending`` ``Notification`` rows, in the same
+transaction as the change itself (see ``notifications.py``), so no request
+waits on an SMS gateway or mail server. ``manage.py dispatch_notifications``
+sends them: each batch is claimed with ``SELECT ... FOR UPDATE SKIP LOCKED``
+and leased to the worker for ``lease`` seconds, so several workers never
+send the same row and rows of a crashed worker are picked up again once the
+lease runs out. The batch is handed to the channel backends on a pool of
+``concurrency`` threads and the results are written back with one ``UPDATE``
+for the sent rows and one ``bulk_update`` for the failures.
+
+A failed message is retried after ``retry_delay`` seconds, doubling with
+every attempt up to ``max_retry_delay``, and marked ``failed`` after
+``max_attempts`` or when the backend raises a permanent ``DeliveryError``.
+
+Backends are configured per channel, as a dotted path or as a dict with a
+``class`` and its options::
+
+    HUDUMA_NOTIFICATIONS = {
+        'backends': {
+            'sms': {'class': 'huduma.dispatch.FileBackend', 'path': '/var/tmp/sms.jsonl'},
+            'email': 'huduma.dispatch.EmailBackend',   # Django's EMAIL_BACKEND
+            'system': 'huduma.dispatch.InAppBackend',  # shown in the site, nothing to send
+        },
+        'batch_size': 500,
+        'concurrency': 8,
+    }
+"""
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification
+
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_DEFAULTS = {
+    'backends': {
+        'sms': 'huduma.dispatch.ConsoleBackend',
+        'email': 'huduma.dispatch.ConsoleBackend',
+        'system': 'huduma.dispatch.InAppBackend',
+    },
+    'batch_size': 500,
+    'concurrency': 8,
+    'lease': 300,
+    'max_attempts': 5,
+    'retry_delay': 60,
+    'max_retry_delay': 6 * 60 * 60,
+}
+
+_backends = {}
+
+
+def dispatch_config():
+    """Return the effective notification delivery configuration"""
+    config = dict(DISPATCH_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_NOTIFICATIONS', {}))
+    return config
+
+
+class DeliveryError(Exception):
+    """Raised by a backend that could not deliver a message; ``permanent`` errors are not retried"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+# Backends
+class BaseBackend:
+    """Sends one notification per ``send()`` call; must be safe to call from several threads"""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, notification):
+        raise NotImplementedError
+
+
+class ConsoleBackend(BaseBackend):
+    """Writes messages to stdout; the development stand-in for the SMS gateway and mail server"""
+    _lock = threading.Lock()
+
+    def send(self, notification):
+        with self._lock:
+            sys.stdout.write(
+                f"[{notification.notification_type}] {notification.recipient_contact}: {notification.message}\n"
+            )
+            sys.stdout.flush()
+
+
+class FileBackend(BaseBackend):
+    """Appends every message as a JSON line to ``path``, for tests and load runs"""
+    _lock = threading.Lock()
+
+    def send(self, notification):
+        line = json.dumps({
+            'id': notification.pk,
+            'channel': notification.notification_type,
+            'to': notification.recipient_contact,
+            'subject': notification.subject,
+            'message': notification.message,
+            'sent_at': timezone.now().isoformat(),
+        })
+        with self._lock, open(self.options['path'], 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+
+
+class EmailBackend(BaseBackend):
+    """Sends through Django's mail framework, so ``EMAIL_BACKEND`` picks the transport"""
+
+    def send(self, notification):
+        send_mail(
+            notification.subject or '', notification.message, self.options.get('from_email'),
+            [notification.recipient_contact],
+        )
+
+
+class InAppBackend(BaseBackend):
+    """System notifications are read in the site; there is nothing to send"""
+
+    def send(self, notification):
+        pass
+
+
+def get_backend(channel):
+    """The process-wide backend of ``channel``"""
+    if channel not in _backends:
+        spec = dispatch_config()['backends'].get(channel)
+        if spec is None:
+            raise DeliveryError(f"No backend configured for {channel!r} notifications", permanent=True)
+        options = dict(spec) if isinstance(spec, dict) else {'class': spec}
+        _backends[channel] = import_string(options.pop('class'))(**options)
+    return _backends[channel]
+
+
+def reset_backends():
+    _backends.clear()
+
+
+# Queue
+def due():
+    """Pending notifications that may be sent now: not leased to a worker and not waiting to retry"""
+    now = timezone.now()
+    return Notification.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        status='pending',
+    )
+
+
+def claim(batch_size, lease):
+    """Lease up to ``batch_size`` due notifications to this worker and return them"""
+    with transaction.atomic():
+        ids = list(
+            due().select_for_update(skip_locked=True).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        Notification.objects.filter(pk__in=ids).update(locked_until=timezone.now() + timedelta(seconds=lease))
+    return list(Notification.objects.filter(pk__in=ids).order_by('pk'))
+
+
+def retry_delay(attempts, config):
+    return timedelta(seconds=min(config['retry_delay'] * 2 ** (attempts - 1), config['max_retry_delay']))
+
+
+def deliver(notification):
+    """Send one notification; returns the exception it failed with, or None"""
+    try:
+        get_backend(notification.notification_type).send(notification)
+    except Exception as exc:
+        return exc
+    return None
+
+
+def record(results, config):
+    """Write the outcome of a batch back; returns ``(sent, failed for good)``"""
+    now = timezone.now()
+    sent = [notification.pk for notification, error in results if error is None]
+    Notification.objects.filter(pk__in=sent).update(
+        status='sent', sent_at=now, attempts=F('attempts') + 1,
+        locked_until=None, next_attempt_at=None, error_message=None,
+    )
+
+    retried = []
+    failed = 0
+    for notification, error in results:
+        if error is None:
+            continue
+        notification.attempts += 1
+        notification.error_message = f"{type(error).__name__}: {error}"
+        notification.locked_until = None
+        if getattr(error, 'permanent', False) or notification.attempts >= config['max_attempts']:
+            notification.status = 'failed'
+            notification.next_attempt_at = None
+            failed += 1
+        else:
+            notification.next_attempt_at = now + retry_delay(notification.attempts, config)
+        retried.append(notification)
+        logger.warning("Notification %s attempt %s failed: %s", notification.pk, notification.attempts, error)
+    Notification.objects.bulk_update(
+        retried, ['attempts', 'error_message', 'locked_until', 'status', 'next_attempt_at'],
+    )
+    return len(sent), failed
+
+
+def dispatch_pending(batch_size=None, concurrency=None, limit=None):
+    """
+    Send due notifications until none are left (or ``limit`` were tried).
+
+    Yields ``(sent, failed, retrying)`` running totals after each batch.
+    """
+    config = dispatch_config()
+    batch_size = batch_size or config['batch_size']
+    pool = ThreadPoolExecutor(max_workers=concurrency or config['concurrency'], thread_name_prefix='notify')
+    try:
+        sent = failed = retrying = tried = 0
+        while limit is None or tried < limit:
+            notifications = claim(batch_size if limit is None else min(batch_size, limit - tried), config['lease'])
+            if not notifications:
+                break
+            results = list(zip(notifications, pool.map(deliver, notifications)))
+            batch_sent, batch_failed = record(results, config)
+            sent += batch_sent
+            failed += batch_failed
+            retrying += len(results) - batch_sent - batch_failed
+            tried += len(results)
+            yield sent, failed, retrying
+    finally:
+        pool.shutdown()
@@ -1,9 +1,25 @@
 # forms.py
 from django import forms
+from .gazetteer import address_errors
 from .models import BirthCertificate
 
 
-class BirthCertificateForm(forms.ModelForm):
+class AddressChainMixin:
+    """Reject addresses whose levels do not nest, checked against the in-memory gazetteer"""
+    addresses = ()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for address in self.addresses:
+            for field, message in address_errors(cleaned_data, address):
+                if field in self.fields and field not in self.errors:
+                    self.add_error(field, message)
+        return cleaned_data
+
+
+class BirthCertificateForm(AddressChainMixin, forms.ModelForm):
+    addresses = ('birth',)
+
     class Meta:
         model = BirthCertificate
         fields = [
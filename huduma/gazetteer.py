@@ -0,0 +1,205 @@
+# gazetteer.py
+"""
+In-memory administrative gazetteer.
+
+The County → SubCounty → Division → Location → SubLocation → Village tree is
+loaded into each process once (six queries) and kept until one of those
+models is saved or deleted. The signal handlers in ``signals.py`` then bump
+the ``gazetteer`` generation counter (see ``generations.py``) with the
+change, and every process reloads on its next lookup after it notices.
+
+``api/gazetteer/`` serves the whole tree or one subtree as a pre-rendered,
+pre-compressed JSON bundle tagged with the tree's version hash, and the old
+per-level dropdown endpoints answer from the same tree.
+
+``address_errors`` checks that the six ids of an address nest (the village is
+in the sub-location, which is in the location, ...) with dictionary lookups on
+the same tree, so forms and ``manage.py check_address_hierarchy`` validate
+addresses without querying the location tables.
+"""
+import gzip
+import hashlib
+import json
+import threading
+
+from django.apps import apps
+
+from .generations import bump_generation, current_generation
+
+
+# level -> (model, parent foreign key column)
+LEVELS = {
+    'county': ('huduma.County', None),
+    'sub_county': ('huduma.SubCounty', 'county_id'),
+    'division': ('huduma.Division', 'sub_county_id'),
+    'location': ('huduma.Location', 'division_id'),
+    'sub_location': ('huduma.SubLocation', 'location_id'),
+    'village': ('huduma.Village', 'sub_location_id'),
+}
+
+LEVEL_NAMES = list(LEVELS)
+
+# address -> foreign keys from county down to village
+ADDRESS_FIELDS = {
+    'birth': (
+        'county_of_birth', 'sub_county_of_birth', 'division_of_birth',
+        'location_of_birth', 'sub_location_of_birth', 'village_of_birth',
+    ),
+    'current': (
+        'current_county', 'current_sub_county', 'current_division',
+        'current_location', 'current_sub_location', 'current_village',
+    ),
+}
+
+GENERATION = 'gazetteer'
+MAX_BUNDLES = 512  # rendered bundles kept per process
+
+
+def child_level(level):
+    """Level below ``level`` (None for the top of the tree), or None for villages"""
+    index = LEVEL_NAMES.index(level) + 1 if level else 0
+    return LEVEL_NAMES[index] if index < len(LEVEL_NAMES) else None
+
+
+class Gazetteer:
+    """Snapshot of the administrative tree"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.names = {}  # (level, id) -> name
+        self.parents = {}  # (level, id) -> parent id
+        self.children = {(None, None): []}  # (level, id) -> child ids ordered by name
+        self._bundles = {}
+
+        digest = hashlib.sha1()
+        parent_level = None
+        for level, (label, parent) in LEVELS.items():
+            model = apps.get_model(label)
+            columns = ('pk', 'name', parent) if parent else ('pk', 'name')
+            for row in model.objects.order_by('name', 'pk').values_list(*columns):
+                pk, name = row[0], row[1]
+                parent_key = (parent_level, row[2]) if parent else (None, None)
+                self.names[level, pk] = name
+                self.parents[level, pk] = parent_key[1]
+                self.children.setdefault(parent_key, []).append(pk)
+                digest.update(f'{level}\0{pk}\0{name}\0{parent_key[1]}\n'.encode())
+            parent_level = level
+        self.version = digest.hexdigest()[:16]
+
+    def __contains__(self, node):
+        return node in self.names
+
+    def children_of(self, level, pk):
+        """``[{'id', 'name'}]`` of the children of a node, ordered by name; [] for unknown nodes"""
+        below = child_level(level)
+        return [{'id': child, 'name': self.names[below, child]} for child in self.children.get((level, pk), ())]
+
+    def ancestor(self, level, pk, target):
+        """Id of the ``target``-level ancestor of a node"""
+        while level != target:
+            pk = self.parents[level, pk]
+            level = LEVEL_NAMES[LEVEL_NAMES.index(level) - 1]
+        return pk
+
+    def chain_errors(self, ids):
+        """
+        Return ``[(level index, message)]`` for an address given as ids from county
+        down to village. Missing levels (None) are skipped; the levels given must
+        exist and each must lie inside the one above it.
+        """
+        errors = []
+        given = []
+        for index, (level, pk) in enumerate(zip(LEVEL_NAMES, ids)):
+            if pk is None:
+                continue
+            if (level, pk) not in self.names:
+                errors.append((index, f"Unknown {level.replace('_', ' ')} {pk!r}"))
+            else:
+                given.append((index, level, pk))
+        for (_, upper, upper_pk), (index, lower, lower_pk) in zip(given, given[1:]):
+            if self.ancestor(lower, lower_pk, upper) != upper_pk:
+                errors.append((index, (
+                    f"{lower.replace('_', ' ').capitalize()} {self.names[lower, lower_pk]!r} is not in "
+                    f"{upper.replace('_', ' ')} {self.names[upper, upper_pk]!r}"
+                )))
+        return errors
+
+    def node(self, level, pk):
+        """Nested ``{'id', 'name', 'children'}`` subtree rooted at a node (villages have no children)"""
+        node = {'id': pk, 'name': self.names[level, pk]}
+        below = child_level(level)
+        if below:
+            node['children'] = [self.node(below, child) for child in self.children.get((level, pk), ())]
+        return node
+
+    def tree(self):
+        return [self.node('county', pk) for pk in self.children[None, None]]
+
+    def bundle(self, level=None, pk=None):
+        """Return ``(etag, json bytes, gzip bytes)`` for the whole tree or a subtree; KeyError if unknown"""
+        key = (level, pk)
+        if key not in self._bundles:
+            if level is None:
+                payload = {'version': self.version, 'tree': self.tree()}
+            else:
+                if key not in self:
+                    raise KeyError(key)
+                payload = {'version': self.version, 'level': level, 'tree': self.node(level, pk)}
+            body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            etag = f'W/"{self.version}-{level or "all"}-{pk or 0}"'
+            if len(self._bundles) >= MAX_BUNDLES:
+                self._bundles.clear()
+            self._bundles[key] = (etag, body, gzip.compress(body, 6, mtime=0))
+        return self._bundles[key]
+
+
+def address_ids(data, address):
+    """Ids of ``address`` from a POST dict, form cleaned_data or model instance"""
+    ids = []
+    for field in ADDRESS_FIELDS[address]:
+        if isinstance(data, dict) or hasattr(data, 'getlist'):
+            value = data.get(field)
+        else:
+            value = getattr(data, f'{field}_id')
+        if value in (None, ''):
+            ids.append(None)
+        elif hasattr(value, 'pk'):
+            ids.append(value.pk)
+        else:
+            try:
+                ids.append(int(value))
+            except (TypeError, ValueError):
+                ids.append(value)
+    return ids
+
+
+def address_errors(data, address):
+    """Return ``[(field, message)]`` for the parts of ``address`` in ``data`` that do not nest"""
+    fields = ADDRESS_FIELDS[address]
+    return [(fields[index], message) for index, message in gazetteer().chain_errors(address_ids(data, address))]
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def gazetteer_generation():
+    return current_generation(GENERATION)
+
+
+def gazetteer():
+    """Return the current gazetteer, reloading it if the tree changed since it was built"""
+    global _current
+    generation = gazetteer_generation()
+    current = _current
+    if current is None or current.generation != generation:
+        with _lock:
+            if _current is None or _current.generation != generation:
+                _current = Gazetteer(generation)
+            current = _current
+    return current
+
+
+def invalidate_gazetteer():
+    """Make every process reload the tree once the current transaction commits"""
+    bump_generation(GENERATION)
@@ -0,0 +1,68 @@
+# generations.py
+"""
+Generation counters for per-process caches.
+
+The gazetteer, the compiled notification templates and the cached
+time-series buckets are kept in each process and rebuilt when the data
+behind them changes. Each has a named ``CacheGeneration`` counter: a change
+bumps it in the same transaction, and a process rebuilds its copy when the
+counter differs from the one the copy was built at.
+
+The counters live in the database rather than in ``django.core.cache``:
+without a ``CACHES`` setting Django uses a ``LocMemCache`` private to each
+process, so a counter bumped there never reaches the other workers. Reading a
+counter costs one query, so a process reuses the value it read for
+``check_interval`` seconds. Other processes see a change within that time,
+the process that made it as soon as it commits::
+
+    HUDUMA_GENERATIONS = {
+        'check_interval': 5,  # seconds
+    }
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+GENERATION_DEFAULTS = {
+    'check_interval': 5,
+}
+
+# name -> (value, time.monotonic() it was read at)
+_seen = {}
+
+
+def generation_config():
+    """Return the effective generation counter configuration"""
+    config = dict(GENERATION_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_GENERATIONS', {}))
+    return config
+
+
+def current_generation(name):
+    """Value of the counter ``name``, read from the database at most every ``check_interval`` seconds"""
+    from .models import CacheGeneration
+
+    now = time.monotonic()
+    seen = _seen.get(name)
+    if seen is not None and now - seen[1] < generation_config()['check_interval']:
+        return seen[0]
+    value = CacheGeneration.objects.filter(name=name).values_list('value', flat=True).first() or 1
+    _seen[name] = (value, now)
+    return value
+
+
+def bump_generation(name):
+    """Move the counter ``name`` forward as part of the current transaction"""
+    from .models import CacheGeneration
+
+    counter = CacheGeneration.objects.filter(name=name)
+    if not counter.update(value=F('value') + 1, updated_at=timezone.now()):
+        # First bump: create the counter (ON CONFLICT covers a concurrent first bump) and retry
+        CacheGeneration.objects.bulk_create([CacheGeneration(name=name)], ignore_conflicts=True)
+        counter.update(value=F('value') + 1, updated_at=timezone.now())
+    # This process does not wait for check_interval to see its own change
+    transaction.on_commit(lambda: _seen.pop(name, None))
@@ -0,0 +1,242 @@
+# hierarchy.py
+"""
+Bulk import of the administrative hierarchy.
+
+``data/kenya_admin_hierarchy.json`` lists the 47 counties with their official
+codes and their constituencies as sub-counties. Below a sub-county the file
+may spell out divisions, locations, sub-locations and villages::
+
+    {"name": "Westlands", "divisions": [
+        {"name": "Parklands", "locations": [
+            {"name": "Highridge", "sub_locations": [
+                {"name": "Highridge", "villages": ["Ojijo", "Mpaka"]}]}]}]}
+
+Sub-counties without explicit divisions get placeholder levels sized by the
+file's ``placeholders`` counts (``Westlands Division 1``, ``Westlands
+Location 1.2``, ...), the stand-ins ``seed_counties`` has always used.
+
+``import_hierarchy`` works a level at a time: one query reads the rows that
+already exist under the level's parents, rows that are missing are inserted
+with ``bulk_create`` and their paths set with one ``UPDATE``. Counties
+match on code (then name), sub-counties and lower levels on their parent and
+name, so importing the same file again changes nothing. ``bulk_create``
+sends no signals, so the gazetteer is invalidated once at the end.
+"""
+import json
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+
+from .gazetteer import invalidate_gazetteer
+from .models import County, Division, Location, SubCounty, SubLocation, Village, refresh_location_paths
+
+
+DEFAULT_FIXTURE = Path(__file__).resolve().parent / 'data' / 'kenya_admin_hierarchy.json'
+
+# Levels below the sub-county: (level, model, key of the children in the file, placeholder label)
+LOWER_LEVELS = (
+    ('division', Division, 'divisions', 'Division'),
+    ('location', Location, 'locations', 'Location'),
+    ('sub_location', SubLocation, 'sub_locations', 'Sub-Location'),
+    ('village', Village, 'villages', 'Village'),
+)
+
+
+def load_fixture(path=None):
+    """Parsed hierarchy file (the bundled Kenyan hierarchy by default)"""
+    with open(path or DEFAULT_FIXTURE, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def _entry(entry):
+    """``(name, entry dict)`` of a node given as a plain name or as a dict"""
+    if isinstance(entry, str):
+        return entry, {}
+    return entry['name'], entry
+
+
+def flatten(data, counties=None, placeholders=None):
+    """
+    Nodes of the file, level by level: ``{level: [(key, parent key, name, code)]}``.
+
+    A node's key is its parent's key plus its own name, so it names the node
+    before it has an id. ``counties`` restricts the import to counties given by
+    name or code; ``placeholders`` overrides the file's placeholder counts.
+    """
+    wanted = {str(county).casefold() for county in counties} if counties else None
+    placeholders = {**data.get('placeholders', {}), **(placeholders or {})}
+    nodes = {'county': [], 'sub_county': [], **{level: [] for level, *_ in LOWER_LEVELS}}
+
+    def walk(depth, parent_key, entries, base, numbers):
+        level, _, _, label = LOWER_LEVELS[depth]
+        if entries is None:
+            entries = [
+                f"{base} {label} {'.'.join(map(str, (*numbers, n)))}"
+                for n in range(1, placeholders.get(level, 0) + 1)
+            ]
+            generated = True
+        else:
+            generated = False
+        for n, entry in enumerate(entries, start=1):
+            name, entry = _entry(entry)
+            key = (*parent_key, name)
+            nodes[level].append((key, parent_key, name, None))
+            if depth + 1 < len(LOWER_LEVELS):
+                below = None if generated else entry.get(LOWER_LEVELS[depth + 1][2], [])
+                walk(depth + 1, key, below, base, (*numbers, n))
+
+    for county in data['counties']:
+        if wanted is not None and not {county['name'].casefold(), county['code'].casefold()} & wanted:
+            continue
+        county_key = (county['name'],)
+        nodes['county'].append((county_key, None, county['name'], county['code']))
+        for sub_county in county.get('sub_counties', []):
+            name, entry = _entry(sub_county)
+            key = (*county_key, name)
+            nodes['sub_county'].append((key, county_key, name, entry.get('code')))
+            walk(0, key, entry.get('divisions'), name, ())
+    return nodes
+
+
+def _existing(model, column, parent_pks, fields, batch_size):
+    """Rows of ``model`` under ``parent_pks``, read in chunks to stay under the bound-parameter limit"""
+    parent_pks = sorted(parent_pks)
+    for start in range(0, len(parent_pks), batch_size):
+        chunk = parent_pks[start:start + batch_size]
+        yield from model._default_manager.filter(**{f'{column}__in': chunk}).values_list(*fields)
+
+
+def _import_counties(nodes):
+    counties = list(County.objects.all())
+    by_code = {county.code: county for county in counties}
+    by_name = {county.name.casefold(): county for county in counties}
+    found, new, changed = {}, [], []
+    for key, _, name, code in nodes:
+        county = by_code.get(code) or by_name.get(name.casefold())
+        if county is None:
+            county = County(name=name, code=code)
+            new.append(county)
+        elif (county.name, county.code) != (name, code):
+            county.name, county.code = name, code
+            changed.append(county)
+        found[key] = county
+    County.objects.bulk_create(new)
+    County.objects.bulk_update(changed, ['name', 'code'])
+    # node key -> (pk, county id, path, full name) of every imported county
+    return {key: (county.pk, county.pk, str(county.pk), county.name) for key, county in found.items()}, new, changed
+
+
+def _import_sub_counties(nodes, counties, batch_size):
+    county_codes = dict(County.objects.filter(pk__in=[pk for pk, *_ in counties.values()]).values_list('pk', 'code'))
+    by_name, used_codes = {}, {}
+    for sub_county in _existing(SubCounty, 'county_id', county_codes, ('pk', 'county_id', 'name', 'code'), batch_size):
+        _, county_id, name, code = sub_county
+        by_name[county_id, name.casefold()] = sub_county
+        used_codes.setdefault(county_id, set()).add(code)
+
+    found, new, changed = {}, [], []
+    numbers = {}
+    for key, parent_key, name, code in nodes:
+        county_id, _, _, county_name = counties[parent_key]
+        numbers[county_id] = numbers.get(county_id, 0) + 1
+        row = by_name.get((county_id, name.casefold()))
+        if row is not None:
+            if row[2] != name:
+                changed.append(SubCounty(pk=row[0], name=name))
+            found[key] = (row[0], county_id, f"{county_id}/{row[0]}", f"{name}, {county_name}")
+            continue
+        # Codes follow seed_counties (county code + position); skip those already taken
+        used = used_codes.setdefault(county_id, set())
+        number = numbers[county_id]
+        code = code or f"{county_codes[county_id]}{number:02d}"
+        while code in used:
+            number += 1
+            code = f"{county_codes[county_id]}{number:02d}"
+        used.add(code)
+        new.append((key, SubCounty(county_id=county_id, name=name, code=code), county_name))
+
+    SubCounty.objects.bulk_create([sub_county for _, sub_county, _ in new], batch_size=batch_size)
+    SubCounty.objects.bulk_update(changed, ['name'], batch_size=batch_size)
+    for key, sub_county, county_name in new:
+        found[key] = (
+            sub_county.pk, sub_county.county_id, f"{sub_county.county_id}/{sub_county.pk}",
+            f"{sub_county.name}, {county_name}",
+        )
+    return found, new, changed
+
+
+def _path_expression(model):
+    """Path of a fresh row in SQL: its parent's path and its own id, so one UPDATE sets a whole level"""
+    own_id = Cast('pk', output_field=CharField())
+    if model is Division:
+        return Concat(
+            Cast('county_id', output_field=CharField()), Value('/'),
+            Cast('sub_county_id', output_field=CharField()), Value('/'), own_id,
+        )
+    parent = model._meta.get_field(model.parent_field).related_model
+    parent_path = Subquery(parent._default_manager.filter(pk=OuterRef(model.parent_field)).values('path')[:1])
+    return Concat(parent_path, Value('/'), own_id, output_field=CharField())
+
+
+def _import_level(model, nodes, parents, batch_size):
+    column = f'{model.parent_field}_id'
+    fields = ('pk', column, 'name', 'county_id', 'path', 'full_name')
+    parent_pks = {parents[parent_key][0] for _, parent_key, _, _ in nodes}
+    existing = {(row[1], row[2].casefold()): row for row in _existing(model, column, parent_pks, fields, batch_size)}
+
+    found, new = {}, []
+    for key, parent_key, name, _ in nodes:
+        parent_pk, county_id, parent_path, parent_full_name = parents[parent_key]
+        row = existing.get((parent_pk, name.casefold()))
+        if row is not None:
+            found[key] = row[0], row[3], row[4], row[5]
+            continue
+        node = model(name=name, county_id=county_id, full_name=f"{name}, {parent_full_name}", **{column: parent_pk})
+        new.append((key, node, parent_path))
+
+    model._default_manager.bulk_create([node for _, node, _ in new], batch_size=batch_size)
+    if new:
+        # The path ends with the row's own id, known only after the insert
+        pks = [node.pk for _, node, _ in new]
+        model._default_manager.filter(pk__range=(min(pks), max(pks)), path='').update(path=_path_expression(model))
+    for key, node, parent_path in new:
+        node.path = f"{parent_path}/{node.pk}"
+        found[key] = node.pk, node.county_id, node.path, node.full_name
+    return found, len(new)
+
+
+@transaction.atomic
+def import_hierarchy(data, counties=None, placeholders=None, batch_size=1000):
+    """
+    Create the missing nodes of a hierarchy file; returns ``{level: (nodes in the file, rows created)}``.
+
+    Renamed counties and sub-counties are updated in place and the stored full
+    names below them recomputed.
+    """
+    nodes = flatten(data, counties, placeholders)
+    parents, new_counties, renamed_counties = _import_counties(nodes['county'])
+    report = {'county': (len(nodes['county']), len(new_counties))}
+    parents, new_sub_counties, renamed_sub_counties = _import_sub_counties(nodes['sub_county'], parents, batch_size)
+    report['sub_county'] = (len(nodes['sub_county']), len(new_sub_counties))
+
+    if renamed_counties or renamed_sub_counties:
+        refresh_location_paths(Division.objects.filter(
+            sub_county__county__in=[county.pk for county in renamed_counties],
+        ) | Division.objects.filter(sub_county__in=[sub_county.pk for sub_county in renamed_sub_counties]))
+
+    for level, model, _, _ in LOWER_LEVELS:
+        parents, created = _import_level(model, nodes[level], parents, batch_size)
+        report[level] = (len(nodes[level]), created)
+
+    invalidate_gazetteer()
+    return report
+
+
+def children_by_parent(queryset, column):
+    """``{parent id: [rows]}`` of a queryset, so callers pick children without scanning"""
+    children = {}
+    for row in queryset:
+        children.setdefault(getattr(row, column), []).append(row)
+    return children
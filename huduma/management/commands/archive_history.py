@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from huduma.archive import ARCHIVED_MODELS, archive_dir, archive_history, parse_before
+
+
+class Command(BaseCommand):
+    help = "Move AuditLog and status history rows older than --before to compressed monthly files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True,
+                            help='Archive rows older than this date (YYYY-MM-DD) or date and time')
+        parser.add_argument('--table', action='append', choices=sorted(ARCHIVED_MODELS),
+                            help='Only archive this table (repeatable; default all)')
+        parser.add_argument('--dry-run', action='store_true', help='Count the rows per month without moving them')
+
+    def handle(self, *args, **options):
+        try:
+            before = parse_before(options['before'])
+        except ValueError:
+            raise CommandError(f"--before {options['before']!r} is not a date")
+
+        started = time.perf_counter()
+        total = 0
+        for table, month, rows in archive_history(before, options['table'], options['dry_run']):
+            total += rows
+            self.stdout.write(f"  {table:<16} {month:%Y-%m}  {rows:>12,} rows")
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {total:,} rows older than {before:%Y-%m-%d %H:%M} would be archived"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Archived {total:,} rows older than {before:%Y-%m-%d %H:%M} to {archive_dir()} in {elapsed:.1f}s"
+            ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.models import IDApplication
+from huduma.timeline import TIMELINE_BATCH_SIZE, backfill_timelines
+
+
+class Command(BaseCommand):
+    help = "Build ApplicationTimeline rows for existing applications from their status history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=TIMELINE_BATCH_SIZE, help='Applications per batch')
+
+    def handle(self, *args, **options):
+        total = IDApplication.objects.count()
+        started = time.perf_counter()
+        done = 0
+        for rows in backfill_timelines(options['batch_size']):
+            done += rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {done:,} / {total:,} applications")
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Built {done:,} application timelines in {elapsed:.1f}s ({rate:,.0f}/s)"
+        ))
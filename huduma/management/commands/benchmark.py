@@ -0,0 +1,407 @@
+import csv
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from django.db import transaction
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from huduma.audit import AuditMiddleware, audit_save, audit_writer, remember
+from huduma.exports import stream_export
+from huduma.management.commands.generate_ids import Command as GenerateIDs
+from huduma.models import AuditLog, IDApplication, NameToken, Notification, NotificationTemplate, NumberSequence, Payment
+from huduma.names import match_names, misspelled_names, name_token_rows
+from huduma.notifications import (
+    CompiledTemplate, build_notifications, notification_context, template_registry,
+)
+from huduma.numbering import BlockSequence, application_numbers
+from huduma.payments import MPESA_TIMEZONE
+from huduma.qr import QRCache
+from huduma.reconciliation import STATEMENT_COLUMNS, reconcile
+from huduma.workflow import bulk_transition
+
+
+class Command(BaseCommand):
+    help = "Run micro-benchmarks for Huduma subsystems (numbering, admin, export, transitions, ...)"
+
+    suites = ('numbering', 'admin', 'export', 'transitions', 'names', 'qr', 'notifications', 'reconcile', 'audit')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=self.suites, help='Benchmark suite to run')
+        parser.add_argument('--count', type=int, default=None, help='Number of operations to time')
+
+    def handle(self, *args, **options):
+        runner = getattr(self, f"bench_{options['suite']}", None)
+        if runner is None:
+            raise CommandError(f"Unknown suite {options['suite']}")
+        runner(options)
+
+    def report_windows(self, label, latencies, window):
+        """Print p50/p99 latency (microseconds) for consecutive windows of operations"""
+        self.stdout.write(f'{label}:')
+        for start in range(0, len(latencies), window):
+            chunk = sorted(latencies[start:start + window])
+            p50 = chunk[len(chunk) // 2] * 1e6
+            p99 = chunk[min(len(chunk) - 1, int(len(chunk) * 0.99))] * 1e6
+            self.stdout.write(
+                f'  ops {start + 1:>9,}-{start + len(chunk):>9,}: p50 {p50:8.2f}us  p99 {p99:8.2f}us'
+            )
+
+    def bench_numbering(self, options):
+        """Allocate a year's worth of application numbers and show latency stays flat"""
+        count = options['count'] or 500_000
+        name = f'benchmark_{uuid.uuid4().hex[:8]}'
+        sequence = BlockSequence(name)
+
+        latencies = []
+        started = time.perf_counter()
+        try:
+            for _ in range(count):
+                t0 = time.perf_counter()
+                sequence.next_value()
+                latencies.append(time.perf_counter() - t0)
+        finally:
+            NumberSequence.objects.filter(name=name).delete()
+        elapsed = time.perf_counter() - started
+
+        self.report_windows('Application number allocation', latencies, max(1, count // 5))
+        self.stdout.write(self.style.SUCCESS(
+            f'{count:,} numbers in {elapsed:.2f}s ({count / elapsed:,.0f}/s, '
+            f'mean {statistics.mean(latencies) * 1e6:.2f}us)'
+        ))
+
+    def bench_admin(self, options):
+        """Time every admin changelist and change form; the query budget is checked by huduma.tests"""
+        user = get_user_model().objects.filter(is_superuser=True, is_active=True).first()
+        if user is None:
+            raise CommandError("The admin suite needs an active superuser")
+        client = Client()
+        client.force_login(user)
+
+        pages_timed = 0
+        for model in admin.site._registry:
+            opts = model._meta
+            pages = [('changelist', reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist'))]
+            obj = model._default_manager.order_by('pk').first()
+            if obj is not None:
+                try:
+                    pages.append(('change', reverse(
+                        f'admin:{opts.app_label}_{opts.model_name}_change', args=[obj.pk]
+                    )))
+                except NoReverseMatch:
+                    pass
+
+            for kind, url in pages:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'  {opts.label:<32} {kind:<10} {response.status_code} {len(queries.captured_queries):>4} queries '
+                    f'{elapsed * 1000:8.1f}ms'
+                )
+                pages_timed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rendered {pages_timed} admin pages'))
+
+    def bench_export(self, options):
+        """Stream the IDApplication table in every export format and report peak memory"""
+        queryset = IDApplication.objects.order_by('pk')
+        if options['count']:
+            queryset = queryset[:options['count']]
+        total = queryset.count()
+
+        for fmt, compress in (('csv', False), ('csv', True), ('jsonl', False)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            size = 0
+            for block in stream_export(queryset, fmt, compress):
+                size += len(block)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            label = f"{fmt}{'.gz' if compress else ''}"
+            self.stdout.write(
+                f'  {label:<8} {total:>10,} rows {size / 1e6:10.1f} MB in {elapsed:7.2f}s '
+                f'({total / elapsed if elapsed else 0:,.0f} rows/s), peak Python memory {peak / 1e6:.1f} MB'
+            )
+        self.stdout.write(self.style.SUCCESS(f'✅ Exported {total:,} applications'))
+
+    def bench_transitions(self, options):
+        """Bulk-approve a batch of cloned chief-review applications through the workflow engine"""
+        count = options['count'] or 10_000
+        model = IDApplication.objects.order_by('pk').first()
+        user = get_user_model().objects.filter(is_superuser=True, is_active=True).first()
+        if model is None or user is None:
+            raise CommandError("The transitions suite needs one application and an active superuser")
+
+        fields = {
+            field.attname: getattr(model, field.attname)
+            for field in IDApplication._meta.concrete_fields
+            if not field.primary_key and field.attname not in ('application_id', 'application_number')
+        }
+        fields.update(status='chief_review', submitted_at=None, approved_at=None)
+
+        # Everything below is rolled back, so the clones never reach the live table
+        with transaction.atomic():
+            period, numbers = application_numbers.take(count)
+            clones = [
+                IDApplication(**fields, application_id=uuid.uuid4(), application_number=f"ID{period}{number:07d}")
+                for number in numbers
+            ]
+            IDApplication.objects.bulk_create(clones, batch_size=1000)
+            clone_ids = [clone.pk for clone in clones] if clones[0].pk else list(
+                IDApplication.objects.filter(application_number__in=[c.application_number for c in clones])
+                .values_list('pk', flat=True)
+            )
+
+            notifications_before = Notification.objects.count()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                moved = bulk_transition(
+                    IDApplication.objects.filter(pk__in=clone_ids),
+                    {'chief_review': 'chief_approved'}, user, reason='benchmark',
+                )
+                elapsed = time.perf_counter() - started
+            notifications = Notification.objects.count() - notifications_before
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Approved {sum(moved.values()):,} applications in {elapsed:.2f}s "
+            f"({len(queries.captured_queries)} queries, {notifications:,} notifications queued)"
+        ))
+
+    def bench_names(self, options):
+        """Time fuzzy name matching of misspelled Kenyan names; recall is checked by huduma.tests"""
+        count = options['count'] or 200_000
+        rng = random.Random(254)
+        groups = GenerateIDs().kenyan_names.values()
+        kind = 'benchmark'
+
+        # Synthetic corpus of first, middle and last names, as generate_ids builds them
+        started = time.perf_counter()
+        NameToken.objects.filter(kind=kind).delete()
+        batch = []
+        for number in range(count):
+            names = rng.choice(list(groups))
+            first = rng.choice(names['male'] + names['female'])
+            middle = rng.choice(names['male'] + names['female'])
+            batch.extend(name_token_rows(kind, number, f"{first} {middle} {rng.choice(names['surnames'])}"))
+            if len(batch) >= 10_000:
+                NameToken.objects.bulk_create(batch, batch_size=2000)
+                batch = []
+        NameToken.objects.bulk_create(batch, batch_size=2000)
+        self.stdout.write(f'  Indexed {count:,} names in {time.perf_counter() - started:.1f}s')
+
+        queries = [query for query, _ in misspelled_names(groups, rng)]
+
+        latencies = []
+        try:
+            for query in queries:
+                t0 = time.perf_counter()
+                match_names(query, [kind], limit=10)
+                latencies.append(time.perf_counter() - t0)
+        finally:
+            NameToken.objects.filter(kind=kind).delete()
+
+        latencies.sort()
+        total = len(queries)
+        self.stdout.write(
+            f'  {total} misspelled queries: p50 {latencies[total // 2] * 1000:.1f}ms, '
+            f'p99 {latencies[min(total - 1, int(total * 0.99))] * 1000:.1f}ms'
+        )
+        self.stdout.write(self.style.SUCCESS(f'✅ Matched {total} queries against {count:,} names'))
+
+    def bench_qr(self, options):
+        """Measure QR renders per second cold, from the file cache and from the in-memory LRU"""
+        count = options['count'] or 2000
+        payloads = [
+            f"WAITING_CARD|WC{number:06d}2026|{uuid.UUID(int=number)}|2026-11-{number % 28 + 1:02d}"
+            for number in range(count)
+        ]
+        directory = tempfile.mkdtemp(prefix='huduma-qr-bench-')
+        try:
+            for fmt in ('png', 'svg'):
+                cache = QRCache(directory, memory_items=count)
+                for label, reset in (('render', False), ('file cache', True), ('memory', False)):
+                    if reset:
+                        cache.clear_memory()
+                    started = time.perf_counter()
+                    size = sum(len(cache.get(payload, fmt)[1]) for payload in payloads)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'  {fmt} {label:<10}: {count / elapsed:>10,.0f}/s  '
+                        f'({elapsed / count * 1e6:8.1f}us each, {size / count / 1024:.1f} KiB avg)'
+                    )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.stdout.write(self.style.SUCCESS(f'✅ Served {count:,} QR codes per format'))
+
+    def bench_notifications(self, options):
+        """Render status notifications through the compiled template registry; the target is 100k a minute"""
+        count = options['count'] or 100_000
+        templates = [
+            NotificationTemplate(
+                name='benchmark sms', subject='Application {{ application.application_number }}',
+                message_template=(
+                    'Dear {{ application.full_name }}, your application {{ application.application_number }} '
+                    'is now {{ status_display }}.{% if status == "ready_for_collection" %} Please collect your ID '
+                    'from {{ application.current_location|default:"your DO office" }}.{% endif %}'
+                ),
+                notification_type='both', trigger_status='ready_for_collection',
+            ),
+        ]
+        applications = [
+            IDApplication(
+                applicant_id=number, full_name=f"Wanjiru Chepng'eno {number}",
+                application_number=f"ID2026{number:07d}", phone_number=f"+2547{number:08d}",
+                email=f"citizen{number}@example.com",
+            )
+            for number in range(count)
+        ]
+        status = 'ready_for_collection'
+
+        # Baseline: parse the templates and build a context for every message
+        sample = applications[:max(1, count // 20)]
+        started = time.perf_counter()
+        for application in sample:
+            context = notification_context(status)
+            context.push(application=application)
+            for template in templates:
+                CompiledTemplate(template).message.render(context)
+        naive = len(sample) / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        lookups = 10_000
+        for _ in range(lookups):
+            template_registry().for_status(status)
+        lookup = (time.perf_counter() - started) / lookups
+
+        compiled = [CompiledTemplate(template) for template in templates]
+        started = time.perf_counter()
+        messages = sum(1 for _ in build_notifications(applications, status, compiled))
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed
+
+        self.stdout.write(f'  parse per message : {naive * 60:>12,.0f} applications/min')
+        self.stdout.write(f'  compiled registry : {rate * 60:>12,.0f} applications/min ({messages:,} messages)')
+        self.stdout.write(f'  registry lookup   : {lookup * 1e6:>12.1f}us')
+        summary = f'Rendered {count:,} applications in {elapsed:.2f}s ({rate * 60:,.0f}/min, target 100,000/min)'
+        if rate * 60 >= 100_000:
+            self.stdout.write(self.style.SUCCESS(f'✅ {summary}'))
+        else:
+            self.stdout.write(self.style.ERROR(f'❌ {summary}'))
+
+    def bench_reconcile(self, options):
+        """Dry-run reconcile a synthetic M-Pesa statement built from the recorded payments; target 1M lines a minute"""
+        count = options['count'] or 1_000_000
+        rng = random.Random(254)
+        payments = list(
+            Payment.objects.filter(status='completed').exclude(external_reference=None)
+            .values_list('external_reference', 'amount', 'paid_at')[:count]
+        )
+        directory = tempfile.mkdtemp(prefix='huduma-reconcile-bench-')
+        path = f'{directory}/statement.csv'
+        try:
+            with open(path, 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(STATEMENT_COLUMNS.values())
+                for number in range(count):
+                    if payments and number < len(payments) and rng.random() > 0.01:
+                        reference, amount, paid_at = payments[number]
+                        if rng.random() < 0.001:
+                            amount += 1
+                    else:
+                        reference, amount, paid_at = f"ZZ{number:08d}", 1000, None
+                    when = (paid_at or timezone.now()).astimezone(MPESA_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
+                    writer.writerow((reference, when, f"{amount:,.2f}", f"ID{number:09d}", '254700000000 - PAYER', 'Completed'))
+                    if rng.random() < 0.001:
+                        writer.writerow((reference, when, f"{amount:,.2f}", '', '', 'Completed'))
+            self.stdout.write(f'  statement of {count:,} lines ({len(payments):,} payments on record)')
+
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            with open(path, newline='') as handle:
+                result = reconcile(handle)
+            elapsed = time.perf_counter() - started
+            rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        for outcome, total in result.counts.items():
+            self.stdout.write(f'  {outcome:<22} {total:>12,}')
+        summary = (
+            f'Reconciled {result.lines:,} lines in {elapsed:.1f}s ({result.lines / elapsed * 60:,.0f}/min, '
+            f'peak RSS grew {rss_growth / 1024:,.0f} MiB, target 1,000,000/min)'
+        )
+        if result.lines / elapsed * 60 >= 1_000_000:
+            self.stdout.write(self.style.SUCCESS(f'✅ {summary}'))
+        else:
+            self.stdout.write(self.style.ERROR(f'❌ {summary}'))
+
+    def bench_audit(self, options):
+        """Time the audit work a save adds to a request and how fast the writer drains it; target under 1ms"""
+        count = options['count'] or 20_000
+        applications = list(IDApplication.objects.order_by('pk')[:1000])
+        if not applications:
+            raise CommandError("The audit suite needs applications; run seed_scale first")
+        # The events are made under a request whose user agent marks them, so exactly
+        # these rows are removed afterwards and the rest of the audit trail is untouched
+        marker = f'huduma-benchmark-{uuid.uuid4().hex}'
+        request = RequestFactory().get('/', HTTP_USER_AGENT=marker)
+
+        started = time.perf_counter()
+        for application in applications:
+            remember(application)
+        snapshot = (time.perf_counter() - started) / len(applications)
+
+        writer = audit_writer()
+        done = writer.written + writer.spooled
+
+        def save_all(request):
+            latencies = []
+            for i in range(count):
+                application = applications[i % len(applications)]
+                application.status = 'processing' if application.status != 'processing' else 'started'
+                t0 = time.perf_counter()
+                audit_save(application, created=False)
+                latencies.append(time.perf_counter() - t0)
+            return latencies
+
+        started = time.perf_counter()
+        latencies = AuditMiddleware(save_all)(request)
+        queued = time.perf_counter() - started
+
+        writer.wake.set()
+        deadline = time.monotonic() + 120
+        while writer.written + writer.spooled < done + count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        drained = time.perf_counter() - started
+        written = writer.written + writer.spooled - done
+        AuditLog.objects.filter(user_agent=marker).delete()
+
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+        self.stdout.write(f'  snapshot on load : {snapshot * 1e6:>10.1f}us per instance')
+        self.stdout.write(f'  audit per save   : p50 {p50 * 1e6:.1f}us  p99 {p99 * 1e6:.1f}us')
+        self.stdout.write(f'  writer           : {written:,} events written in {drained:.2f}s '
+                          f'({written / drained:,.0f}/s, {writer.spooled:,} spooled)')
+        summary = f'Queued {count:,} audit events in {queued:.2f}s (p99 {p99 * 1e3:.3f}ms per save, target 1ms)'
+        if p99 < 0.001 and written >= count:
+            self.stdout.write(self.style.SUCCESS(f'✅ {summary}'))
+        else:
+            self.stdout.write(self.style.ERROR(f'❌ {summary}'))
@@ -0,0 +1,70 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from huduma.gazetteer import ADDRESS_FIELDS, gazetteer
+from huduma.models import BirthCertificate, IDApplication
+
+
+# --model choice -> (model, addresses it carries)
+ADDRESS_MODELS = {
+    'application': (IDApplication, ('birth', 'current')),
+    'birth_certificate': (BirthCertificate, ('birth',)),
+}
+
+
+class Command(BaseCommand):
+    help = "Report applications and birth certificates whose address levels do not nest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(ADDRESS_MODELS), action='append',
+                            help='Only check this model (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows fetched per database round trip')
+        parser.add_argument('--show', type=int, default=20, help='Inconsistent rows printed per model')
+        parser.add_argument('--output', help='Write every inconsistent row to this CSV file')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error if any row is inconsistent')
+
+    def handle(self, *args, **options):
+        tree = gazetteer()
+        writer = None
+        if options['output']:
+            output = open(options['output'], 'w', newline='')
+            writer = csv.writer(output)
+            writer.writerow(['model', 'pk', 'field', 'problem'])
+
+        inconsistent = 0
+        try:
+            for name in options['model'] or list(ADDRESS_MODELS):
+                model, addresses = ADDRESS_MODELS[name]
+                columns = [f'{field}_id' for address in addresses for field in ADDRESS_FIELDS[address]]
+                rows = model.objects.order_by().values_list('pk', *columns).iterator(chunk_size=options['chunk_size'])
+
+                started = time.perf_counter()
+                checked = bad = 0
+                for row in rows:
+                    checked += 1
+                    problems = []
+                    for offset, address in enumerate(addresses):
+                        ids = row[1 + offset * 6:7 + offset * 6]
+                        for index, message in tree.chain_errors(ids):
+                            problems.append((ADDRESS_FIELDS[address][index], message))
+                    if not problems:
+                        continue
+                    bad += 1
+                    if bad <= options['show']:
+                        self.stdout.write(f"  {name} {row[0]}: " + '; '.join(f'{f}: {m}' for f, m in problems))
+                    if writer:
+                        writer.writerows([name, row[0], field, message] for field, message in problems)
+                elapsed = time.perf_counter() - started
+
+                rate = checked / elapsed * 60 if elapsed else 0
+                summary = f"{name}: {checked:,} rows checked in {elapsed:.1f}s ({rate:,.0f}/min), {bad:,} inconsistent"
+                self.stdout.write(self.style.WARNING(f"⚠️ {summary}") if bad else self.style.SUCCESS(f"✅ {summary}"))
+                inconsistent += bad
+        finally:
+            if writer:
+                output.close()
+
+        if inconsistent and options['fail']:
+            raise CommandError(f"{inconsistent:,} rows have inconsistent addresses")
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.dispatch import dispatch_pending, due
+
+
+class Command(BaseCommand):
+    help = "Send pending notifications through the configured SMS and email backends"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Notifications claimed per batch')
+        parser.add_argument('--concurrency', type=int, default=None, help='Messages in flight at once')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many notifications')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new notifications')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self.dispatch(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def dispatch(self, options):
+        if not options['loop']:
+            self.stdout.write(f"  {due().count():,} notifications due")
+
+        started = time.perf_counter()
+        sent = failed = retrying = 0
+        for sent, failed, retrying in dispatch_pending(options['batch_size'], options['concurrency'], options['limit']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {sent:,} sent, {failed:,} failed, {retrying:,} to retry")
+        elapsed = time.perf_counter() - started
+        if sent or failed or retrying or not options['loop']:
+            rate = sent / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {sent:,} notifications sent in {elapsed:.1f}s ({rate:,.0f}/s); "
+                f"{failed:,} failed, {retrying:,} will be retried"
+            ))
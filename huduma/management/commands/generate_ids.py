@@ -4,11 +4,13 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from huduma.models import (
-    County, SubCounty, Division, Location, SubLocation, Village,
+    County, Location, SubLocation, Village,
     CustomUser, BirthCertificate, IDApplication, NationalID,
     ChiefOffice, Chief, DOOffice, DOOfficer, BiometricData,
     ApplicationStatusHistory
 )
+from huduma.hierarchy import children_by_parent, import_hierarchy, load_fixture
+from huduma.numbering import claim_id_numbers
 from decimal import Decimal
 
 
@@ -54,82 +56,26 @@ class Command(BaseCommand):
             'Kericho', 'Bomet', 'Nandi', 'Baringo', 'Elgeyo-Marakwet', 'Kajiado',
             'Kirinyaga', 'Nyandarua', 'Embu', 'Tharaka-Nithi', 'Kitui', 'Makueni'
         ]
-        
-        # Common Kenyan locations
-        self.locations_data = {
-            'Nairobi': ['Westlands', 'Kasarani', 'Embakasi', 'Dagoretti', 'Langata', 'Starehe'],
-            'Mombasa': ['Mvita', 'Changamwe', 'Jomba', 'Kisauni', 'Nyali', 'Likoni'],
-            'Kisumu': ['Kisumu East', 'Kisumu West', 'Kisumu Central', 'Seme', 'Nyando', 'Muhoroni'],
-            'Nakuru': ['Nakuru Town', 'Njoro', 'Molo', 'Gilgil', 'Naivasha', 'Kuresoi'],
-            'Kiambu': ['Thika', 'Kikuyu', 'Limuru', 'Gatundu', 'Lari', 'Githunguri']
-        }
 
     def create_location_hierarchy(self):
-        """Create basic location hierarchy for Kenya"""
+        """Import the first 10 counties of the bundled hierarchy and index it by parent"""
         self.stdout.write('Creating location hierarchy...')
         
-        counties = {}
-        sub_counties = {}
-        divisions = {}
-        locations = {}
-        sub_locations = {}
-        villages = {}
+        county_names = self.kenyan_counties[:10]  # Use first 10 counties
+        import_hierarchy(load_fixture(), counties=county_names)
         
-        # Create counties
-        for county_name in self.kenyan_counties[:10]:  # Use first 10 counties
-            county, created = County.objects.get_or_create(
-                name=county_name,
-                defaults={'code': county_name[:3].upper()}
-            )
-            counties[county_name] = county
-            
-            # Create sub-counties
-            locations_list = self.locations_data.get(county_name, ['Central', 'North', 'South'])
-            for i, loc_name in enumerate(locations_list[:3]):  # 3 sub-counties per county
-                sub_county_name = f"{loc_name} Sub-County"
-                sub_county_code = f"{county.code}{i+1:02d}"
-                
-                # Use get_or_create with unique fields to avoid duplicates
-                sub_county, created = SubCounty.objects.get_or_create(
-                    county=county,
-                    code=sub_county_code,
-                    defaults={'name': sub_county_name}
-                )
-                sub_counties[f"{county_name}_{loc_name}"] = sub_county
-                
-                # Create divisions
-                for j in range(2):  # 2 divisions per sub-county
-                    division, created = Division.objects.get_or_create(
-                        name=f"{loc_name} Division {j+1}",
-                        sub_county=sub_county
-                    )
-                    divisions[f"{county_name}_{loc_name}_{j}"] = division
-                    
-                    # Create locations
-                    for k in range(2):  # 2 locations per division
-                        location, created = Location.objects.get_or_create(
-                            name=f"{loc_name} Location {k+1}",
-                            division=division
-                        )
-                        locations[f"{county_name}_{loc_name}_{j}_{k}"] = location
-                        
-                        # Create sub-locations
-                        for l in range(2):  # 2 sub-locations per location
-                            sub_location, created = SubLocation.objects.get_or_create(
-                                name=f"{loc_name} Sub-Location {l+1}",
-                                location=location
-                            )
-                            sub_locations[f"{county_name}_{loc_name}_{j}_{k}_{l}"] = sub_location
-                            
-                            # Create villages
-                            for m in range(3):  # 3 villages per sub-location
-                                village, created = Village.objects.get_or_create(
-                                    name=f"{loc_name} Village {m+1}",
-                                    sub_location=sub_location
-                                )
-                                villages[f"{county_name}_{loc_name}_{j}_{k}_{l}_{m}"] = village
+        counties = {county.name: county for county in County.objects.filter(name__in=county_names)}
+        locations = list(
+            Location.objects.filter(county__in=counties.values())
+            .select_related('division__sub_county__county')
+            .order_by('pk')
+        )
+        # parent id -> children, so picking a place is a dictionary lookup
+        sub_locations = children_by_parent(SubLocation.objects.filter(county__in=counties.values()), 'location_id')
+        villages = children_by_parent(Village.objects.filter(county__in=counties.values()), 'sub_location_id')
+        locations = [location for location in locations if location.pk in sub_locations]
         
-        return counties, sub_counties, divisions, locations, sub_locations, villages
+        return counties, locations, sub_locations, villages
 
     def create_administrative_structure(self, counties, locations, sub_locations):
         """Create chief offices, DO offices, and staff"""
@@ -179,13 +125,10 @@ class Command(BaseCommand):
                 )
         
         # Create chief offices (multiple per county)
-        location_keys = list(locations.keys())[:15]  # First 15 locations
-        for loc_key in location_keys:
-            location = locations[loc_key]
+        for location in locations[:15]:  # First 15 locations
             # Find a sub-location in this location
-            sub_loc_keys = [k for k in sub_locations.keys() if k.startswith('_'.join(loc_key.split('_')[:4]))]
-            if sub_loc_keys:
-                sub_location = sub_locations[sub_loc_keys[0]]
+            if location.pk in sub_locations:
+                sub_location = sub_locations[location.pk][0]
                 
                 chief_office, created = ChiefOffice.objects.get_or_create(
                     name=f"{location.name} Chief Office",
@@ -271,10 +214,6 @@ class Command(BaseCommand):
         users = []
         birth_certificates = []
         
-        location_keys = list(locations.keys())
-        sub_location_keys = list(sub_locations.keys())
-        village_keys = list(villages.keys())
-        
         for i in range(100):
             person_data = self.generate_person_data()
             
@@ -296,16 +235,9 @@ class Command(BaseCommand):
             users.append(user)
             
             # Select random locations for birth
-            birth_location_key = random.choice(location_keys)
-            birth_location = locations[birth_location_key]
-            
-            birth_sub_location_key = random.choice([k for k in sub_location_keys 
-                                                  if k.startswith('_'.join(birth_location_key.split('_')[:4]))])
-            birth_sub_location = sub_locations[birth_sub_location_key]
-            
-            birth_village_key = random.choice([k for k in village_keys 
-                                             if k.startswith('_'.join(birth_sub_location_key.split('_')[:5]))])
-            birth_village = villages[birth_village_key]
+            birth_location = random.choice(locations)
+            birth_sub_location = random.choice(sub_locations[birth_location.pk])
+            birth_village = random.choice(villages[birth_sub_location.pk])
             
             # Generate parents' names
             parent_ethnic = person_data['ethnic_group']
@@ -353,22 +285,14 @@ class Command(BaseCommand):
         applications = []
         national_ids = []
         
-        location_keys = list(locations.keys())
-        sub_location_keys = list(sub_locations.keys())
-        village_keys = list(villages.keys())
+        # Claim every ID number for this run in one go
+        id_numbers = claim_id_numbers(len(users))
         
         for i, (user, birth_cert) in enumerate(zip(users, birth_certificates)):
             # Select random current location (can be different from birth location)
-            current_location_key = random.choice(location_keys)
-            current_location = locations[current_location_key]
-            
-            current_sub_location_key = random.choice([k for k in sub_location_keys 
-                                                    if k.startswith('_'.join(current_location_key.split('_')[:4]))])
-            current_sub_location = sub_locations[current_sub_location_key]
-            
-            current_village_key = random.choice([k for k in village_keys 
-                                               if k.startswith('_'.join(current_sub_location_key.split('_')[:5]))])
-            current_village = villages[current_village_key]
+            current_location = random.choice(locations)
+            current_sub_location = random.choice(sub_locations[current_location.pk])
+            current_village = random.choice(villages[current_sub_location.pk])
             
             # Select chief office and DO office
             chief_office = random.choice(chief_offices)
@@ -428,9 +352,7 @@ class Command(BaseCommand):
             applications.append(application)
             
             # Create National ID
-            id_number = f"{random.randint(10000000, 99999999)}"
-            while NationalID.objects.filter(id_number=id_number).exists():
-                id_number = f"{random.randint(10000000, 99999999)}"
+            id_number = id_numbers[i]
             
             national_id = NationalID.objects.create(
                 application=application,
@@ -488,7 +410,7 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('Starting National ID generation...'))
         
         # Create location hierarchy
-        counties, sub_counties, divisions, locations, sub_locations, villages = self.create_location_hierarchy()
+        counties, locations, sub_locations, villages = self.create_location_hierarchy()
         
         # Create administrative structure
         chief_offices, do_offices = self.create_administrative_structure(counties, locations, sub_locations)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.models import PaymentCallback
+from huduma.payments import process_callbacks
+
+
+class Command(BaseCommand):
+    help = "Match staged M-Pesa confirmations to payments and applications"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Callbacks matched per transaction')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many callbacks')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new callbacks')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self.process(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def process(self, options):
+        if not options['loop']:
+            self.stdout.write(f"  {PaymentCallback.objects.filter(status='pending').count():,} callbacks pending")
+
+        started = time.perf_counter()
+        totals = {}
+        for totals in process_callbacks(options['batch_size'], options['limit']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {self.summary(totals)}")
+        elapsed = time.perf_counter() - started
+        done = sum(totals.values())
+        if done or not options['loop']:
+            rate = done / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {done:,} callbacks processed in {elapsed:.1f}s ({rate:,.0f}/s): {self.summary(totals)}"
+            ))
+
+    def summary(self, totals):
+        return ', '.join(f"{count:,} {status}" for status, count in sorted(totals.items())) or 'nothing to do'
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.names import NAME_MODELS, rebuild_name_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the name tokens and phonetic keys of applications, birth certificates and National IDs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(NAME_MODELS), action='append',
+                            help='Only rebuild this kind (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or list(NAME_MODELS)
+        for kind in kinds:
+            started = time.perf_counter()
+            total = 0
+            for total in rebuild_name_index(kind, options['batch_size']):
+                if total % (options['batch_size'] * 25) == 0:
+                    self.stdout.write(f"  {kind}: {total:,} indexed")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f"✅ {kind}: {total:,} names indexed in {elapsed:.1f}s"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from huduma.search import INDEXED_FIELDS, rebuild_index, search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search entries for applications, birth certificates, National IDs and waiting cards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(INDEXED_FIELDS), action='append',
+                            help='Only rebuild this kind (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or list(INDEXED_FIELDS)
+        for kind in kinds:
+            started = time.perf_counter()
+            total = 0
+            for total in rebuild_index(kind, options['batch_size']):
+                if total % (options['batch_size'] * 25) == 0:
+                    self.stdout.write(f"  {kind}: {total:,} indexed")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f"✅ {kind}: {total:,} records indexed in {elapsed:.1f}s"))
+
+        if search_backend(connection) == 'fts5':
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO huduma_searchentry_fts(huduma_searchentry_fts) VALUES ('optimize')")
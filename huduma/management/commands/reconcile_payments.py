@@ -0,0 +1,58 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from huduma.reconciliation import OUTCOMES, REPORT_FIELDS, RECONCILE_CHUNK_SIZE, StatementError, reconcile
+
+
+class Command(BaseCommand):
+    help = "Reconcile payments against a bank or M-Pesa statement CSV and optionally apply the fixes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Statement CSV file ("-" reads standard input)')
+        parser.add_argument('--apply', action='store_true',
+                            help='Complete confirmed payments, flag paid applications and stage orphan lines')
+        parser.add_argument('--report', default=None, help='Write every issue to this CSV file')
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE, help='Statement lines per block')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--reference-column', default=None, help='Header of the receipt number column')
+        parser.add_argument('--amount-column', default=None, help='Header of the amount received column')
+        parser.add_argument('--time-column', default=None, help='Header of the transaction time column')
+        parser.add_argument('--account-column', default=None,
+                            help='Header of the account number column (payment reference or application number)')
+
+    def handle(self, *args, **options):
+        columns = {
+            field: options[f'{field}_column']
+            for field in ('reference', 'amount', 'time', 'account')
+            if options[f'{field}_column']
+        }
+        report_file = open(options['report'], 'w', newline='', encoding='utf-8') if options['report'] else None
+        writer = None
+        if report_file:
+            writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+
+        started = time.perf_counter()
+        try:
+            if options['statement'] == '-':
+                result = reconcile(sys.stdin, columns, options['apply'], writer and writer.writerow, options['chunk_size'])
+            else:
+                with open(options['statement'], newline='', encoding=options['encoding']) as handle:
+                    result = reconcile(handle, columns, options['apply'], writer and writer.writerow, options['chunk_size'])
+        except (OSError, StatementError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            if report_file:
+                report_file.close()
+        elapsed = time.perf_counter() - started
+
+        for outcome in OUTCOMES:
+            self.stdout.write(f"  {outcome:<22} {result.counts[outcome]:>12,}")
+        rate = result.lines / elapsed if elapsed else 0
+        action = f"{result.fixed:,} fixes applied" if options['apply'] else "dry run, pass --apply to fix"
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Reconciled {result.lines:,} statement lines in {elapsed:.1f}s ({rate:,.0f} lines/s); {action}"
+        ))
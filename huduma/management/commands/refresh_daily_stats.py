@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.models import StaleDailyStats
+from huduma.stats import refresh_stale_days
+
+
+class Command(BaseCommand):
+    help = "Recompute the DailyStats days marked stale by recent saves"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many days')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for stale days')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, options):
+        if not options['loop']:
+            self.stdout.write(f"  {StaleDailyStats.objects.count():,} days stale")
+
+        started = time.perf_counter()
+        days = rows = failed = 0
+        for date, written in refresh_stale_days(options['limit']):
+            if written is None:
+                failed += 1
+                self.stderr.write(f"  {date}: failed, queued again")
+                continue
+            days += 1
+            rows += written
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {date}: {written:,} rows")
+        elapsed = time.perf_counter() - started
+        if days or failed or not options['loop']:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Refreshed {days:,} days ({rows:,} rows) in {elapsed:.1f}s; {failed:,} failed"
+            ))
@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.qr import QR_MODELS, fill_payloads, pending, render_pending
+
+
+class Command(BaseCommand):
+    help = "Store QR code PNG files for chief letters and waiting cards that have none (pages render codes on demand)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(QR_MODELS), action='append',
+                            help='Only render this kind (repeatable)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Rendering processes (1 renders in this process)')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many images per kind')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new rows')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or list(QR_MODELS)
+        while True:
+            for kind in kinds:
+                self.render(kind, options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def render(self, kind, options):
+        filled = fill_payloads(kind, options['batch_size'])
+        if filled:
+            self.stdout.write(f"  {kind}: stored {filled:,} missing payloads")
+        if not options['loop']:
+            self.stdout.write(f"  {kind}: {pending(kind).count():,} images to render")
+
+        started = time.perf_counter()
+        total = 0
+        for total in render_pending(kind, options['batch_size'], options['workers'], options['limit']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {kind}: {total:,} rendered")
+        elapsed = time.perf_counter() - started
+        if total or not options['loop']:
+            rate = total / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {kind}: {total:,} QR codes rendered in {elapsed:.1f}s ({rate:,.0f}/s)"
+            ))
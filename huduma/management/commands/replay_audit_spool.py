@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.audit import replay_spool, spool_dir
+
+
+class Command(BaseCommand):
+    help = "Load audit events spooled while the database was slow or unavailable into AuditLog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', default=None, help='Spool directory (default: HUDUMA_AUDIT spool_dir)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events inserted per statement')
+
+    def handle(self, *args, **options):
+        directory = options['spool_dir'] or spool_dir()
+        started = time.perf_counter()
+        files = total = 0
+        for name, loaded in replay_spool(directory, options['batch_size']):
+            files += 1
+            total += loaded
+            self.stdout.write(f"  {name}: {loaded:,} events")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Loaded {total:,} audit events from {files:,} spool files in {directory} ({elapsed:.1f}s)"
+        ))
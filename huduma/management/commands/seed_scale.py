@@ -0,0 +1,94 @@
+import os
+import time
+from datetime import date
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from huduma.gazetteer import gazetteer
+from huduma.models import Fee
+from huduma.seeding import SHARD_SIZE, seed_citizens, shard_count
+
+
+# Fees charged to seeded replacements and name changes when none are configured
+DEFAULT_FEES = {
+    'replacement': ('1000.00', 'ID replacement fee'),
+    'name_change': ('1000.00', 'Name change fee'),
+}
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate citizens with certificates, applications, history, payments and IDs for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citizens', type=int, default=100_000, help='Citizens to create')
+        parser.add_argument('--seed', type=int, default=254, help='Random seed; a seed always builds the same data')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Generating processes (forced to 1 on SQLite, which allows one writer)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT')
+        parser.add_argument('--prefix', default='LT',
+                            help='Prefix of usernames and certificate, serial and payment numbers; use a new one per run')
+        parser.add_argument('--days', type=int, default=730, help='Spread applications over the last N days')
+        parser.add_argument('--password', default=None,
+                            help='Password of every seeded citizen (default: unusable)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild the search index, name index, daily stats and timelines afterwards')
+
+    def handle(self, *args, **options):
+        if options['citizens'] < 1:
+            raise CommandError("--citizens must be positive")
+        if not gazetteer().children[None, None]:
+            raise CommandError("No counties found. Run seed_counties (or generate_ids) first.")
+
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stdout.write("  SQLite allows a single writer, seeding with one process")
+            workers = 1
+
+        for fee_type, (amount, description) in DEFAULT_FEES.items():
+            Fee.objects.get_or_create(
+                fee_type=fee_type,
+                defaults={'amount': amount, 'description': description, 'effective_from': date(2000, 1, 1)},
+            )
+
+        password = make_password(options['password']) if options['password'] else make_password(None)
+        shards = shard_count(options['citizens'])
+        self.stdout.write(
+            f"Seeding {options['citizens']:,} citizens in {shards:,} shards of {SHARD_SIZE:,} "
+            f"with {workers} worker(s), seed {options['seed']}..."
+        )
+
+        started = time.perf_counter()
+        totals = {}
+        done = 0
+        for counts in seed_citizens(
+            options['citizens'], seed=options['seed'], workers=workers, batch_size=options['batch_size'],
+            prefix=options['prefix'], days=options['days'], password=password,
+        ):
+            done += 1
+            for name, rows in counts.items():
+                totals[name] = totals.get(name, 0) + rows
+            elapsed = time.perf_counter() - started
+            rows = sum(totals.values())
+            self.stdout.write(f"  shard {done:,}/{shards:,}: {rows:,} rows, {rows / elapsed:,.0f} rows/s")
+
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        for name, count in totals.items():
+            self.stdout.write(f"  {name:<20} {count:>12,}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Seeded {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+        ))
+
+        if options['rebuild']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('rebuild_name_index', stdout=self.stdout)
+            call_command('backfill_daily_stats', stdout=self.stdout)
+            call_command('backfill_timelines', stdout=self.stdout)
+        else:
+            self.stdout.write(
+                "Seeded rows bypass signals: run rebuild_search_index, rebuild_name_index, "
+                "backfill_daily_stats and backfill_timelines (or pass --rebuild)."
+            )
@@ -0,0 +1,114 @@
+import json
+import random
+import string
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from huduma.models import Fee, IDApplication
+from huduma.payments import APPLICATION_FEE_TYPES, MPESA_TIMEZONE, payments_config
+
+
+class Command(BaseCommand):
+    help = "Replay a burst of M-Pesa C2B confirmations (with retries) against the callback endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Distinct confirmations to send')
+        parser.add_argument('--duplicates', type=float, default=0.1, help='Share of confirmations sent twice')
+        parser.add_argument('--unknown', type=float, default=0.05,
+                            help='Share of confirmations with an account number that matches nothing')
+        parser.add_argument('--url', default=None,
+                            help='Post to this callback URL (default: in-process, through the test client)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight with --url')
+        parser.add_argument('--token', default=None, help="Callback token (default: HUDUMA_PAYMENTS['callback_token'])")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        fees = dict(Fee.objects.filter(is_active=True).values_list('fee_type', 'amount'))
+        payable = [
+            (number, fees[APPLICATION_FEE_TYPES[application_type]])
+            for number, application_type in IDApplication.objects.filter(fee_paid=False)
+            .values_list('application_number', 'application_type')[:options['count']]
+            if fees.get(APPLICATION_FEE_TYPES.get(application_type))
+        ]
+        if not payable:
+            raise CommandError("No unpaid applications with an active fee; run seed_scale or add fees first")
+
+        payloads = [self.confirmation(rng, payable, options['unknown']) for _ in range(options['count'])]
+        payloads += rng.sample(payloads, int(len(payloads) * options['duplicates']))
+        rng.shuffle(payloads)
+
+        token = options['token'] or payments_config()['callback_token']
+        if not token:
+            raise CommandError("The callback endpoint rejects every callback without a token; set "
+                               "HUDUMA_MPESA_CALLBACK_TOKEN or pass --token")
+        query = f"?{urllib.parse.urlencode({'token': token})}"
+        started = time.perf_counter()
+        if options['url']:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(lambda payload: self.post_url(options['url'] + query, payload), payloads))
+        else:
+            client = Client()
+            url = reverse('mpesa_callback') + query
+            results = [self.post_client(client, url, payload) for payload in payloads]
+        elapsed = time.perf_counter() - started
+
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        latencies = sorted(latency for _, latency in results)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        self.stdout.write(f"  responses: {', '.join(f'{count:,} x {status}' for status, count in sorted(statuses.items()))}")
+        self.stdout.write(f"  latency: p50 {p50:.1f}ms  p99 {p99:.1f}ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sent {len(payloads):,} callbacks ({options['count']:,} distinct) in {elapsed:.1f}s "
+            f"({len(payloads) / elapsed:,.0f}/s); run process_payment_callbacks to match them"
+        ))
+
+    def confirmation(self, rng, payable, unknown):
+        number, amount = rng.choice(payable)
+        if rng.random() < unknown:
+            number = f"X{rng.randrange(10 ** 8):08d}"
+        return {
+            'TransactionType': 'Pay Bill',
+            'TransID': ''.join(rng.choices(string.ascii_uppercase + string.digits, k=10)),
+            'TransTime': timezone.now().astimezone(MPESA_TIMEZONE).strftime('%Y%m%d%H%M%S'),
+            'TransAmount': str(amount),
+            'BusinessShortCode': '600000',
+            'BillRefNumber': number,
+            'InvoiceNumber': '',
+            'OrgAccountBalance': '',
+            'ThirdPartyTransID': '',
+            'MSISDN': f"2547{rng.randrange(10 ** 8):08d}",
+            'FirstName': rng.choice(['Wanjiru', 'Otieno', 'Kiprop', 'Nekesa', 'Mutua']),
+            'MiddleName': '',
+            'LastName': rng.choice(['Kamau', 'Ochieng', 'Rotich', 'Wafula', 'Musyoka']),
+        }
+
+    def post_client(self, client, url, payload):
+        started = time.perf_counter()
+        response = client.post(url, json.dumps(payload), content_type='application/json')
+        return response.status_code, time.perf_counter() - started
+
+    def post_url(self, url, payload):
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 'error'
+        return status, time.perf_counter() - started
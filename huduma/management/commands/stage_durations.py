@@ -0,0 +1,51 @@
+from datetime import date, datetime, time as day_start
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from huduma.models import ChiefOffice, County, DOOffice, HudumaCentre
+from huduma.timeline import GROUPS, STAGES, stage_percentiles
+
+
+class Command(BaseCommand):
+    help = "Print stage duration percentiles per county, office or application type from ApplicationTimeline"
+
+    group_models = {
+        'county': County,
+        'chief_office': ChiefOffice,
+        'do_office': DOOffice,
+        'huduma_centre': HudumaCentre,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('stage', choices=list(STAGES), help='Stage to measure')
+        parser.add_argument('--by', choices=list(GROUPS), default='county', help='Grouping (default county)')
+        parser.add_argument('--since', type=date.fromisoformat, default=None,
+                            help='Only stages that ended on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=date.fromisoformat, default=None,
+                            help='Only stages that ended before this date (YYYY-MM-DD)')
+        parser.add_argument('--percentile', type=float, action='append', default=None,
+                            help='Percentile to report, 0-100 (repeatable; default 50 and 90)')
+
+    def handle(self, *args, **options):
+        bounds = [
+            timezone.make_aware(datetime.combine(day, day_start.min)) if day else None
+            for day in (options['since'], options['until'])
+        ]
+        percentiles = options['percentile'] or (50, 90)
+        if any(not 0 <= value <= 100 for value in percentiles):
+            raise CommandError("--percentile must be between 0 and 100")
+        fractions = [value / 100 for value in percentiles]
+        rows = stage_percentiles(options['stage'], options['by'], fractions, *bounds)
+
+        model = self.group_models.get(options['by'])
+        names = {obj.pk: str(obj) for obj in model.objects.filter(pk__in=[key for key in rows if key])} if model else {}
+        for key, values in sorted(rows.items(), key=lambda item: -item[1]['count']):
+            label = names.get(key, key) if key is not None else '(none)'
+            measures = '  '.join(
+                f"{name} {values[name].total_seconds() / 86400:6.1f}d" for name in values if name != 'count'
+            )
+            self.stdout.write(f"  {str(label)[:40]:<40} {values['count']:>9,}  {measures}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {options['stage']} durations for {len(rows):,} groups ({sum(v['count'] for v in rows.values()):,} applications)"
+        ))
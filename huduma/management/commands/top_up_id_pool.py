@@ -0,0 +1,36 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from huduma.models import IDNumberPool
+from huduma.numbering import top_up_pool
+
+
+class Command(BaseCommand):
+    help = "Top up the pre-shuffled pool of unissued National ID numbers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100000, help='Numbers to add to the pool')
+        parser.add_argument('--target', type=int, default=None,
+                            help='Only add enough numbers to reach this many available')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=None, help='Seed for a reproducible pool (testing only)')
+
+    def handle(self, *args, **options):
+        available = IDNumberPool.objects.filter(claimed_at__isnull=True).count()
+        size = options['size']
+        if options['target'] is not None:
+            size = max(0, options['target'] - available)
+        if size == 0:
+            self.stdout.write(self.style.SUCCESS(f"Pool already has {available:,} available numbers."))
+            return
+
+        rng = random.Random(options['seed']) if options['seed'] is not None else None
+        started = time.perf_counter()
+        added = top_up_pool(size, batch_size=options['batch_size'], rng=rng)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Added {added:,} numbers in {elapsed:.1f}s; {available + added:,} now available."
+        ))
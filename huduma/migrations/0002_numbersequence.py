@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('period', models.CharField(blank=True, default='', max_length=10)),
+                ('next_value', models.BigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('name', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0002_numbersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IDNumberPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_number', models.CharField(max_length=20, unique=True)),
+                ('claim_token', models.CharField(blank=True, max_length=32, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['claimed_at', 'id'], name='huduma_idnu_claimed_b8782a_idx'), models.Index(fields=['claim_token'], name='huduma_idnu_claim_t_40481b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:31
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0003_idnumberpool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('started', 'Application Started'), ('documents_uploaded', 'Documents Uploaded'), ('chief_review', 'Under Chief Review'), ('chief_approved', 'Chief Approved'), ('chief_rejected', 'Chief Rejected'), ('do_review', 'Under DO Review'), ('do_approved', 'DO Approved'), ('do_rejected', 'DO Rejected'), ('biometrics_scheduled', 'Biometrics Scheduled'), ('biometrics_taken', 'Biometrics Captured'), ('processing', 'ID Processing'), ('ready_for_collection', 'Ready for Collection'), ('collected', 'ID Collected'), ('rejected', 'Application Rejected'), ('cancelled', 'Application Cancelled')], max_length=30)),
+                ('application_type', models.CharField(choices=[('new', 'New ID Application'), ('replacement', 'ID Replacement'), ('name_change', 'Name Change')], max_length=20)),
+                ('entry_point', models.CharField(choices=[('chief', 'Started from Chief Office'), ('huduma', 'Started from Huduma Centre'), ('online', 'Started Online')], max_length=20)),
+                ('applications', models.IntegerField(default=0)),
+                ('payments', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('collected', models.IntegerField(default=0)),
+                ('processing_seconds', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='idapplication',
+            index=models.Index(fields=['created_at'], name='huduma_idap_created_50351f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nationalid',
+            index=models.Index(fields=['is_collected', 'collected_at'], name='huduma_nati_is_coll_4ef6db_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'paid_at'], name='huduma_paym_status_f96e97_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailystats',
+            name='county',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='huduma.county'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailystats',
+            unique_together={('date', 'county', 'status', 'application_type', 'entry_point')},
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:40
+
+from django.db import migrations, models
+
+
+POSTGRES_INSTALL = [
+    "ALTER TABLE huduma_searchentry ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED",
+    "CREATE INDEX huduma_searchentry_vector_idx ON huduma_searchentry USING GIN (search_vector)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS huduma_searchentry_vector_idx",
+    "ALTER TABLE huduma_searchentry DROP COLUMN IF EXISTS search_vector",
+]
+
+# External-content FTS5 table kept in sync with huduma_searchentry by triggers
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE huduma_searchentry_fts USING fts5("
+    "body, content='huduma_searchentry', content_rowid='id')",
+    "CREATE TRIGGER huduma_searchentry_ai AFTER INSERT ON huduma_searchentry BEGIN "
+    "INSERT INTO huduma_searchentry_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER huduma_searchentry_ad AFTER DELETE ON huduma_searchentry BEGIN "
+    "INSERT INTO huduma_searchentry_fts(huduma_searchentry_fts, rowid, body) VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER huduma_searchentry_au AFTER UPDATE ON huduma_searchentry BEGIN "
+    "INSERT INTO huduma_searchentry_fts(huduma_searchentry_fts, rowid, body) VALUES ('delete', old.id, old.body); "
+    "INSERT INTO huduma_searchentry_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS huduma_searchentry_au",
+    "DROP TRIGGER IF EXISTS huduma_searchentry_ad",
+    "DROP TRIGGER IF EXISTS huduma_searchentry_ai",
+    "DROP TABLE IF EXISTS huduma_searchentry_fts",
+]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0004_dailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('application', 'ID Application'), ('birth_certificate', 'Birth Certificate'), ('national_id', 'National ID'), ('waiting_card', 'Waiting Card')], max_length=30)),
+                ('object_pk', models.CharField(max_length=50)),
+                ('body', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Search Entries',
+                'unique_together': {('kind', 'object_pk')},
+            },
+        ),
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}),
+            run_vendor_sql({'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0005_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('application', 'ID Application'), ('birth_certificate', 'Birth Certificate'), ('national_id', 'National ID')], max_length=30)),
+                ('object_pk', models.CharField(max_length=50)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('token', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=30)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'kind', 'object_pk'], name='huduma_name_key_1e11f7_idx'), models.Index(fields=['token', 'kind', 'object_pk'], name='huduma_name_token_2ea06f_idx'), models.Index(fields=['kind', 'object_pk'], name='huduma_name_kind_8427a2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+# model, parent field, related rows needed to derive the stored values
+LEVELS = (
+    ('Division', 'sub_county', 'sub_county__county'),
+    ('Location', 'division', 'division'),
+    ('SubLocation', 'location', 'location'),
+    ('Village', 'sub_location', 'sub_location'),
+)
+
+
+def backfill_location_paths(apps, schema_editor):
+    """Fill county, path and full_name level by level, so each level reads finished parents"""
+    for model_name, parent_field, related in LEVELS:
+        model = apps.get_model('huduma', model_name)
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).select_related(related).order_by('pk')[:BATCH_SIZE])
+            if not rows:
+                break
+            for row in rows:
+                parent = getattr(row, parent_field)
+                if model_name == 'Division':
+                    county_id = parent.county_id
+                    path = f"{parent.county_id}/{parent.pk}"
+                    full_name = f"{parent.name}, {parent.county.name}"
+                else:
+                    county_id, path, full_name = parent.county_id, parent.path, parent.full_name
+                row.county_id = county_id
+                row.path = f"{path}/{row.pk}"
+                row.full_name = f"{row.name}, {full_name}"
+            model.objects.bulk_update(rows, ['county', 'path', 'full_name'])
+            last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0006_nametoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='division',
+            name='county',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='huduma.county'),
+        ),
+        migrations.AddField(
+            model_name='division',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=600),
+        ),
+        migrations.AddField(
+            model_name='division',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='county',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='huduma.county'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=600),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='sublocation',
+            name='county',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='huduma.county'),
+        ),
+        migrations.AddField(
+            model_name='sublocation',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=600),
+        ),
+        migrations.AddField(
+            model_name='sublocation',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='county',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='huduma.county'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=600),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_location_paths, migrations.RunPython.noop),
+    ]
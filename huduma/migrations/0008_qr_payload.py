@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0007_location_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chiefeligibilityletter',
+            name='qr_payload',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='waitingcard',
+            name='qr_payload',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+    ]
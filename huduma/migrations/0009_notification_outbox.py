@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0008_qr_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='huduma_noti_status_36cefe_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0009_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='mpesa', max_length=20)),
+                ('external_reference', models.CharField(max_length=100, unique=True)),
+                ('account_reference', models.CharField(blank=True, default='', max_length=100)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payer_phone', models.CharField(blank=True, default='', max_length=15)),
+                ('payer_name', models.CharField(blank=True, default='', max_length=200)),
+                ('transaction_time', models.DateTimeField(blank=True, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('matched', 'Matched'), ('duplicate', 'Duplicate'), ('unmatched', 'Needs Review')], default='pending', max_length=20)),
+                ('error_message', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('external_reference__isnull', False), models.Q(('external_reference', ''), _negated=True)), fields=('external_reference',), name='unique_payment_external_reference'),
+        ),
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='callbacks', to='huduma.payment'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentcallback',
+            index=models.Index(fields=['status', 'id'], name='huduma_paym_status_7345a6_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0011_audit_writer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=100)),
+                ('rows', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(choices=[('audit_log', 'Audit Log'), ('status_history', 'Application Status History')], max_length=20)),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('rows', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['table', '-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='applicationstatushistory',
+            index=models.Index(fields=['timestamp'], name='huduma_appl_timesta_705f7d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='applicationstatushistory',
+            index=models.Index(fields=['application', 'timestamp'], name='huduma_appl_applica_2fcfa7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historyarchive',
+            index=models.Index(fields=['table', 'month'], name='huduma_hist_table_918344_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedobject',
+            name='archive',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='huduma.historyarchive'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedobject',
+            index=models.Index(fields=['content_type', 'object_id'], name='huduma_arch_content_aa3744_idx'),
+        ),
+    ]
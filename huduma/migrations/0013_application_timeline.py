@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0012_history_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApplicationTimeline',
+            fields=[
+                ('application', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='timeline', serialize=False, to='huduma.idapplication')),
+                ('application_type', models.CharField(choices=[('new', 'New ID Application'), ('replacement', 'ID Replacement'), ('name_change', 'Name Change')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('documents_uploaded_at', models.DateTimeField(blank=True, null=True)),
+                ('chief_review_at', models.DateTimeField(blank=True, null=True)),
+                ('chief_decided_at', models.DateTimeField(blank=True, null=True)),
+                ('do_review_at', models.DateTimeField(blank=True, null=True)),
+                ('do_decided_at', models.DateTimeField(blank=True, null=True)),
+                ('biometrics_scheduled_at', models.DateTimeField(blank=True, null=True)),
+                ('biometrics_taken_at', models.DateTimeField(blank=True, null=True)),
+                ('processing_at', models.DateTimeField(blank=True, null=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('collected_at', models.DateTimeField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('chief_office', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='huduma.chiefoffice')),
+                ('county', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='huduma.county')),
+                ('do_office', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='huduma.dooffice')),
+                ('huduma_centre', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='huduma.hudumacentre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='huduma_appl_created_e4d397_idx'), models.Index(fields=['collected_at'], name='huduma_appl_collect_4cd34b_idx'), models.Index(fields=['county', 'collected_at'], name='huduma_appl_county__1dadf2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0013_application_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('marked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Stale daily stats',
+                'ordering': ['date'],
+            },
+        ),
+    ]
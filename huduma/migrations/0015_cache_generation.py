@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('huduma', '0014_stale_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
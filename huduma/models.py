@@ -5,9 +5,6 @@ from django.core.validators import RegexValidator
 from django.utils import timezone
 from decimal import Decimal
 import uuid
-import qrcode
-from io import BytesIO
-from django.core.files import File
 from PIL import Image
 import random
 import string
@@ -25,6 +22,12 @@ class County(models.Model):
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        renamed = self.pk is not None and not County.objects.filter(pk=self.pk, name=self.name).exists()
+        super().save(*args, **kwargs)
+        if renamed:
+            refresh_location_paths(Division.objects.filter(sub_county__county=self))
 
 
 class SubCounty(models.Model):
@@ -40,54 +43,135 @@ class SubCounty(models.Model):
     
     def __str__(self):
         return f"{self.name} - {self.county.name}"
+    
+    def save(self, *args, **kwargs):
+        changed = self.pk is not None and not SubCounty.objects.filter(
+            pk=self.pk, name=self.name, county_id=self.county_id
+        ).exists()
+        super().save(*args, **kwargs)
+        if changed:
+            refresh_location_paths(Division.objects.filter(sub_county=self))
+    
+    @property
+    def path(self):
+        return f"{self.county_id}/{self.pk}"
+    
+    @property
+    def full_name(self):
+        return f"{self.name}, {self.county.name}"
 
 
-class Division(models.Model):
-    name = models.CharField(max_length=100)
-    sub_county = models.ForeignKey(SubCounty, on_delete=models.CASCADE, related_name='divisions')
-    created_at = models.DateTimeField(auto_now_add=True)
+class LocationQuerySet(models.QuerySet):
+    def within(self, area):
+        """Rows inside ``area`` (a County, SubCounty or any higher location) using the stored path"""
+        if isinstance(area, County):
+            return self.filter(county=area)
+        return self.filter(path__startswith=f"{area.path}/")
+
+
+class LocationNode(models.Model):
+    """
+    Division, Location, SubLocation and Village store their county, a materialized
+    path of ids (``county/sub_county/division/...``) and their full name so lookups
+    and display never walk the chain of parents. ``save()`` keeps them current for
+    the row and, on a rename or move, for everything below it.
+    """
+    county = models.ForeignKey(County, on_delete=models.CASCADE, related_name='+', null=True, editable=False)
+    path = models.CharField(max_length=100, db_index=True, editable=False, default='')
+    full_name = models.CharField(max_length=600, editable=False, default='')
+    
+    parent_field = None
+    
+    objects = LocationQuerySet.as_manager()
     
     class Meta:
+        abstract = True
         ordering = ['name']
     
     def __str__(self):
-        return f"{self.name} - {self.sub_county.name}"
+        return self.full_name or self.name
+    
+    def location_values(self):
+        """``(county_id, path, full_name)`` derived from the parent row"""
+        parent = getattr(self, self.parent_field)
+        return parent.county_id, f"{parent.path}/{self.pk}", f"{self.name}, {parent.full_name}"
+    
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        previous = (self.county_id, self.path, self.full_name)
+        if not created:
+            self.county_id, self.path, self.full_name = self.location_values()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'county', 'path', 'full_name'}
+        super().save(*args, **kwargs)
+        if created:
+            # The path ends with the row's own id, known only after the insert
+            self.county_id, self.path, self.full_name = self.location_values()
+            type(self)._default_manager.filter(pk=self.pk).update(
+                county_id=self.county_id, path=self.path, full_name=self.full_name,
+            )
+        elif (self.county_id, self.path, self.full_name) != previous:
+            below = LOCATION_LEVELS.index(type(self)) + 1
+            if below < len(LOCATION_LEVELS):
+                child = LOCATION_LEVELS[below]
+                refresh_location_paths(child._default_manager.filter(**{child.parent_field: self}))
+
+
+class Division(LocationNode):
+    name = models.CharField(max_length=100)
+    sub_county = models.ForeignKey(SubCounty, on_delete=models.CASCADE, related_name='divisions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    parent_field = 'sub_county'
 
 
-class Location(models.Model):
+class Location(LocationNode):
     name = models.CharField(max_length=100)
     division = models.ForeignKey(Division, on_delete=models.CASCADE, related_name='locations')
     created_at = models.DateTimeField(auto_now_add=True)
     
-    class Meta:
-        ordering = ['name']
-    
-    def __str__(self):
-        return f"{self.name} - {self.division.name}"
+    parent_field = 'division'
 
 
-class SubLocation(models.Model):
+class SubLocation(LocationNode):
     name = models.CharField(max_length=100)
     location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='sub_locations')
     created_at = models.DateTimeField(auto_now_add=True)
     
-    class Meta:
-        ordering = ['name']
-    
-    def __str__(self):
-        return f"{self.name} - {self.location.name}"
+    parent_field = 'location'
 
 
-class Village(models.Model):
+class Village(LocationNode):
     name = models.CharField(max_length=100)
     sub_location = models.ForeignKey(SubLocation, on_delete=models.CASCADE, related_name='villages')
     created_at = models.DateTimeField(auto_now_add=True)
     
-    class Meta:
-        ordering = ['name']
-    
-    def __str__(self):
-        return f"{self.name} - {self.sub_location.name}"
+    parent_field = 'sub_location'
+
+
+LOCATION_LEVELS = [Division, Location, SubLocation, Village]
+
+
+def refresh_location_paths(queryset, batch_size=1000):
+    """Recompute county, path and full name of the rows in ``queryset`` and of every row below them"""
+    model = queryset.model
+    related = 'sub_county__county' if model is Division else model.parent_field
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).select_related(related).order_by('pk')[:batch_size])
+        if not rows:
+            break
+        for row in rows:
+            row.county_id, row.path, row.full_name = row.location_values()
+        model._default_manager.bulk_update(rows, ['county', 'path', 'full_name'])
+        last_pk = rows[-1].pk
+
+    below = LOCATION_LEVELS.index(model) + 1
+    if below < len(LOCATION_LEVELS):
+        child = LOCATION_LEVELS[below]
+        refresh_location_paths(
+            child._default_manager.filter(**{f'{child.parent_field}__in': queryset.values('pk')}), batch_size,
+        )
 
 
 # User Management
@@ -378,6 +462,10 @@ class IDApplication(models.Model):
         ('mutilated', 'Mutilated'),
     )
     
+    # Statuses before submission, and those that stamp approved_at when first reached
+    UNSUBMITTED_STATUSES = ('started', 'documents_uploaded')
+    APPROVAL_STATUSES = ('do_approved', 'biometrics_scheduled')
+    
     # Basic Application Info
     application_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     application_number = models.CharField(max_length=50, unique=True)
@@ -454,25 +542,47 @@ class IDApplication(models.Model):
     submitted_at = models.DateTimeField(null=True, blank=True)
     approved_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
+    def stamp_status_timestamps(self):
+        """Set submitted_at / approved_at the first time the status calls for them; returns the fields set"""
+        stamped = []
+        if not self.submitted_at and self.status not in self.UNSUBMITTED_STATUSES:
+            self.submitted_at = timezone.now()
+            stamped.append('submitted_at')
+        if not self.approved_at and self.status in self.APPROVAL_STATUSES:
+            self.approved_at = timezone.now()
+            stamped.append('approved_at')
+        return stamped
+    
     def save(self, *args, **kwargs):
         if not self.application_number:
             self.application_number = self.generate_application_number()
         
-        if not self.submitted_at and self.status not in ['started', 'documents_uploaded']:
-            self.submitted_at = timezone.now()
-        
-        if not self.approved_at and self.status in ['do_approved', 'biometrics_scheduled']:
-            self.approved_at = timezone.now()
+        # Timestamps only move with the status, so saves that leave it alone skip the checks
+        if self._state.adding or self.status != getattr(self, '_loaded_status', None):
+            stamped = self.stamp_status_timestamps()
+            if stamped and kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], *stamped}
         
         super().save(*args, **kwargs)
+        self._loaded_status = self.status
     
     def generate_application_number(self):
-        """Generate unique application number"""
-        year = timezone.now().year
-        while True:
-            number = f"ID{year}{random.randint(100000, 999999)}"
-            if not IDApplication.objects.filter(application_number=number).exists():
-                return number
+        """Generate unique application number from the block-allocated sequence"""
+        from .numbering import application_numbers
+        period, value = application_numbers.next_value()
+        # 7 digits keeps sequence numbers disjoint from the legacy random 6-digit ones
+        return f"ID{period}{value:07d}"
     
     def __str__(self):
         return f"ID Application - {self.full_name} ({self.application_number})"
@@ -517,6 +627,7 @@ class ChiefEligibilityLetter(models.Model):
     
     # Digital verification
     qr_code = models.ImageField(upload_to='chief_letters/qr_codes/', null=True, blank=True)
+    qr_payload = models.CharField(max_length=500, blank=True, default='')  # Rendered on demand by qr.py
     verification_code = models.CharField(max_length=100, unique=True)
     digital_signature = models.TextField(null=True, blank=True)  # Can store encrypted signature
     
@@ -536,31 +647,26 @@ class ChiefEligibilityLetter(models.Model):
         if not self.expires_at:
             self.expires_at = timezone.now() + timezone.timedelta(days=30)
         
-        # Generate QR Code
-        if not self.qr_code:
-            qr_data = {
-                'type': 'CHIEF_ELIGIBILITY_LETTER',
-                'letter_number': self.letter_number,
-                'verification_code': self.verification_code,
-                'application_id': str(self.application.application_id),
-                'chief_stamp': self.chief.stamp_serial,
-                'issued_date': self.issued_at.strftime('%Y-%m-%d') if self.issued_at else timezone.now().strftime('%Y-%m-%d')
-            }
-            
-            qr_string = f"{qr_data['type']}|{qr_data['letter_number']}|{qr_data['verification_code']}|{qr_data['application_id']}|{qr_data['chief_stamp']}|{qr_data['issued_date']}"
-            
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_string)
-            qr.make(fit=True)
-            
-            qr_image = qr.make_image(fill_color="black", back_color="white")
-            qr_io = BytesIO()
-            qr_image.save(qr_io, 'PNG')
-            qr_file = File(qr_io, name=f'chief_letter_{self.letter_number}.png')
-            self.qr_code.save(f'chief_letter_{self.letter_number}.png', qr_file, save=False)
-        
+        # Only the QR payload is stored here; qr.py renders the image in the background
+        if not self.qr_code and not self.qr_payload:
+            self.qr_payload = self.build_qr_payload()
+
         super().save(*args, **kwargs)
-    
+
+    @property
+    def qr_url(self):
+        """URL of the QR code image, rendered on demand (see qr.py)"""
+        from .qr import qr_url
+        return qr_url(self)
+
+    def build_qr_payload(self):
+        """Text encoded in the letter's QR code"""
+        issued_date = self.issued_at.strftime('%Y-%m-%d') if self.issued_at else timezone.now().strftime('%Y-%m-%d')
+        return (
+            f"CHIEF_ELIGIBILITY_LETTER|{self.letter_number}|{self.verification_code}|"
+            f"{self.application.application_id}|{self.chief.stamp_serial}|{issued_date}"
+        )
+
     def generate_letter_number(self):
         """Generate unique letter number"""
         chief_code = self.chief.office.location.name[:3].upper()
@@ -661,6 +767,7 @@ class WaitingCard(models.Model):
     
     # QR Code for tracking
     qr_code = models.ImageField(upload_to='waiting_cards/qr_codes/', null=True, blank=True)
+    qr_payload = models.CharField(max_length=500, blank=True, default='')  # Rendered on demand by qr.py
     
     # Status
     is_active = models.BooleanField(default=True)
@@ -672,22 +779,25 @@ class WaitingCard(models.Model):
         if not self.serial_number:
             self.serial_number = self.generate_serial_number()
         
-        # Generate QR Code for waiting card
-        if not self.qr_code:
-            qr_data = f"WAITING_CARD|{self.serial_number}|{self.application.application_id}|{self.expected_collection_date.strftime('%Y-%m-%d')}"
-            
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            qr_image = qr.make_image(fill_color="black", back_color="white")
-            qr_io = BytesIO()
-            qr_image.save(qr_io, 'PNG')
-            qr_file = File(qr_io, name=f'waiting_card_{self.serial_number}.png')
-            self.qr_code.save(f'waiting_card_{self.serial_number}.png', qr_file, save=False)
-        
+        # Only the QR payload is stored here; qr.py renders the image in the background
+        if not self.qr_code and not self.qr_payload:
+            self.qr_payload = self.build_qr_payload()
+
         super().save(*args, **kwargs)
-    
+
+    @property
+    def qr_url(self):
+        """URL of the QR code image, rendered on demand (see qr.py)"""
+        from .qr import qr_url
+        return qr_url(self)
+
+    def build_qr_payload(self):
+        """Text encoded in the card's QR code"""
+        return (
+            f"WAITING_CARD|{self.serial_number}|{self.application.application_id}|"
+            f"{self.expected_collection_date.strftime('%Y-%m-%d')}"
+        )
+
     def generate_serial_number(self):
         """Generate unique waiting card serial number"""
         while True:
@@ -752,6 +862,11 @@ class NationalID(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_collected', 'collected_at']),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.id_number:
             self.id_number = self.generate_id_number()
@@ -762,12 +877,9 @@ class NationalID(models.Model):
         super().save(*args, **kwargs)
     
     def generate_id_number(self):
-        """Generate unique National ID number"""
-        while True:
-            # Kenyan ID format: 8 digits
-            id_num = f"{random.randint(10000000, 99999999)}"
-            if not NationalID.objects.filter(id_number=id_num).exists():
-                return id_num
+        """Claim the next National ID number from the pre-generated pool"""
+        from .numbering import claim_id_numbers
+        return claim_id_numbers(1)[0]
     
     def generate_serial_number(self):
         """Generate unique ID serial number"""
@@ -803,11 +915,68 @@ class ApplicationStatusHistory(models.Model):
     class Meta:
         ordering = ['-timestamp']
         verbose_name_plural = "Application Status Histories"
+        indexes = [
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['application', 'timestamp']),
+        ]
     
     def __str__(self):
         return f"{self.application.application_number} - {self.get_new_status_display()} at {self.timestamp}"
 
 
+class ApplicationTimeline(models.Model):
+    """When an application first reached each stage, one row per application (see timeline.py)"""
+    # status -> column stamped the first time an application reaches it
+    STATUS_COLUMNS = {
+        'documents_uploaded': 'documents_uploaded_at',
+        'chief_review': 'chief_review_at',
+        'chief_approved': 'chief_decided_at',
+        'chief_rejected': 'chief_decided_at',
+        'do_review': 'do_review_at',
+        'do_approved': 'do_decided_at',
+        'do_rejected': 'do_decided_at',
+        'biometrics_scheduled': 'biometrics_scheduled_at',
+        'biometrics_taken': 'biometrics_taken_at',
+        'processing': 'processing_at',
+        'ready_for_collection': 'ready_at',
+        'collected': 'collected_at',
+        'rejected': 'closed_at',
+        'cancelled': 'closed_at',
+    }
+
+    application = models.OneToOneField(IDApplication, on_delete=models.CASCADE, primary_key=True, related_name='timeline')
+
+    # Copied from the application so durations group without a join
+    application_type = models.CharField(max_length=20, choices=IDApplication.APPLICATION_TYPES)
+    county = models.ForeignKey(County, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    chief_office = models.ForeignKey(ChiefOffice, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    do_office = models.ForeignKey(DOOffice, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    huduma_centre = models.ForeignKey(HudumaCentre, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    created_at = models.DateTimeField()
+    documents_uploaded_at = models.DateTimeField(null=True, blank=True)
+    chief_review_at = models.DateTimeField(null=True, blank=True)
+    chief_decided_at = models.DateTimeField(null=True, blank=True)
+    do_review_at = models.DateTimeField(null=True, blank=True)
+    do_decided_at = models.DateTimeField(null=True, blank=True)
+    biometrics_scheduled_at = models.DateTimeField(null=True, blank=True)
+    biometrics_taken_at = models.DateTimeField(null=True, blank=True)
+    processing_at = models.DateTimeField(null=True, blank=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    collected_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['collected_at']),
+            models.Index(fields=['county', 'collected_at']),
+        ]
+
+    def __str__(self):
+        return f"Timeline of application {self.application_id}"
+
+
 # Notification System
 class NotificationTemplate(models.Model):
     """Templates for different types of notifications"""
@@ -855,6 +1024,11 @@ class Notification(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     error_message = models.TextField(null=True, blank=True)
     
+    # Outbox bookkeeping (see dispatch.py)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    
     # Delivery tracking
     sent_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
@@ -862,6 +1036,11 @@ class Notification(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
     def __str__(self):
         return f"{self.get_notification_type_display()} to {self.recipient_contact}"
 
@@ -927,6 +1106,19 @@ class Payment(models.Model):
     paid_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'paid_at']),
+        ]
+        constraints = [
+            # One payment per gateway transaction; callbacks are retried
+            models.UniqueConstraint(
+                fields=['external_reference'],
+                condition=models.Q(external_reference__isnull=False) & ~models.Q(external_reference=''),
+                name='unique_payment_external_reference',
+            ),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.payment_reference:
             self.payment_reference = f"PAY{random.randint(1000000, 9999999)}"
@@ -936,6 +1128,40 @@ class Payment(models.Model):
         return f"Payment {self.payment_reference} - KES {self.amount}"
 
 
+class PaymentCallback(models.Model):
+    """Raw payment confirmations from the gateway, staged for payments.process_callbacks"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('matched', 'Matched'),
+        ('duplicate', 'Duplicate'),
+        ('unmatched', 'Needs Review'),
+    )
+    
+    provider = models.CharField(max_length=20, default='mpesa')
+    external_reference = models.CharField(max_length=100, unique=True)  # M-Pesa TransID
+    account_reference = models.CharField(max_length=100, blank=True, default='')  # BillRefNumber
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payer_phone = models.CharField(max_length=15, blank=True, default='')
+    payer_name = models.CharField(max_length=200, blank=True, default='')
+    transaction_time = models.DateTimeField(null=True, blank=True)
+    payload = models.JSONField()
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='callbacks')
+    error_message = models.TextField(blank=True, default='')
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider} {self.external_reference} - KES {self.amount}"
+
+
 # System Configuration
 class SystemSettings(models.Model):
     """System-wide settings and configurations"""
@@ -961,6 +1187,104 @@ class SystemSettings(models.Model):
         return f"{self.key} = {self.value}"
 
 
+class NumberSequence(models.Model):
+    """Counter rows backing block-allocated document numbers (see numbering.py)"""
+    name = models.CharField(max_length=50)
+    period = models.CharField(max_length=10, blank=True, default='')  # e.g. '2025' for yearly rollover
+    next_value = models.BigIntegerField(default=1)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['name', 'period']
+
+    def __str__(self):
+        return f"{self.name} [{self.period or '-'}] next={self.next_value}"
+
+
+class CacheGeneration(models.Model):
+    """Counters that tell processes their in-memory copies are out of date (see generations.py)"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=1)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class IDNumberPool(models.Model):
+    """Pre-shuffled pool of unissued National ID numbers with a check digit (see numbering.py)"""
+    id_number = models.CharField(max_length=20, unique=True)
+    claim_token = models.CharField(max_length=32, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Rows are inserted in shuffled order, so claiming by id hands out random-looking numbers
+        indexes = [
+            models.Index(fields=['claimed_at', 'id']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"{self.id_number} ({'claimed' if self.claimed_at else 'available'})"
+
+
+# Search
+class SearchEntry(models.Model):
+    """
+    Normalized search text for one record (see search.py).
+
+    The ``body`` column is indexed outside the ORM: by an FTS5 table on SQLite and by
+    a generated ``tsvector`` column with a GIN index on Postgres (migration 0005).
+    """
+    KINDS = (
+        ('application', 'ID Application'),
+        ('birth_certificate', 'Birth Certificate'),
+        ('national_id', 'National ID'),
+        ('waiting_card', 'Waiting Card'),
+    )
+    
+    kind = models.CharField(max_length=30, choices=KINDS)
+    object_pk = models.CharField(max_length=50)
+    body = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['kind', 'object_pk']
+        verbose_name_plural = "Search Entries"
+    
+    def __str__(self):
+        return f"{self.kind} {self.object_pk}"
+
+
+class NameToken(models.Model):
+    """One normalized token of a person's full name with its phonetic key (see names.py)"""
+    KINDS = (
+        ('application', 'ID Application'),
+        ('birth_certificate', 'Birth Certificate'),
+        ('national_id', 'National ID'),
+    )
+    
+    kind = models.CharField(max_length=30, choices=KINDS)
+    object_pk = models.CharField(max_length=50)
+    position = models.PositiveSmallIntegerField()
+    token = models.CharField(max_length=50)
+    key = models.CharField(max_length=30)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'kind', 'object_pk']),
+            models.Index(fields=['token', 'kind', 'object_pk']),
+            models.Index(fields=['kind', 'object_pk']),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} ({self.key})"
+
+
 # Audit and Security
 class AuditLog(models.Model):
     """Comprehensive audit trail for all system activities"""
@@ -977,7 +1301,7 @@ class AuditLog(models.Model):
         ('collect', 'Collect'),
     )
     
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='audit_logs')
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_logs')
     action = models.CharField(max_length=20, choices=ACTION_TYPES)
     
     # Object being acted upon
@@ -990,7 +1314,7 @@ class AuditLog(models.Model):
     notes = models.TextField(null=True, blank=True)
     
     # Request details
-    ip_address = models.GenericIPAddressField()
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(null=True, blank=True)
     session_key = models.CharField(max_length=100, null=True, blank=True)
     
@@ -1002,7 +1326,7 @@ class AuditLog(models.Model):
         ('online', 'Online'),
     ], null=True, blank=True)
     
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # when the event happened, not when it was written
     
     class Meta:
         ordering = ['-timestamp']
@@ -1013,7 +1337,48 @@ class AuditLog(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.user.username} {self.action} {self.content_type} at {self.timestamp}"
+        return f"{self.user.username if self.user else 'system'} {self.action} {self.content_type} at {self.timestamp}"
+
+
+class HistoryArchive(models.Model):
+    """A file of AuditLog or ApplicationStatusHistory rows moved out of the database (see archive.py)"""
+    TABLES = (
+        ('audit_log', 'Audit Log'),
+        ('status_history', 'Application Status History'),
+    )
+
+    table = models.CharField(max_length=20, choices=TABLES)
+    month = models.DateField()  # first day of the month the rows are from
+    path = models.CharField(max_length=255, unique=True)  # relative to HUDUMA_ARCHIVE['directory']
+    rows = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['table', '-month']
+        indexes = [
+            models.Index(fields=['table', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_table_display()} {self.month:%Y-%m} ({self.rows} rows)"
+
+
+class ArchivedObject(models.Model):
+    """An object with rows in a HistoryArchive file, so its archived history is found without reading every file"""
+    archive = models.ForeignKey(HistoryArchive, on_delete=models.CASCADE, related_name='entries')
+    content_type = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=100)
+    rows = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} {self.object_id} in {self.archive.path}"
 
 
 class SecurityIncident(models.Model):
@@ -1056,6 +1421,50 @@ class SecurityIncident(models.Model):
 
 
 # Reporting and Analytics
+class DailyStats(models.Model):
+    """
+    Daily rollup of applications, revenue and collections (see stats.py).
+
+    Each row holds the measures for one day and one combination of dimensions taken
+    from the application: current county, status, type and entry point.
+    """
+    date = models.DateField()
+    county = models.ForeignKey(County, on_delete=models.CASCADE, related_name='daily_stats')
+    status = models.CharField(max_length=30, choices=IDApplication.APPLICATION_STATUS)
+    application_type = models.CharField(max_length=20, choices=IDApplication.APPLICATION_TYPES)
+    entry_point = models.CharField(max_length=20, choices=IDApplication.ENTRY_POINTS)
+    
+    # Measures, each counted on the day its event happened
+    applications = models.IntegerField(default=0)  # Applications created
+    payments = models.IntegerField(default=0)  # Completed payments received
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    collected = models.IntegerField(default=0)  # National IDs collected
+    processing_seconds = models.BigIntegerField(default=0)  # Application-to-collection time of those IDs
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['date', 'county', 'status', 'application_type', 'entry_point']
+        ordering = ['-date']
+        verbose_name_plural = "Daily Stats"
+    
+    def __str__(self):
+        return f"{self.date} {self.county_id} {self.status}: {self.applications} applications"
+
+
+class StaleDailyStats(models.Model):
+    """A day whose DailyStats rows wait to be recomputed by ``refresh_daily_stats`` (see stats.py)"""
+    date = models.DateField(unique=True)
+    marked_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['date']
+        verbose_name_plural = "Stale daily stats"
+
+    def __str__(self):
+        return f"{self.date} (marked {self.marked_at:%Y-%m-%d %H:%M})"
+
+
 class Report(models.Model):
     """System reports and analytics"""
     REPORT_TYPES = (
@@ -0,0 +1,302 @@
+# names.py
+"""
+Phonetic and fuzzy matching of person names.
+
+Every ``full_name`` of an ID application, birth certificate and National ID is
+split into tokens, and each token is stored in ``NameToken`` with its
+normalized spelling and a phonetic key. The key is a consonant skeleton built
+for the way Kenyan names vary in writing:
+
+* apostrophes, hyphens and accents are dropped (``Chepng'eno`` = ``Chepngeno``)
+* ``ch``/``j`` (``Chebet``/``Jebet``), ``r``/``l`` (``Wanjiru``/``Wanjilu``),
+  ``k``/``g``/``c``/``q``, ``t``/``d``/``th``/``dh`` (``Adhiambo``/``Atiambo``),
+  ``b``/``p``, ``s``/``z``/``sh`` and ``f``/``v``/``ph`` fall together
+* prenasalised consonants lose their nasal (``Nyambura``/``Nyabura``,
+  ``Njenga``/``Nchenga``)
+* vowels after the first letter, ``h`` and ``y`` are ignored and doubled
+  letters collapse (``Otienno``/``Otieno``, ``Muthoni``/``Mutoni``)
+* an initial vowel is kept as ``A``, ``E`` (e/i) or ``O`` (o/u), so the Luo
+  ``O-``/``A-`` pairs stay apart (``Ochieng``/``Achieng``) while
+  ``Owuor``/``Uwuor`` do not
+
+``match_names`` finds the records sharing phonetic keys with the query through
+the ``(key, kind, object_pk)`` index, then ranks those candidates by how
+closely their tokens match the query tokens. The table is kept current by the
+signal handlers in ``signals.py``; ``manage.py rebuild_name_index`` rebuilds
+it after bulk writes.
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from django.apps import apps
+from django.db.models import Exists, OuterRef
+
+
+# kind -> model whose full_name is indexed
+NAME_MODELS = {
+    'application': 'huduma.IDApplication',
+    'birth_certificate': 'huduma.BirthCertificate',
+    'national_id': 'huduma.NationalID',
+}
+
+DIGRAPHS = {
+    'ng': 'K', 'ny': 'N', 'nj': 'J', 'mb': 'P', 'nd': 'T',
+    'ch': 'J', 'sh': 'S', 'th': 'T', 'dh': 'T', 'ph': 'F', 'gh': 'K',
+}
+
+LETTERS = {
+    'b': 'P', 'p': 'P', 'c': 'K', 'g': 'K', 'k': 'K', 'q': 'K', 'd': 'T', 't': 'T',
+    'j': 'J', 'l': 'R', 'r': 'R', 's': 'S', 'z': 'S', 'f': 'F', 'v': 'F',
+    'm': 'M', 'n': 'N', 'w': 'W', 'x': 'KS',
+}
+
+VOWELS = 'aeiouy'
+INITIAL_VOWELS = {'a': 'A', 'e': 'E', 'i': 'E', 'o': 'O', 'u': 'O'}
+
+MAX_TOKEN_LENGTH = 50
+CANDIDATE_FACTOR = 10  # candidates fetched per requested match before ranking
+
+
+def name_model(kind):
+    return apps.get_model(NAME_MODELS[kind])
+
+
+def normalize_token(value):
+    """Lower-case ASCII letters of one name token"""
+    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z]', '', value.lower())[:MAX_TOKEN_LENGTH]
+
+
+def name_tokens(name):
+    """Split a full name into normalized tokens"""
+    tokens = (normalize_token(part) for part in re.split(r"[\s,.\-/]+", name or ''))
+    return [token for token in tokens if token]
+
+
+def phonetic_key(token):
+    """Consonant skeleton of a normalized token; see the module docstring"""
+    if not token:
+        return ''
+    key = []
+    previous = None
+    index = 0
+    if token[0] in INITIAL_VOWELS:
+        key.append(INITIAL_VOWELS[token[0]])
+        index = 1
+    while index < len(token):
+        pair = token[index:index + 2]
+        if pair in DIGRAPHS:
+            code = DIGRAPHS[pair]
+            index += 2
+        elif token[index] in 'mn' and pair[1:] and pair[1] not in VOWELS + 'w':
+            # A nasal before another consonant is often dropped or misheard (Nchenga/Njenga)
+            index += 1
+            continue
+        else:
+            code = LETTERS.get(token[index])
+            index += 1
+        # Doubled letters collapse, letters repeated across a vowel do not (Nganga)
+        if code and code != previous:
+            key.append(code)
+        previous = code
+    return ''.join(key)
+
+
+# Maintaining the index
+def name_token_rows(kind, object_pk, name):
+    """Unsaved ``NameToken`` rows for one record"""
+    from .models import NameToken
+
+    return [
+        NameToken(kind=kind, object_pk=str(object_pk), position=position, token=token, key=phonetic_key(token))
+        for position, token in enumerate(name_tokens(name))
+    ]
+
+
+def index_names(kind, rows):
+    """(Re)index ``(pk, full_name)`` rows of ``kind``; returns the number of records indexed"""
+    from .models import NameToken
+
+    rows = list(rows)
+    if not rows:
+        return 0
+    NameToken.objects.filter(kind=kind, object_pk__in=[str(pk) for pk, _ in rows]).delete()
+    NameToken.objects.bulk_create(
+        [token for pk, name in rows for token in name_token_rows(kind, pk, name)],
+        batch_size=1000,
+    )
+    return len(rows)
+
+
+def reindex_name(instance, update_fields=None):
+    """Refresh the tokens of a saved record whose model is indexed"""
+    for kind, label in NAME_MODELS.items():
+        if label == instance._meta.label:
+            if update_fields is None or 'full_name' in update_fields:
+                index_names(kind, [(instance.pk, instance.full_name)])
+
+
+def unindex_name(instance):
+    from .models import NameToken
+
+    for kind, label in NAME_MODELS.items():
+        if label == instance._meta.label:
+            NameToken.objects.filter(kind=kind, object_pk=str(instance.pk)).delete()
+
+
+def rebuild_name_index(kind, batch_size=2000):
+    """Recreate every token of ``kind``; yields the running count after each batch"""
+    from .models import NameToken
+
+    model = name_model(kind)
+    NameToken.objects.filter(kind=kind).delete()
+
+    total = 0
+    last_pk = None
+    while True:
+        queryset = model._default_manager.order_by('pk')
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        rows = list(queryset.values_list('pk', 'full_name')[:batch_size])
+        if not rows:
+            break
+        NameToken.objects.bulk_create(
+            [token for pk, name in rows for token in name_token_rows(kind, pk, name)],
+            batch_size=1000,
+        )
+        total += len(rows)
+        last_pk = rows[-1][0]
+        yield total
+
+
+# Matching
+def token_similarity(query_token, query_key, token, key):
+    """Score in [0, 1] of a stored token against one query token"""
+    if token == query_token:
+        return 1.0
+    ratio = SequenceMatcher(None, query_token, token).ratio()
+    if key == query_key:
+        return 0.75 + 0.2 * ratio
+    if token.startswith(query_token) or key.startswith(query_key):
+        return 0.5 + 0.2 * ratio
+    return 0.5 * ratio
+
+
+def rank_candidate(query, tokens, similarities):
+    """Score a candidate's ``(token, key)`` list against the query's; ``similarities`` memoizes token pairs"""
+    score = 0
+    for query_token, query_key in query:
+        best = 0
+        for token, key in tokens:
+            pair = (query_token, token)
+            if pair not in similarities:
+                similarities[pair] = token_similarity(query_token, query_key, token, key)
+            best = max(best, similarities[pair])
+        score += best
+    score /= len(query)
+    # Prefer candidates without extra names the query did not mention
+    return score - 0.02 * max(len(tokens) - len(query), 0)
+
+
+def records_with(kinds, field, values, size):
+    """Up to ``size`` ``(kind, object_pk)`` of records with a token whose ``field`` takes every one of ``values``"""
+    from .models import NameToken
+
+    first, *rest = values
+    queryset = NameToken.objects.filter(kind__in=kinds, **{field: first})
+    for value in rest:
+        queryset = queryset.filter(Exists(NameToken.objects.filter(
+            kind=OuterRef('kind'), object_pk=OuterRef('object_pk'), **{field: value},
+        )))
+    return list(queryset.values_list('kind', 'object_pk').distinct()[:size])
+
+
+def match_names(name, kinds=None, limit=20):
+    """
+    Return up to ``limit`` ranked matches for ``name`` as dicts with ``kind``,
+    ``object_pk``, ``name`` (the stored tokens) and ``score``.
+
+    Candidates are gathered from the records with every query token, then with
+    every phonetic key, then with all keys but one, until enough are found.
+    Each step is an index intersection that stops at the first ``limit *
+    CANDIDATE_FACTOR`` rows, so common names cost no more than rare ones.
+    """
+    from .models import NameToken
+
+    kinds = list(kinds or NAME_MODELS)
+    query = [(token, phonetic_key(token)) for token in name_tokens(name)]
+    if not query:
+        return []
+
+    size = limit * CANDIDATE_FACTOR
+    tokens = sorted({token for token, _ in query})
+    keys = sorted({key for _, key in query})
+    steps = [('token', tokens, size), ('key', keys, size)]
+    if len(keys) > 1:
+        steps.extend(('key', [key for key in keys if key != omitted], limit) for omitted in keys)
+
+    candidates = {}
+    for field, values, wanted in steps:
+        if len(candidates) >= wanted:
+            continue
+        for candidate in records_with(kinds, field, values, size):
+            candidates.setdefault(candidate, None)
+    if not candidates:
+        return []
+
+    stored = {}
+    for kind in kinds:
+        pks = [object_pk for candidate_kind, object_pk in candidates if candidate_kind == kind]
+        if not pks:
+            continue
+        rows = NameToken.objects.filter(kind=kind, object_pk__in=pks).order_by('position')
+        for object_pk, token, key in rows.values_list('object_pk', 'token', 'key'):
+            stored.setdefault((kind, object_pk), []).append((token, key))
+
+    similarities = {}
+    matches = [
+        {
+            'kind': kind,
+            'object_pk': object_pk,
+            'name': ' '.join(token for token, _ in tokens),
+            'score': round(rank_candidate(query, tokens, similarities), 4),
+        }
+        for (kind, object_pk), tokens in stored.items()
+    ]
+    matches.sort(key=lambda match: (-match['score'], match['name']))
+    return matches[:limit]
+
+
+# Misspelled queries for recall tests and benchmarks
+SPELLING_VARIANTS = (
+    ('ch', 'j'), ('j', 'ch'), ('r', 'l'), ('l', 'r'), ('k', 'g'), ('g', 'k'), ('dh', 'd'), ('th', 't'),
+    ("'", ''), ('ng', "ng'"), ('mb', 'b'), ('i', 'e'), ('e', 'i'), ('o', 'u'), ('u', 'o'),
+    ('tt', 't'), ('t', 'tt'), ('ny', 'n'),
+)
+
+
+def misspell(name, rng, known=frozenset()):
+    """``name`` with one of ``SPELLING_VARIANTS`` applied that does not spell a token in ``known``"""
+    lowered = name.lower()
+    variants = []
+    for old, new in SPELLING_VARIANTS:
+        for i in range(len(lowered)):
+            if lowered.startswith(old, i):
+                variant = lowered[:i] + new + lowered[i + len(old):]
+                if variant.replace("'", '') not in known:
+                    variants.append(variant)
+    return rng.choice(variants).capitalize() if variants else name + 'h'
+
+
+def misspelled_names(groups, rng):
+    """
+    Yield ``(query, tokens)`` for every first name of ``groups`` (``generate_ids`` name groups)
+    with a surname of its group: both names misspelled, and the tokens of the real spelling.
+    """
+    groups = list(groups)
+    known = {token for names in groups for values in names.values() for token in name_tokens(' '.join(values))}
+    for names in groups:
+        for first in sorted(set(names['male'] + names['female'])):
+            surname = rng.choice(names['surnames'])
+            yield f'{misspell(first, rng, known)} {misspell(surname, rng, known)}', set(name_tokens(f'{first} {surname}'))
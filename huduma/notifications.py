@@ -0,0 +1,147 @@
+# notifications.py
+"""
+Queueing of applicant notifications.
+
+Notifications are created as ``pending`` rows from the active
+``NotificationTemplate`` rows whose ``trigger_status`` matches the new status
+of an application, in the transaction that changes the status. ``dispatch.py``
+delivers them later from this outbox. Templates use Django template
+syntax with ``application``, ``status`` and ``status_display`` in the context,
+e.g. ``Dear {{ application.full_name }}, your application
+{{ application.application_number }} is now {{ status_display }}.``
+Messages are plain text, so nothing is HTML-escaped.
+
+``template_registry()`` holds every active template compiled and grouped by
+trigger status, loaded once per process. Saving or deleting a template bumps
+the ``notification_templates`` generation counter (see ``signals.py`` and
+``generations.py``) and every process recompiles on its next lookup after it
+notices, as the gazetteer does.
+``render_messages`` renders a batch against one shared context, pushing
+only the application for each message.
+"""
+import threading
+
+from django.template import Context, Template
+
+from .generations import bump_generation, current_generation
+from .models import IDApplication, Notification, NotificationTemplate
+
+
+# notification_type of a template -> channels it is sent on
+CHANNELS = {
+    'sms': ('sms',),
+    'email': ('email',),
+    'both': ('sms', 'email'),
+}
+
+NOTIFICATION_BATCH_SIZE = 1000
+
+GENERATION = 'notification_templates'
+
+STATUS_DISPLAY = dict(IDApplication.APPLICATION_STATUS)
+
+_registry = None
+_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """A ``NotificationTemplate`` with its subject and message parsed"""
+
+    def __init__(self, template):
+        self.template = template
+        self.channels = CHANNELS[template.notification_type]
+        self.subject = Template(template.subject)
+        self.message = Template(template.message_template)
+
+
+class TemplateRegistry:
+    """Active notification templates compiled once, by trigger status"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.by_status = {}
+        for template in NotificationTemplate.objects.filter(is_active=True).order_by('pk'):
+            self.by_status.setdefault(template.trigger_status, []).append(CompiledTemplate(template))
+
+    def for_status(self, status):
+        return self.by_status.get(status, [])
+
+
+def templates_generation():
+    return current_generation(GENERATION)
+
+
+def template_registry():
+    """Return the current registry, recompiling it if a template changed since it was built"""
+    global _registry
+    generation = templates_generation()
+    registry = _registry
+    if registry is None or registry.generation != generation:
+        with _lock:
+            if _registry is None or _registry.generation != generation:
+                _registry = TemplateRegistry(generation)
+            registry = _registry
+    return registry
+
+
+def invalidate_templates():
+    """Make every process recompile the templates once the current transaction commits"""
+    bump_generation(GENERATION)
+
+
+def notification_context(status):
+    """Template context shared by every status notification of a batch; the application is pushed per message"""
+    return Context({
+        'status': status,
+        'status_display': STATUS_DISPLAY.get(status, status),
+    }, autoescape=False)
+
+
+def recipient_contact(application, channel):
+    """Phone number or email address of the applicant for ``channel``, or None"""
+    return application.phone_number if channel == 'sms' else application.email
+
+
+def render_messages(applications, status, compiled):
+    """Yield ``(application, compiled template, subject, message)`` for every application and template"""
+    context = notification_context(status)
+    for application in applications:
+        with context.push(application=application):
+            for template in compiled:
+                yield application, template, template.subject.render(context), template.message.render(context)
+
+
+def build_notifications(applications, status, compiled=None):
+    """Render unsaved ``Notification`` rows for ``applications`` from the registry (or ``compiled``)"""
+    if compiled is None:
+        compiled = template_registry().for_status(status)
+    for application, template, subject, message in render_messages(applications, status, compiled):
+        for channel in template.channels:
+            contact = recipient_contact(application, channel)
+            if not contact:
+                continue
+            yield Notification(
+                application=application,
+                recipient_id=application.applicant_id,
+                template=template.template,
+                notification_type=channel,
+                recipient_contact=contact,
+                subject=subject,
+                message=message,
+            )
+
+
+def enqueue_status_notifications(application_ids, status, batch_size=NOTIFICATION_BATCH_SIZE):
+    """Queue the notifications for applications that just moved to ``status``; returns the count"""
+    compiled = template_registry().for_status(status)
+    if not compiled:
+        return 0
+
+    queued = 0
+    application_ids = list(application_ids)
+    for start in range(0, len(application_ids), batch_size):
+        applications = IDApplication.objects.filter(pk__in=application_ids[start:start + batch_size])
+        notifications = list(build_notifications(applications, status, compiled))
+        Notification.objects.bulk_create(notifications, batch_size=batch_size)
+        queued += len(notifications)
+    return queued
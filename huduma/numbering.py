@@ -0,0 +1,275 @@
+# numbering.py
+"""
+Block-allocated number sequences.
+
+Every process reserves a block of values (``block_size`` at a time) from a
+counter row in ``NumberSequence`` with a single ``UPDATE ... RETURNING`` and
+then hands numbers out of memory, so creating a record costs no extra query
+for its number. Blocks are never shared between processes, which keeps the
+scheme safe across gunicorn workers and nodes; the price is that numbers left
+in a block when a process exits are skipped.
+
+Sequences are configured through ``settings.HUDUMA_SEQUENCES``::
+
+    HUDUMA_SEQUENCES = {
+        'application_number': {'block_size': 1000, 'rollover': 'yearly'},
+    }
+
+``rollover`` is one of ``'yearly'``, ``'monthly'`` or ``'never'``.
+
+National ID numbers are different: they must look random, so they come from
+``IDNumberPool``, a pre-shuffled table of unissued numbers topped up offline
+by ``manage.py top_up_id_pool``. Each number is seven digits plus a Luhn
+check digit.
+"""
+import os
+import random
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+
+SEQUENCE_DEFAULTS = {
+    'block_size': 1000,
+    'rollover': 'yearly',
+}
+
+
+def sequence_config(name):
+    """Return the effective configuration for a named sequence"""
+    config = dict(SEQUENCE_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_SEQUENCES', {}).get(name, {}))
+    return config
+
+
+def current_period(rollover):
+    """Return the counter period for a rollover policy"""
+    now = timezone.now()
+    if rollover == 'yearly':
+        return str(now.year)
+    if rollover == 'monthly':
+        return now.strftime('%Y%m')
+    if rollover == 'never':
+        return ''
+    raise ValueError(f"Unknown sequence rollover policy: {rollover!r}")
+
+
+def reserve_block(connection, name, period, size):
+    """
+    Atomically move the counter for (name, period) forward by ``size``.
+
+    Returns the half-open range ``(start, end)`` reserved for the caller.
+    """
+    from .models import NumberSequence
+
+    table = connection.ops.quote_name(NumberSequence._meta.db_table)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for _ in range(2):
+            cursor.execute(
+                f"UPDATE {table} SET next_value = next_value + %s, updated_at = %s "
+                f"WHERE name = %s AND period = %s RETURNING next_value",
+                [size, now, name, period],
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                end = row[0]
+                return end - size, end
+            # First use of this period: create the counter and retry the update.
+            # ON CONFLICT covers the race with another process doing the same.
+            cursor.execute(
+                f"INSERT INTO {table} (name, period, next_value, updated_at) "
+                f"VALUES (%s, %s, 1, %s) ON CONFLICT (name, period) DO NOTHING",
+                [name, period, now],
+            )
+    raise RuntimeError(f"Could not reserve a block for sequence {name!r}")
+
+
+class BlockSequence:
+    """Thread-safe, per-process dispenser for one named sequence"""
+
+    def __init__(self, name, using=DEFAULT_DB_ALIAS):
+        self.name = name
+        self.using = using
+        self._lock = threading.Lock()
+        self._pid = None
+        self._period = None
+        self._next = 0
+        self._end = 0
+
+    def next_value(self):
+        """Return ``(period, value)`` for the next number"""
+        period, values = self.take(1)
+        return period, values[0]
+
+    def take(self, count):
+        """Return ``(period, values)`` with ``count`` unused numbers"""
+        config = sequence_config(self.name)
+        period = current_period(config['rollover'])
+
+        with self._lock:
+            if self._pid != os.getpid() or self._period != period:
+                # Forked worker or new period: never reuse the parent's block
+                self._pid = os.getpid()
+                self._period = period
+                self._next = self._end = 0
+
+            values = []
+            while len(values) < count:
+                if self._next >= self._end:
+                    start, end, cacheable = self._reserve(period, count - len(values), config['block_size'])
+                    if not cacheable:
+                        values.extend(range(start, end))
+                        continue
+                    self._next, self._end = start, end
+                available = min(self._end - self._next, count - len(values))
+                values.extend(range(self._next, self._next + available))
+                self._next += available
+            return period, values[:count]
+
+    def _reserve(self, period, wanted, block_size):
+        connection = connections[self.using]
+        size = max(block_size, wanted)
+        if not connection.in_atomic_block:
+            return (*reserve_block(connection, self.name, period, size), True)
+
+        if connection.vendor != 'sqlite':
+            # Reserve on a side connection so the block survives a rollback of the caller
+            side = connections.create_connection(self.using)
+            try:
+                return (*reserve_block(side, self.name, period, size), True)
+            finally:
+                side.close()
+
+        # SQLite allows a single writer, so a side connection would deadlock against the
+        # caller's transaction. Reserve exactly what is needed inside it instead; if the
+        # caller rolls back, the counter and the rows using these numbers go together.
+        return (*reserve_block(connection, self.name, period, wanted), False)
+
+
+_sequences = {}
+_sequences_lock = threading.Lock()
+
+
+def get_sequence(name):
+    """Return the process-wide ``BlockSequence`` for ``name``"""
+    with _sequences_lock:
+        if name not in _sequences:
+            _sequences[name] = BlockSequence(name)
+        return _sequences[name]
+
+
+application_numbers = get_sequence('application_number')
+
+
+# National ID number pool
+ID_BODY_RANGE = (1_000_000, 10_000_000)  # 7-digit body, the check digit makes 8 digits
+
+ID_POOL_DEFAULTS = {
+    'refill_size': 1000,  # numbers generated inline if the pool runs dry
+}
+
+
+class IDNumberPoolExhausted(Exception):
+    """Raised when the pool cannot supply the requested National ID numbers"""
+
+
+def luhn_check_digit(body):
+    """Return the Luhn check digit for a string of digits"""
+    total = 0
+    for index, char in enumerate(reversed(body)):
+        digit = int(char)
+        if index % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_id_number(number):
+    """Check a pool-issued National ID number against its check digit"""
+    return len(number) == 8 and number.isdigit() and luhn_check_digit(number[:-1]) == number[-1]
+
+
+def top_up_pool(count, batch_size=10000, rng=None):
+    """
+    Add ``count`` shuffled, unissued numbers to the pool and return how many were added.
+
+    Candidates already in the pool are skipped by the unique index; numbers already
+    issued (including legacy random IDs) are filtered with one query per batch. A
+    concurrent top-up can pool some of the same candidates first, so each batch is
+    inserted under a token and counted by clearing it, in one transaction.
+    """
+    from .models import IDNumberPool, NationalID
+
+    rng = rng or random.SystemRandom()
+    added = 0
+    fruitless = 0  # consecutive batches that found no new number
+    while added < count:
+        if fruitless >= 50:
+            raise IDNumberPoolExhausted("Could not find enough unused National ID numbers")
+
+        wanted = min(batch_size, count - added)
+        bodies = rng.sample(range(*ID_BODY_RANGE), wanted)
+        candidates = [f"{body}{luhn_check_digit(str(body))}" for body in bodies]
+        issued = set(NationalID.objects.filter(id_number__in=candidates).values_list('id_number', flat=True))
+        pooled = set(IDNumberPool.objects.filter(id_number__in=candidates).values_list('id_number', flat=True))
+        fresh = [number for number in candidates if number not in issued and number not in pooled]
+
+        token = uuid.uuid4().hex
+        with transaction.atomic():
+            IDNumberPool.objects.bulk_create(
+                [IDNumberPool(id_number=number, claim_token=token) for number in fresh],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            # Rows another top-up pooled first were dropped by ON CONFLICT and keep its token
+            inserted = IDNumberPool.objects.filter(claim_token=token).update(claim_token=None)
+        added += inserted
+        fruitless = 0 if inserted else fruitless + 1
+    return added
+
+
+def _claim_batch(count):
+    """Claim up to ``count`` pool rows in one transaction and return their numbers"""
+    from .models import IDNumberPool
+
+    connection = connections[IDNumberPool.objects.db]
+    now = timezone.now()
+    available = IDNumberPool.objects.filter(claimed_at__isnull=True).order_by('id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        # Postgres: concurrent allocators skip each other's rows instead of queueing
+        with transaction.atomic():
+            rows = list(available.select_for_update(skip_locked=True).values_list('id', 'id_number')[:count])
+            IDNumberPool.objects.filter(id__in=[pk for pk, _ in rows]).update(claimed_at=now)
+        return [number for _, number in rows]
+
+    # SQLite: a single UPDATE takes the write lock, so tag the rows with a token and
+    # read them back; no other writer can interleave between the select and the update.
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        IDNumberPool.objects.filter(
+            id__in=Subquery(available.values('id')[:count])
+        ).update(claimed_at=now, claim_token=token)
+        return list(IDNumberPool.objects.filter(claim_token=token).order_by('id').values_list('id_number', flat=True))
+
+
+def claim_id_numbers(count):
+    """Atomically claim the next ``count`` National ID numbers from the pool"""
+    config = dict(ID_POOL_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_ID_POOL', {}))
+
+    numbers = _claim_batch(count)
+    if len(numbers) < count:
+        # Pool ran dry: refill inline rather than failing the issuance
+        top_up_pool(max(config['refill_size'], count - len(numbers)))
+        numbers += _claim_batch(count - len(numbers))
+    if len(numbers) < count:
+        raise IDNumberPoolExhausted(f"Needed {count} National ID numbers, pool supplied {len(numbers)}")
+    return numbers
@@ -0,0 +1,265 @@
+# payments.py
+"""
+Ingestion of M-Pesa payment confirmations.
+
+The gateway posts a C2B confirmation to ``payments/mpesa/callback/`` for
+every payment, and posts it again when it does not get an answer quickly.
+The endpoint only parses the payload and inserts it into ``PaymentCallback``
+with ``ON CONFLICT DO NOTHING`` on the transaction id, then answers at once,
+so a burst of confirmations costs one small INSERT each and retries are
+absorbed by the unique index.
+
+``process_callbacks`` (``manage.py process_payment_callbacks``) matches the
+staged rows in batches, one transaction per batch claimed with ``SKIP
+LOCKED``. The account number the payer typed (``BillRefNumber``) is looked up
+in bulk, first as the reference of a pending ``Payment``, then as an
+application number, for which a completed ``Payment`` of the application's
+fee is created. Matched applications get ``fee_paid`` and their
+``payment_reference`` in one ``bulk_update``. Confirmations that cannot be
+matched, fall short of the fee or pay an application twice are left as
+``unmatched`` with the reason, for finance to review. A transaction id that
+already has a ``Payment`` is marked ``duplicate``; the conditional unique
+constraint on ``Payment.external_reference`` backs that up::
+
+    HUDUMA_PAYMENTS = {
+        'callback_token': None,     # callbacks must carry ?token=<value>
+        'callback_networks': (),    # when set, callbacks must come from these addresses
+        'batch_size': 500,          # callbacks matched per transaction
+    }
+
+The callback URL fails closed: every confirmation is rejected until a
+``callback_token`` is configured.
+"""
+import hmac
+import ipaddress
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .audit import record_updates
+from .models import Fee, IDApplication, Payment, PaymentCallback
+from .stats import local_date, schedule_refresh
+
+
+PAYMENTS_DEFAULTS = {
+    'callback_token': None,
+    'callback_networks': (),
+    'batch_size': 500,
+}
+
+# application_type -> Fee.fee_type charged for it
+APPLICATION_FEE_TYPES = {
+    'new': 'new_id',
+    'replacement': 'replacement',
+    'name_change': 'name_change',
+}
+
+# TransTime is local time in Kenya, e.g. 20250118143015
+MPESA_TIMEZONE = ZoneInfo('Africa/Nairobi')
+
+
+class CallbackError(ValueError):
+    """Raised for a callback payload that cannot be staged"""
+
+
+def payments_config():
+    """Return the effective payment ingestion configuration"""
+    config = dict(PAYMENTS_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_PAYMENTS', {}))
+    return config
+
+
+def callback_allowed(token, address, config=None):
+    """Whether a callback carrying ``token`` from ``address`` may be staged"""
+    config = config or payments_config()
+    expected = config['callback_token']
+    if not expected or not hmac.compare_digest(str(token or '').encode(), str(expected).encode()):
+        return False
+    networks = config['callback_networks']
+    if not networks:
+        return True
+    try:
+        address = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def parse_mpesa_confirmation(payload):
+    """``PaymentCallback`` field values of an M-Pesa C2B confirmation"""
+    if not isinstance(payload, dict):
+        raise CallbackError("Expected a JSON object")
+    trans_id = str(payload.get('TransID') or '').strip()
+    if not trans_id or len(trans_id) > 100:
+        raise CallbackError("TransID is missing")
+    try:
+        amount = Decimal(str(payload.get('TransAmount'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise CallbackError("TransAmount is not a number")
+    if not amount.is_finite() or amount <= 0 or amount >= Decimal('1e8'):
+        raise CallbackError("TransAmount is out of range")
+
+    transaction_time = None
+    if payload.get('TransTime'):
+        try:
+            transaction_time = datetime.strptime(str(payload['TransTime']), '%Y%m%d%H%M%S').replace(tzinfo=MPESA_TIMEZONE)
+        except ValueError:
+            raise CallbackError("TransTime is not YYYYMMDDHHMMSS")
+
+    names = (payload.get('FirstName'), payload.get('MiddleName'), payload.get('LastName'))
+    return {
+        'external_reference': trans_id,
+        'account_reference': str(payload.get('BillRefNumber') or '').strip()[:100],
+        'amount': amount,
+        'payer_phone': str(payload.get('MSISDN') or '')[:15],
+        'payer_name': ' '.join(str(name) for name in names if name)[:200],
+        'transaction_time': transaction_time,
+    }
+
+
+def stage_callback(payload):
+    """Store a confirmation unless its transaction id is already staged"""
+    fields = parse_mpesa_confirmation(payload)
+    PaymentCallback.objects.bulk_create([PaymentCallback(payload=payload, **fields)], ignore_conflicts=True)
+
+
+def mark_paid(payments, now=None):
+    """Flag applications as paid from ``{application id: completed Payment}`` in one bulk update"""
+    now = now or timezone.now()
+    # bulk_update sends no signals: audit the applications whose flag or reference changes
+    audited = {}
+    current = IDApplication.objects.filter(pk__in=list(payments)).only(
+        'pk', 'full_name', 'application_number', 'fee_paid', 'payment_reference',
+    )
+    for application in current:
+        reference = payments[application.pk].payment_reference
+        changes = {}
+        if not application.fee_paid:
+            changes['fee_paid'] = (False, True)
+        if application.payment_reference != reference:
+            changes['payment_reference'] = (application.payment_reference, reference)
+        if changes:
+            audited[application] = changes
+    record_updates(audited)
+    IDApplication.objects.bulk_update(
+        [
+            IDApplication(pk=pk, fee_paid=True, payment_reference=payment.payment_reference, updated_at=now)
+            for pk, payment in payments.items()
+        ],
+        ['fee_paid', 'payment_reference', 'updated_at'],
+        batch_size=1000,
+    )
+    # bulk writes send no signals, so refresh the payments rollup here
+    schedule_refresh(*{local_date(payment.paid_at) for payment in payments.values()})
+
+
+def match_callbacks(callbacks):
+    """Match a batch of staged callbacks inside the caller's transaction; returns ``{status: count}``"""
+    now = timezone.now()
+    references = {callback.account_reference.upper() for callback in callbacks if callback.account_reference}
+    recorded = set(
+        Payment.objects.filter(external_reference__in=[callback.external_reference for callback in callbacks])
+        .values_list('external_reference', flat=True)
+    )
+    # Another worker may hold callbacks for the same payments or applications: lock
+    # them (in pk order, so workers cannot deadlock) before reading their status
+    pending_payments = {
+        payment.payment_reference.upper(): payment
+        for payment in Payment.objects.select_for_update()
+        .filter(payment_reference__in=references, status='pending').order_by('pk')
+    }
+    applications = {
+        application.application_number: application
+        for application in IDApplication.objects.select_for_update()
+        .filter(application_number__in=references).order_by('pk')
+        .only('pk', 'application_number', 'application_type', 'fee_paid')
+    }
+    fees = {fee.fee_type: fee for fee in Fee.objects.filter(is_active=True)}
+
+    completed, created, paid = [], [], {}
+    for callback in callbacks:
+        callback.processed_at = now
+        reference = callback.account_reference.upper()
+        paid_at = callback.transaction_time or now
+        details = {
+            'external_reference': callback.external_reference, 'status': 'completed', 'paid_at': paid_at,
+            'payer_phone': callback.payer_phone or None, 'payer_name': callback.payer_name or None,
+        }
+        if callback.external_reference in recorded:
+            callback.status, callback.error_message = 'duplicate', "A payment with this transaction id exists"
+            continue
+        payment = pending_payments.pop(reference, None)
+        application = applications.get(reference)
+        if payment is not None:
+            if callback.amount < payment.amount:
+                callback.status = 'unmatched'
+                callback.error_message = f"Paid KES {callback.amount}, payment {payment.payment_reference} is KES {payment.amount}"
+                continue
+            for field, value in details.items():
+                setattr(payment, field, value)
+            completed.append(payment)
+        elif application is not None:
+            fee = fees.get(APPLICATION_FEE_TYPES.get(application.application_type))
+            if application.fee_paid or application.pk in paid:
+                callback.status, callback.error_message = 'unmatched', "Application is already paid"
+                continue
+            if fee is None:
+                callback.status = 'unmatched'
+                callback.error_message = f"No active fee for {application.get_application_type_display()} applications"
+                continue
+            if callback.amount < fee.amount:
+                callback.status = 'unmatched'
+                callback.error_message = f"Paid KES {callback.amount}, the fee is KES {fee.amount}"
+                continue
+            payment = Payment(
+                application_id=application.pk, fee=fee, amount=callback.amount, payment_method='mpesa',
+                payment_reference=f"MP{callback.external_reference}", **details,
+            )
+            created.append(payment)
+        else:
+            callback.status = 'unmatched'
+            callback.error_message = f"No pending payment or application numbered {callback.account_reference!r}"
+            continue
+
+        callback.status, callback.error_message = 'matched', ''
+        callback.payment = payment
+        paid[payment.application_id] = payment
+
+    Payment.objects.bulk_create(created)
+    Payment.objects.bulk_update(
+        completed, ['external_reference', 'status', 'paid_at', 'payer_phone', 'payer_name'],
+    )
+    for callback in callbacks:
+        if callback.payment is not None:
+            callback.payment_id = callback.payment.pk
+    PaymentCallback.objects.bulk_update(callbacks, ['status', 'payment', 'error_message', 'processed_at'])
+    mark_paid(paid, now)
+
+    counts = {}
+    for callback in callbacks:
+        counts[callback.status] = counts.get(callback.status, 0) + 1
+    return counts
+
+
+def process_callbacks(batch_size=None, limit=None):
+    """Match pending callbacks batch by batch; yields running ``{status: count}`` totals"""
+    batch_size = batch_size or payments_config()['batch_size']
+    totals = {}
+    done = 0
+    while limit is None or done < limit:
+        size = batch_size if limit is None else min(batch_size, limit - done)
+        with transaction.atomic():
+            callbacks = list(
+                PaymentCallback.objects.select_for_update(skip_locked=True)
+                .filter(status='pending').order_by('pk')[:size]
+            )
+            if not callbacks:
+                break
+            for status, count in match_callbacks(callbacks).items():
+                totals[status] = totals.get(status, 0) + count
+        done += len(callbacks)
+        yield dict(totals)
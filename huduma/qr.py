@@ -0,0 +1,292 @@
+# qr.py
+"""
+QR codes of chief eligibility letters and waiting cards.
+
+``ChiefEligibilityLetter`` and ``WaitingCard`` only store the text to encode
+(``qr_payload``) when they are saved. Pages show the code through
+``/qr/<kind>/<pk>.png`` (or ``.svg``), which renders it from the payload on
+demand. Rendered images are kept in a per-process LRU and in a file cache
+keyed by a hash of the payload, so each code is rendered about once however
+often it is viewed. ``qr_url`` adds that hash as ``?v=``, which lets the
+browser cache the image for good. Rows saved before payloads were stored
+have none until ``render_qr_codes`` fills it (``fill_payloads``); pages never
+write it, so until then they get an unversioned URL and an image rendered
+from a payload built per request.
+
+Files in the ``qr_code`` field are only needed where something outside the
+site reads them. ``render_pending`` renders the rows without one in batches
+(in a process pool when ``workers`` > 1) and attaches them with a conditional
+``UPDATE``; ``manage.py render_qr_codes`` runs it, and the local runner can
+do it on a background thread after each save::
+
+    HUDUMA_QR = {
+        'local_runner': False,  # also store a PNG in qr_code after each save
+        'batch_size': 200,      # rows rendered per batch by render_qr_codes
+        'memory_items': 2048,   # rendered images kept in each process
+        'cache_dir': None,      # file cache; defaults to MEDIA_ROOT/qr_cache
+    }
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import qrcode
+import qrcode.image.svg
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.urls import reverse
+
+
+logger = logging.getLogger(__name__)
+
+QR_DEFAULTS = {
+    'local_runner': False,
+    'batch_size': 200,
+    'memory_items': 2048,
+    'cache_dir': None,
+}
+
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Part of every cache key; change it when the rendering below changes
+RENDER_VERSION = 'v1-10-5'
+
+# kind -> (model, number field used in the file name, file name pattern)
+QR_MODELS = {
+    'chief_letter': ('huduma.ChiefEligibilityLetter', 'letter_number', 'chief_letter_{}.png'),
+    'waiting_card': ('huduma.WaitingCard', 'serial_number', 'waiting_card_{}.png'),
+}
+
+_runner = None
+_cache = None
+
+
+def qr_config():
+    """Return the effective QR rendering configuration"""
+    config = dict(QR_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_QR', {}))
+    return config
+
+
+def render_png(payload):
+    """PNG bytes of the QR code for ``payload``; runs in worker processes, so it touches no Django state"""
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def render_svg(payload):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5, image_factory=qrcode.image.svg.SvgPathImage)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image().save(buffer)
+    return buffer.getvalue()
+
+
+RENDERERS = {'png': render_png, 'svg': render_svg}
+
+
+def qr_digest(payload, fmt='png'):
+    """Hash identifying the image of ``payload`` in ``fmt``; used as cache key, ETag and URL version"""
+    return hashlib.sha256(f'{RENDER_VERSION}\0{fmt}\0{payload}'.encode()).hexdigest()[:32]
+
+
+class QRCache:
+    """Rendered QR images by digest: an LRU of ``memory_items`` in front of files under ``directory``"""
+
+    def __init__(self, directory, memory_items=QR_DEFAULTS['memory_items']):
+        self.directory = Path(directory)
+        self.memory_items = memory_items
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, digest, fmt):
+        return self.directory / digest[:2] / f'{digest}.{fmt}'
+
+    def remember(self, digest, image):
+        with self._lock:
+            self._images[digest] = image
+            self._images.move_to_end(digest)
+            while len(self._images) > self.memory_items:
+                self._images.popitem(last=False)
+
+    def get(self, payload, fmt='png'):
+        """Return ``(digest, image bytes)``, rendering and storing the image on a miss"""
+        digest = qr_digest(payload, fmt)
+        with self._lock:
+            image = self._images.get(digest)
+            if image is not None:
+                self._images.move_to_end(digest)
+                return digest, image
+
+        path = self.path(digest, fmt)
+        try:
+            image = path.read_bytes()
+        except FileNotFoundError:
+            image = RENDERERS[fmt](payload)
+            self.write(path, image)
+        self.remember(digest, image)
+        return digest, image
+
+    def write(self, path, image):
+        # Write-then-rename, so concurrent readers never see half a file
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(image)
+            os.replace(temporary, path)
+        except OSError:
+            logger.warning("Could not write the QR cache file %s", path, exc_info=True)
+
+    def clear_memory(self):
+        with self._lock:
+            self._images.clear()
+
+
+def qr_cache():
+    """The process-wide ``QRCache`` configured by ``HUDUMA_QR``"""
+    global _cache
+    if _cache is None:
+        config = qr_config()
+        directory = config['cache_dir'] or Path(settings.MEDIA_ROOT) / 'qr_cache'
+        _cache = QRCache(directory, config['memory_items'])
+    return _cache
+
+
+def qr_payload(instance):
+    """Payload of a letter or card; built in memory for rows saved without one, never stored here"""
+    return instance.qr_payload or instance.build_qr_payload()
+
+
+def qr_kind(instance):
+    return next((kind for kind, (label, *_) in QR_MODELS.items() if label == instance._meta.label), None)
+
+
+def qr_url(instance, fmt='png'):
+    """Versioned URL of the on-demand QR image of a letter or card; unversioned until its payload is stored"""
+    url = reverse('qr_code_image', kwargs={'kind': qr_kind(instance), 'pk': instance.pk, 'fmt': fmt})
+    if not instance.qr_payload:
+        return url
+    return f'{url}?v={qr_digest(instance.qr_payload, fmt)}'
+
+
+def qr_model(kind):
+    return apps.get_model(QR_MODELS[kind][0])
+
+
+def missing_image():
+    return Q(qr_code__isnull=True) | Q(qr_code='')
+
+
+def pending(kind):
+    """Rows of ``kind`` waiting for their QR image"""
+    return qr_model(kind).objects.filter(missing_image()).exclude(qr_payload='')
+
+
+def fill_payloads(kind, batch_size=None):
+    """Store the payload of rows saved without one; returns the number filled"""
+    batch_size = batch_size or qr_config()['batch_size']
+    model = qr_model(kind)
+    filled = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            model.objects.filter(qr_payload='', pk__gt=last_pk)
+            .select_related('application', *(['chief'] if kind == 'chief_letter' else []))
+            .order_by('pk')[:batch_size]
+        )
+        if not rows:
+            return filled
+        for row in rows:
+            row.qr_payload = row.build_qr_payload()
+        model.objects.bulk_update(rows, ['qr_payload'])
+        filled += len(rows)
+        last_pk = rows[-1].pk
+
+
+def attach(kind, rows, images):
+    """Write rendered PNGs to storage and attach those whose row still has no image"""
+    model = qr_model(kind)
+    field = model._meta.get_field('qr_code')
+    _, number_field, pattern = QR_MODELS[kind]
+    attached = 0
+    for row, png in zip(rows, images):
+        filename = field.generate_filename(None, pattern.format(row[number_field]))
+        name = field.storage.save(filename, ContentFile(png))
+        if model.objects.filter(missing_image(), pk=row['pk']).update(qr_code=name):
+            attached += 1
+        else:
+            # Rendered twice (another worker won); drop our copy
+            field.storage.delete(name)
+    return attached
+
+
+def render_pending(kind, batch_size=None, workers=1, limit=None):
+    """
+    Render the missing QR images of ``kind``; yields the running count after each batch.
+
+    Rows are read by primary key in batches, so a crashed or concurrent run simply
+    leaves rows for the next one.
+    """
+    batch_size = batch_size or qr_config()['batch_size']
+    columns = ('pk', 'qr_payload', QR_MODELS[kind][1])
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        done = 0
+        last_pk = 0
+        while limit is None or done < limit:
+            size = batch_size if limit is None else min(batch_size, limit - done)
+            rows = list(pending(kind).filter(pk__gt=last_pk).order_by('pk').values(*columns)[:size])
+            if not rows:
+                break
+            payloads = [row['qr_payload'] for row in rows]
+            if pool:
+                images = list(pool.map(render_png, payloads, chunksize=max(1, len(rows) // (workers * 4))))
+            else:
+                images = [render_png(payload) for payload in payloads]
+            attach(kind, rows, images)
+            done += len(rows)
+            last_pk = rows[-1]['pk']
+            yield done
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+# Local runner
+def _render_row(kind, pk):
+    close_old_connections()
+    try:
+        row = pending(kind).filter(pk=pk).values('pk', 'qr_payload', QR_MODELS[kind][1]).first()
+        if row:
+            attach(kind, [row], [render_png(row['qr_payload'])])
+    except Exception:
+        logger.exception("Rendering the QR code of %s %s failed; render_qr_codes will retry it", kind, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_render(instance):
+    """Render a saved row's QR code on the background thread once the current transaction commits"""
+    global _runner
+    kind = qr_kind(instance)
+    if kind is None or instance.qr_code or not instance.qr_payload or not qr_config()['local_runner']:
+        return
+    if _runner is None:
+        _runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-render')
+    pk = instance.pk
+    transaction.on_commit(lambda: _runner.submit(_render_row, kind, pk))
@@ -0,0 +1,300 @@
+# reconciliation.py
+"""
+Reconciliation of payments against bank and M-Pesa statements.
+
+``reconcile`` reads a statement CSV as a stream and matches it against
+``Payment`` in blocks of ``RECONCILE_CHUNK_SIZE`` lines. Each block costs a
+few set-based queries (payments by receipt number, pending payments by
+account number, staged callbacks for the leftovers). The lines are then
+classified against those dictionaries, with no query per line. Between
+blocks only the receipt numbers of the last ``DUPLICATE_WINDOW`` blocks and
+the ids of the payments matched so far are kept. Memory therefore grows with
+the payments found in the statement's period, not with its lines, and a
+receipt repeated further apart than the window is not reported as a
+duplicate.
+
+Every line ends up in one of these outcomes:
+
+``matched``            receipt recorded, amount equal, payment completed and its application paid
+``duplicate``          receipt already seen in the last ``DUPLICATE_WINDOW`` blocks
+``amount_mismatch``    receipt (or pending payment) found, but the amounts differ
+``payment_not_completed``  receipt recorded on a pending or failed payment
+``payment_refunded``   receipt recorded on a refunded payment
+``application_not_paid``   payment completed, but its application is not flagged ``fee_paid``
+``pending_confirmed``  no receipt recorded; the account number is a pending payment of that amount
+``orphan_line``        nothing in the database matches the line
+
+Once the statement is read, completed M-Pesa payments dated inside the
+statement's period that no line matched are reported as ``orphan_payment``.
+
+With ``apply=True`` each block's fixes run in one transaction. Confirmed
+pending payments and pending or failed payments get completed.
+Applications get flagged as paid. Orphan lines are staged as
+``PaymentCallback`` rows, which ``process_payment_callbacks`` then matches
+against application numbers. Amount mismatches, duplicates, refunded
+payments and orphan payments are only reported; a refund must never be
+undone by a statement line.
+"""
+import csv
+from collections import deque
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Payment, PaymentCallback
+from .payments import MPESA_TIMEZONE, mark_paid
+
+
+RECONCILE_CHUNK_SIZE = 10_000
+DUPLICATE_WINDOW = 10  # blocks whose receipt numbers are checked for duplicates
+
+# Payment.status a statement line may complete
+COMPLETABLE_STATUSES = ('pending', 'failed')
+
+# Statement field -> column header; the defaults are those of an M-Pesa organisation statement
+STATEMENT_COLUMNS = {
+    'reference': 'Receipt No.',
+    'time': 'Completion Time',
+    'amount': 'Paid In',
+    'account': 'A/C No.',
+    'party': 'Other Party Info',
+    'status': 'Transaction Status',
+}
+
+TIME_FORMATS = ('%d-%m-%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M')
+
+OUTCOMES = (
+    'matched', 'duplicate', 'amount_mismatch', 'payment_not_completed', 'payment_refunded',
+    'application_not_paid', 'pending_confirmed', 'orphan_line', 'orphan_payment',
+)
+
+REPORT_FIELDS = ('outcome', 'line', 'reference', 'account', 'amount', 'time', 'payment', 'detail')
+
+
+class StatementError(ValueError):
+    """Raised for a statement file that cannot be read"""
+
+
+def parse_amount(value):
+    """Amount in cents of a statement cell such as ``1,000.00``; None when empty"""
+    value = (value or '').replace(',', '').strip()
+    if not value:
+        return None
+    try:
+        return int(Decimal(value) * 100)
+    except InvalidOperation:
+        raise StatementError(f"{value!r} is not an amount")
+
+
+def parse_time(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise StatementError(f"{value!r} is not a date and time")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=MPESA_TIMEZONE)
+
+
+def read_statement(handle, columns=None):
+    """
+    Yield ``(line number, reference, amount in cents, time, account, party)`` for the
+    completed money-in lines of a statement CSV.
+    """
+    columns = {**STATEMENT_COLUMNS, **(columns or {})}
+    reader = csv.reader(handle)
+    try:
+        header = [name.strip() for name in next(reader)]
+    except StopIteration:
+        return
+    index = {field: header.index(name) for field, name in columns.items() if name in header}
+    missing = [columns[field] for field in ('reference', 'amount') if field not in index]
+    if missing:
+        raise StatementError(f"Statement has no {', '.join(missing)} column")
+
+    reference_at, amount_at = index['reference'], index['amount']
+    time_at, account_at, party_at, status_at = (index.get(field) for field in ('time', 'account', 'party', 'status'))
+    for line, row in enumerate(reader, start=2):
+        if len(row) <= max(reference_at, amount_at):
+            continue
+        if status_at is not None and status_at < len(row) and row[status_at].strip() not in ('', 'Completed'):
+            continue
+        try:
+            amount = parse_amount(row[amount_at])
+            if not amount:
+                continue  # withdrawals and charges
+            yield (
+                line,
+                row[reference_at].strip(),
+                amount,
+                parse_time(row[time_at]) if time_at is not None and time_at < len(row) else None,
+                row[account_at].strip().upper() if account_at is not None and account_at < len(row) else '',
+                row[party_at].strip() if party_at is not None and party_at < len(row) else '',
+            )
+        except StatementError as exc:
+            raise StatementError(f"Line {line}: {exc}")
+
+
+def split_party(party):
+    """``(phone, name)`` of an M-Pesa "Other Party Info" cell such as ``2547******21 - JOHN DOE``"""
+    phone, _, name = party.partition(' - ')
+    return phone.strip()[:15], name.strip()[:200]
+
+
+class Reconciliation:
+    """Outcome counts of a run; issues are passed to ``report`` as they are found"""
+
+    def __init__(self, apply=False, report=None, chunk_size=RECONCILE_CHUNK_SIZE, duplicate_window=DUPLICATE_WINDOW):
+        self.apply = apply
+        self.report = report
+        self.chunk_size = chunk_size
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+        self.fixed = 0
+        self.lines = 0
+        self.recent = deque(maxlen=duplicate_window)  # receipt numbers of the last blocks, one set each
+        self.matched_payments = set()
+        self.first = self.last = None
+
+    def issue(self, outcome, line=None, payment=None, detail=''):
+        self.counts[outcome] += 1
+        if self.report is not None and outcome != 'matched':
+            number, reference, amount, time, account, _ = line or (None, '', None, None, '', '')
+            self.report({
+                'outcome': outcome, 'line': number, 'reference': reference, 'account': account,
+                'amount': f"{amount / 100:.2f}" if amount is not None else '',
+                'time': time.isoformat() if time else '', 'payment': payment or '', 'detail': detail,
+            })
+
+    def run(self, lines):
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                self.reconcile_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.reconcile_chunk(chunk)
+        self.find_orphan_payments()
+        return self
+
+    def reconcile_chunk(self, chunk):
+        self.lines += len(chunk)
+        lines = []
+        seen = set()
+        for line in chunk:
+            if line[1] in seen or any(line[1] in block for block in self.recent):
+                self.issue('duplicate', line, detail="Receipt appears earlier in the statement")
+                continue
+            seen.add(line[1])
+            lines.append(line)
+            if line[3] is not None:
+                self.first = line[3] if self.first is None else min(self.first, line[3])
+                self.last = line[3] if self.last is None else max(self.last, line[3])
+        self.recent.append(seen)
+
+        # One query per lookup for the whole block (hash join in memory)
+        payments = {
+            row[0]: row for row in Payment.objects.filter(external_reference__in=[line[1] for line in lines])
+            .values_list('external_reference', 'pk', 'payment_reference', 'amount', 'status',
+                         'application_id', 'application__fee_paid')
+        }
+        accounts = {line[4] for line in lines if line[4] and line[1] not in payments}
+        pending = {
+            row[0].upper(): row for row in Payment.objects.filter(payment_reference__in=accounts, status='pending')
+            .values_list('payment_reference', 'pk', 'amount', 'application_id')
+        }
+
+        complete, paid, orphans = [], {}, []
+        for line in lines:
+            _, reference, amount, time, account, _ = line
+            payment = payments.get(reference)
+            if payment is not None:
+                _, pk, payment_reference, payment_amount, status, application_id, fee_paid = payment
+                self.matched_payments.add(pk)
+                if int(payment_amount * 100) != amount:
+                    self.issue('amount_mismatch', line, pk, f"Payment {payment_reference} is KES {payment_amount}")
+                elif status == 'refunded':
+                    self.issue('payment_refunded', line, pk, f"Payment {payment_reference} was refunded")
+                elif status in COMPLETABLE_STATUSES:
+                    self.issue('payment_not_completed', line, pk, f"Payment {payment_reference} is {status}")
+                    complete.append(Payment(pk=pk, status='completed', external_reference=reference,
+                                            paid_at=time or timezone.now(), payment_reference=payment_reference))
+                    paid[application_id] = complete[-1]
+                elif not fee_paid:
+                    self.issue('application_not_paid', line, pk, f"Payment {payment_reference} is completed")
+                    paid[application_id] = Payment(payment_reference=payment_reference, paid_at=time)
+                else:
+                    self.issue('matched', line, pk)
+                continue
+
+            match = pending.pop(account, None)
+            if match is not None:
+                payment_reference, pk, payment_amount, application_id = match
+                self.matched_payments.add(pk)
+                if int(payment_amount * 100) != amount:
+                    self.issue('amount_mismatch', line, pk, f"Pending payment {payment_reference} is KES {payment_amount}")
+                    continue
+                self.issue('pending_confirmed', line, pk, f"Pending payment {payment_reference}")
+                complete.append(Payment(pk=pk, status='completed', external_reference=reference,
+                                        paid_at=time or timezone.now(), payment_reference=payment_reference))
+                paid[application_id] = complete[-1]
+                continue
+
+            orphans.append(line)
+
+        staged = dict(
+            PaymentCallback.objects.filter(external_reference__in=[line[1] for line in orphans])
+            .values_list('external_reference', 'status')
+        )
+        for line in orphans:
+            status = staged.get(line[1])
+            self.issue('orphan_line', line, detail=f"Staged callback is {status}" if status else "No payment or callback")
+
+        if self.apply and (complete or paid or orphans):
+            callbacks = [self.callback(line) for line in orphans if line[1] not in staged]
+            with transaction.atomic():
+                Payment.objects.bulk_update(complete, ['status', 'external_reference', 'paid_at'], batch_size=1000)
+                mark_paid(paid)
+                PaymentCallback.objects.bulk_create(callbacks, batch_size=1000, ignore_conflicts=True)
+            self.fixed += len(complete) + len(paid) + len(callbacks)
+
+    def callback(self, line):
+        number, reference, amount, time, account, party = line
+        phone, name = split_party(party)
+        return PaymentCallback(
+            provider='statement', external_reference=reference, account_reference=account[:100],
+            amount=Decimal(amount) / 100, payer_phone=phone, payer_name=name, transaction_time=time,
+            payload={'line': number, 'reference': reference, 'amount': amount / 100, 'account': account,
+                     'party': party, 'time': time.isoformat() if time else None},
+        )
+
+    def find_orphan_payments(self):
+        """Completed M-Pesa payments inside the statement's period that no line matched"""
+        if self.first is None:
+            return
+        rows = (
+            Payment.objects.filter(payment_method='mpesa', status='completed', paid_at__range=(self.first, self.last))
+            .values_list('pk', 'payment_reference', 'external_reference', 'amount', 'paid_at')
+            .iterator(chunk_size=self.chunk_size)
+        )
+        for pk, payment_reference, external_reference, amount, paid_at in rows:
+            if pk not in self.matched_payments:
+                self.issue(
+                    'orphan_payment', (None, external_reference or '', int(amount * 100), paid_at, '', ''), pk,
+                    f"Payment {payment_reference} is not on the statement",
+                )
+
+
+def reconcile(handle, columns=None, apply=False, report=None, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Reconcile a statement read from ``handle``; returns the ``Reconciliation``"""
+    return Reconciliation(apply, report, chunk_size).run(read_statement(handle, columns))
@@ -0,0 +1,213 @@
+# search.py
+"""
+Full-text search over applications, birth certificates, National IDs and waiting cards.
+
+Every searchable record has a ``SearchEntry`` row whose ``body`` holds the
+lower-cased text of its name, number and phone fields (phone numbers in all
+their usual spellings: ``+254712345678``, ``254712345678``, ``0712345678`` and
+``712345678``). The body is indexed by an FTS5 table on SQLite and by a
+generated ``tsvector`` column with a GIN index on Postgres; see migration 0005.
+
+Entries are kept current by the signal handlers in ``signals.py``; writes that
+bypass signals (``update()``, ``bulk_create``) need
+``manage.py rebuild_search_index``. Queries match whole words and word
+prefixes (``wanj kam`` finds "Wanjiru Kamau", ``ID2026`` finds every 2026
+application) but not fragments from the middle of a word. On other databases
+``search_queryset`` falls back to ``icontains`` over the same fields.
+"""
+import re
+
+from django.apps import apps
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+# kind -> (model, field paths indexed for that kind)
+INDEXED_FIELDS = {
+    'application': ('huduma.IDApplication', (
+        'application_number', 'full_name', 'phone_number', 'previous_id_number', 'police_ob_number',
+        'applicant__username', 'applicant__phone_number', 'birth_certificate__certificate_number',
+    )),
+    'birth_certificate': ('huduma.BirthCertificate', (
+        'certificate_number', 'serial_number', 'full_name', 'father_name', 'mother_name',
+        'father_id', 'mother_id',
+    )),
+    'national_id': ('huduma.NationalID', (
+        'id_number', 'serial_number', 'full_name', 'place_of_birth', 'application__application_number',
+    )),
+    'waiting_card': ('huduma.WaitingCard', (
+        'serial_number', 'application__full_name', 'application__application_number',
+        'application__applicant__username', 'application__applicant__phone_number',
+    )),
+}
+
+# model -> (kind, lookup from that kind's model to the saved instance) whose entries embed its fields
+DEPENDENTS = {
+    'huduma.IDApplication': (('application', 'pk'), ('national_id', 'application'), ('waiting_card', 'application')),
+    'huduma.BirthCertificate': (('birth_certificate', 'pk'), ('application', 'birth_certificate')),
+    'huduma.NationalID': (('national_id', 'pk'),),
+    'huduma.WaitingCard': (('waiting_card', 'pk'),),
+    'huduma.CustomUser': (('application', 'applicant'), ('waiting_card', 'application__applicant')),
+}
+
+INTEGER_PK_TYPES = ('AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField')
+
+_fts_tables = {}
+
+
+def indexed_model(kind):
+    return apps.get_model(INDEXED_FIELDS[kind][0])
+
+
+def phone_variants(value):
+    """Return the common spellings of a Kenyan phone number"""
+    digits = re.sub(r'\D', '', value)
+    if digits.startswith('254') and len(digits) == 12:
+        local = digits[3:]
+    elif digits.startswith('0') and len(digits) == 10:
+        local = digits[1:]
+    else:
+        return [digits] if digits else []
+    return [f'254{local}', f'0{local}', local]
+
+
+def build_body(fields, values):
+    """Normalized search text for one record"""
+    parts = []
+    for field, value in zip(fields, values):
+        if value in (None, ''):
+            continue
+        value = str(value)
+        if field.endswith('phone_number'):
+            parts.extend(phone_variants(value))
+        else:
+            parts.append(value.lower())
+    return ' '.join(parts)
+
+
+def query_tokens(query):
+    """Split a search box query into the tokens matched against the index"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def search_backend(connection):
+    """Return 'postgres', 'fts5' or None when the database has no search index"""
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor == 'sqlite':
+        if connection.alias not in _fts_tables:
+            _fts_tables[connection.alias] = 'huduma_searchentry_fts' in connection.introspection.table_names()
+        return 'fts5' if _fts_tables[connection.alias] else None
+    return None
+
+
+def match_sql(backend, kind, tokens, cast_integer):
+    """SQL selecting ``object_pk`` of the entries of ``kind`` matching every token as a prefix"""
+    selected = 'CAST(e.object_pk AS BIGINT)' if cast_integer else 'e.object_pk'
+    if backend == 'postgres':
+        expression = ' & '.join(f'{token}:*' for token in tokens)
+        return (
+            f"SELECT {selected} FROM huduma_searchentry e "
+            f"WHERE e.kind = %s AND e.search_vector @@ to_tsquery('simple', %s)",
+            [kind, expression],
+        )
+    expression = ' AND '.join(f'"{token}"*' for token in tokens)
+    return (
+        f"SELECT {selected} FROM huduma_searchentry_fts f "
+        f"JOIN huduma_searchentry e ON e.id = f.rowid "
+        f"WHERE huduma_searchentry_fts MATCH %s AND e.kind = %s",
+        [expression, kind],
+    )
+
+
+def search_queryset(queryset, kind, query):
+    """Filter ``queryset`` (of the model indexed as ``kind``) to records matching ``query``"""
+    tokens = query_tokens(query)
+    if not tokens:
+        return queryset
+
+    backend = search_backend(connections[queryset.db])
+    if backend is None:
+        condition = Q()
+        for field in INDEXED_FIELDS[kind][1]:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition)
+
+    cast_integer = queryset.model._meta.pk.get_internal_type() in INTEGER_PK_TYPES
+    sql, params = match_sql(backend, kind, tokens, cast_integer)
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
+
+# Maintaining the index
+def search_entries(kind, rows):
+    """Build unsaved ``SearchEntry`` rows from ``(pk, *field values)`` tuples"""
+    from .models import SearchEntry
+
+    fields = INDEXED_FIELDS[kind][1]
+    return [
+        SearchEntry(kind=kind, object_pk=str(row[0]), body=build_body(fields, row[1:]))
+        for row in rows
+    ]
+
+
+def index_records(kind, queryset):
+    """(Re)index the records of ``kind`` selected by ``queryset``; returns the number indexed"""
+    from .models import SearchEntry
+
+    rows = queryset.order_by().values_list('pk', *INDEXED_FIELDS[kind][1])
+    entries = search_entries(kind, rows)
+    if entries:
+        SearchEntry.objects.filter(kind=kind, object_pk__in=[entry.object_pk for entry in entries]).delete()
+        SearchEntry.objects.bulk_create(entries, batch_size=1000)
+    return len(entries)
+
+
+def source_fields(kind, path):
+    """Fields of the model reached through ``path`` that the entries of ``kind`` embed"""
+    fields = INDEXED_FIELDS[kind][1]
+    if path == 'pk':
+        return {field.split('__')[0] for field in fields}
+    prefix = f'{path}__'
+    return {field[len(prefix):].split('__')[0] for field in fields if field.startswith(prefix)}
+
+
+def reindex_instance(instance, update_fields=None):
+    """Refresh every entry that embeds fields of ``instance``"""
+    for kind, path in DEPENDENTS.get(instance._meta.label, ()):
+        if update_fields is not None and not source_fields(kind, path) & set(update_fields):
+            continue
+        model = indexed_model(kind)
+        index_records(kind, model._default_manager.filter(**{path: instance.pk}))
+
+
+def unindex_instance(instance):
+    """Drop the entry of a deleted record"""
+    from .models import SearchEntry
+
+    for kind, path in DEPENDENTS.get(instance._meta.label, ()):
+        if path == 'pk':
+            SearchEntry.objects.filter(kind=kind, object_pk=str(instance.pk)).delete()
+
+
+def rebuild_index(kind, batch_size=2000):
+    """Recreate every entry of ``kind``; yields the running count after each batch"""
+    from .models import SearchEntry
+
+    model = indexed_model(kind)
+    fields = INDEXED_FIELDS[kind][1]
+    SearchEntry.objects.filter(kind=kind).delete()
+
+    total = 0
+    last_pk = None
+    while True:
+        queryset = model._default_manager.order_by('pk')
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        rows = list(queryset.values_list('pk', *fields)[:batch_size])
+        if not rows:
+            break
+        SearchEntry.objects.bulk_create(search_entries(kind, rows), batch_size=1000)
+        total += len(rows)
+        last_pk = rows[-1][0]
+        yield total
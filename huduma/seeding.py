@@ -0,0 +1,343 @@
+# seeding.py
+"""
+Bulk generation of load-test datasets.
+
+``seed_citizens`` creates citizens in shards of ``SHARD_SIZE``: for each one a
+user, a birth certificate and an ID application whose status history walks
+``STATUS_PATHS`` up to a weighted final status, plus a payment for
+replacements and name changes and a National ID once the application reaches
+``ready_for_collection``. Every shard is generated from its own
+``random.Random(f'{seed}:{shard}')``, so a seed always yields the same people,
+places and dates whatever the number of workers; only the allocated
+application and National ID numbers depend on who gets there first.
+
+Rows are inserted with ``bulk_create`` in one transaction per shard. Places
+come from the in-memory gazetteer, application numbers are taken from the
+block sequence a shard at a time and National ID numbers are claimed from the
+pool the same way, so nothing is looked up row by row. Other unique values
+are derived from the citizen's index and the run ``prefix``.
+
+``bulk_create`` sends no signals: run ``rebuild_search_index``,
+``rebuild_name_index``, ``backfill_daily_stats`` and ``backfill_timelines``
+afterwards (``manage.py seed_scale --rebuild`` does).
+"""
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .gazetteer import gazetteer
+
+
+SHARD_SIZE = 2000
+SEED_NAMESPACE = uuid.UUID('6f1c3b1e-52a4-4c5e-9a51-254000000000')  # application_id = uuid5 of the username
+
+# Main path of an application; failures branch off as listed in FAILURE_PATHS
+STATUS_PATHS = (
+    'started', 'documents_uploaded', 'chief_review', 'chief_approved', 'do_review', 'do_approved',
+    'biometrics_scheduled', 'biometrics_taken', 'processing', 'ready_for_collection', 'collected',
+)
+FAILURE_PATHS = {
+    'chief_rejected': ('started', 'documents_uploaded', 'chief_review', 'chief_rejected'),
+    'rejected': ('started', 'documents_uploaded', 'chief_review', 'chief_rejected', 'rejected'),
+    'do_rejected': ('started', 'documents_uploaded', 'chief_review', 'chief_approved', 'do_review', 'do_rejected'),
+    'cancelled': ('started', 'documents_uploaded', 'cancelled'),
+}
+
+# Share of applications ending in each status
+STATUS_WEIGHTS = {
+    'started': 3, 'documents_uploaded': 3, 'chief_review': 5, 'chief_approved': 2, 'do_review': 5,
+    'do_approved': 2, 'biometrics_scheduled': 4, 'biometrics_taken': 3, 'processing': 8,
+    'ready_for_collection': 10, 'collected': 45, 'chief_rejected': 1, 'rejected': 2, 'do_rejected': 1,
+    'cancelled': 2,
+}
+
+APPLICATION_TYPE_WEIGHTS = {'new': 80, 'replacement': 15, 'name_change': 5}
+ENTRY_POINT_WEIGHTS = {'chief': 50, 'huduma': 30, 'online': 20}
+FEE_TYPES = {'replacement': 'replacement', 'name_change': 'name_change'}
+
+LOCATION_TYPES = {
+    'started': 'online', 'documents_uploaded': 'online', 'chief_review': 'chief_office',
+    'chief_approved': 'chief_office', 'chief_rejected': 'chief_office',
+}
+
+ISSUED_STATUSES = ('ready_for_collection', 'collected')
+
+
+def status_path(final):
+    if final in FAILURE_PATHS:
+        return FAILURE_PATHS[final]
+    return STATUS_PATHS[:STATUS_PATHS.index(final) + 1]
+
+
+@contextmanager
+def historic_timestamps(*models):
+    """Let ``bulk_create`` keep the given ``auto_now``/``auto_now_add`` values"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class ShardGenerator:
+    """Builds the unsaved rows of one shard of citizens"""
+
+    def __init__(self, seed, shard, options, names, places):
+        self.rng = random.Random(f'{seed}:{shard}')
+        self.shard = shard
+        self.options = options
+        self.names = names
+        self.places = places
+        self.now = options['now']
+        self._cumulative = {}
+
+    def pick(self, weights):
+        key = id(weights)
+        if key not in self._cumulative:
+            self._cumulative[key] = (list(weights), list(accumulate(weights.values())))
+        choices, cumulative = self._cumulative[key]
+        return self.rng.choices(choices, cum_weights=cumulative)[0]
+
+    def address(self):
+        """Random county-to-village chain as six ids"""
+        tree = self.places
+        ids = [self.rng.choice(tree.children[None, None])]
+        for level in ('county', 'sub_county', 'division', 'location', 'sub_location'):
+            children = tree.children.get((level, ids[-1]))
+            if not children:
+                return None
+            ids.append(self.rng.choice(children))
+        return ids
+
+    def moment(self, start, days):
+        """Aware datetime ``days`` (fractional) after ``start``, capped at now"""
+        return min(start + timedelta(days=days), self.now)
+
+    def person(self):
+        group = self.rng.choice(self.names)
+        gender = self.rng.choice('MF')
+        first = self.rng.choice(group['male'] if gender == 'M' else group['female'])
+        middle = self.rng.choice(group['male'] + group['female'])
+        return group, gender, first, middle, self.rng.choice(group['surnames'])
+
+    def generate(self, start, count):
+        from .models import ApplicationStatusHistory, BirthCertificate, CustomUser, IDApplication
+
+        rng = self.rng
+        prefix = self.options['prefix']
+        span = self.options['days']
+        citizens = []
+        for index in range(start, start + count):
+            group, gender, first, middle, last = self.person()
+            birth = self.address()
+            current = self.address() if rng.random() < 0.4 else birth
+            if birth is None or current is None:
+                continue
+            born = (self.now - timedelta(days=rng.randint(18 * 365, 80 * 365))).date()
+            created = self.now - timedelta(days=rng.uniform(0, span))
+            phone = f"+2547{rng.randint(0, 99_999_999):08d}"
+            full_name = f"{first} {middle} {last}"
+            username = f"{prefix.lower()}_{index:09d}"
+
+            user = CustomUser(
+                username=username, password=self.options['password'], first_name=first, last_name=last,
+                email=f"{username}@example.com", user_type='mwananchi', phone_number=phone,
+                is_verified=True, county_id=current[0], sub_county_id=current[1],
+                date_joined=created, created_at=created, updated_at=created,
+            )
+            certificate = BirthCertificate(
+                certificate_number=f"{prefix}BC{index:09d}", serial_number=f"{prefix}BS{index:09d}",
+                full_name=full_name, date_of_birth=born,
+                place_of_birth=self.places.names['village', birth[5]], gender=gender,
+                county_of_birth_id=birth[0], sub_county_of_birth_id=birth[1], division_of_birth_id=birth[2],
+                location_of_birth_id=birth[3], sub_location_of_birth_id=birth[4], village_of_birth_id=birth[5],
+                father_name=f"{rng.choice(group['male'])} {last}", father_id=f"{rng.randint(10_000_000, 39_999_999)}",
+                mother_name=f"{rng.choice(group['female'])} {rng.choice(group['surnames'])}",
+                mother_id=f"{rng.randint(10_000_000, 39_999_999)}",
+                registration_date=born + timedelta(days=rng.randint(7, 365)),
+                issuing_office=f"{self.places.names['county', birth[0]]} Civil Registration Office",
+                registrar_name=f"Registrar {rng.choice(group['male'] + group['female'])} {rng.choice(group['surnames'])}",
+                created_at=created, updated_at=created,
+            )
+
+            final = self.pick(STATUS_WEIGHTS)
+            application_type = self.pick(APPLICATION_TYPE_WEIGHTS)
+            path = status_path(final)
+            steps = [created]
+            for _ in path[1:]:
+                steps.append(self.moment(steps[-1], rng.uniform(0.1, 6)))
+            application = IDApplication(
+                application_id=uuid.uuid5(SEED_NAMESPACE, username),
+                application_type=application_type, entry_point=self.pick(ENTRY_POINT_WEIGHTS), status=final,
+                full_name=full_name, date_of_birth=born, place_of_birth=certificate.place_of_birth, gender=gender,
+                county_of_birth_id=birth[0], sub_county_of_birth_id=birth[1], division_of_birth_id=birth[2],
+                location_of_birth_id=birth[3], sub_location_of_birth_id=birth[4], village_of_birth_id=birth[5],
+                current_county_id=current[0], current_sub_county_id=current[1], current_division_id=current[2],
+                current_location_id=current[3], current_sub_location_id=current[4], current_village_id=current[5],
+                father_name=certificate.father_name, father_id=certificate.father_id,
+                mother_name=certificate.mother_name, mother_id=certificate.mother_id,
+                phone_number=phone, email=user.email,
+                created_at=created, updated_at=steps[-1],
+            )
+            if application_type == 'replacement':
+                application.previous_id_number = f"{rng.randint(10_000_000, 39_999_999)}"
+                application.police_ob_number = f"OB/{rng.randint(1, 999)}/{created.year}"
+                application.replacement_reason = rng.choice(('lost', 'stolen', 'damaged', 'mutilated'))
+            elif application_type == 'name_change':
+                application.old_name = full_name
+                application.new_name = f"{first} {middle} {rng.choice(group['surnames'])}"
+                application.name_change_reason = rng.choice(('Marriage', 'Religion', 'Personal choice'))
+            if final not in ('started', 'documents_uploaded', 'cancelled'):
+                application.submitted_at = steps[2] if len(steps) > 2 else steps[-1]
+            if 'do_approved' in path:
+                application.approved_at = steps[path.index('do_approved')]
+
+            history = [
+                ApplicationStatusHistory(
+                    previous_status=path[step - 1] if step else None, new_status=status,
+                    change_reason='Seeded', location_type=LOCATION_TYPES.get(status, 'do_office'),
+                    timestamp=steps[step],
+                )
+                for step, status in enumerate(path)
+            ]
+            citizens.append((index, user, certificate, application, history, steps))
+        return citizens
+
+
+def seed_shard(shard, seed, options):
+    """Generate and insert one shard; returns ``{model name: rows inserted}``"""
+    from .management.commands.generate_ids import Command as GenerateIDs
+    from .models import (
+        ApplicationStatusHistory, BirthCertificate, CustomUser, Fee, IDApplication, NationalID, Payment,
+    )
+    from .numbering import application_numbers, claim_id_numbers
+
+    names = list(GenerateIDs().kenyan_names.values())
+    places = gazetteer()
+    start = shard * SHARD_SIZE
+    count = min(SHARD_SIZE, options['citizens'] - start)
+    citizens = ShardGenerator(seed, shard, options, names, places).generate(start, count)
+    if not citizens:
+        return {}
+    fees = {
+        fee_type: (pk, amount)
+        for fee_type, pk, amount in Fee.objects.filter(fee_type__in=FEE_TYPES.values()).values_list('fee_type', 'pk', 'amount')
+    }
+
+    period, numbers = application_numbers.take(len(citizens))
+    issued = [citizen for citizen in citizens if citizen[3].status in ISSUED_STATUSES]
+    id_numbers = claim_id_numbers(len(issued)) if issued else []
+    batch_size = options['batch_size']
+    prefix = options['prefix']
+
+    with transaction.atomic(), historic_timestamps(
+        CustomUser, BirthCertificate, IDApplication, ApplicationStatusHistory, NationalID, Payment,
+    ):
+        users = CustomUser.objects.bulk_create([citizen[1] for citizen in citizens], batch_size=batch_size)
+        BirthCertificate.objects.bulk_create([citizen[2] for citizen in citizens], batch_size=batch_size)
+        for number, (_, user, certificate, application, _, _) in zip(numbers, citizens):
+            application.application_number = f"ID{period}{number:07d}"
+            application.applicant_id = user.pk
+            application.birth_certificate_id = certificate.pk
+        applications = IDApplication.objects.bulk_create([citizen[3] for citizen in citizens], batch_size=batch_size)
+
+        history = []
+        for _, user, _, application, rows, _ in citizens:
+            for row in rows:
+                row.application_id = application.pk
+                row.changed_by_id = user.pk
+                history.append(row)
+        ApplicationStatusHistory.objects.bulk_create(history, batch_size=batch_size)
+
+        payments = []
+        for index, user, _, application, _, steps in citizens:
+            fee_type = FEE_TYPES.get(application.application_type)
+            if fee_type not in fees or application.status in ('started', 'cancelled'):
+                continue
+            paid_at = steps[min(1, len(steps) - 1)]
+            payments.append(Payment(
+                application_id=application.pk, fee_id=fees[fee_type][0], amount=fees[fee_type][1],
+                payment_method='mpesa', payment_reference=f"{prefix}PAY{index:09d}",
+                external_reference=f"{prefix}S{index:09d}", status='completed', payer_phone=application.phone_number,
+                payer_name=application.full_name, paid_at=paid_at, created_at=paid_at,
+            ))
+        Payment.objects.bulk_create(payments, batch_size=batch_size)
+
+        national_ids = []
+        for id_number, (index, user, _, application, _, steps) in zip(id_numbers, issued):
+            collected = application.status == 'collected'
+            ready_at = steps[STATUS_PATHS.index('ready_for_collection')]
+            national_ids.append(NationalID(
+                application_id=application.pk, id_number=id_number, full_name=application.full_name,
+                date_of_birth=application.date_of_birth, place_of_birth=application.place_of_birth,
+                gender=application.gender,
+                district_of_birth=places.names['county', application.county_of_birth_id],
+                division_of_birth=places.names['division', application.division_of_birth_id],
+                location_of_birth=places.names['location', application.location_of_birth_id],
+                sub_location=places.names['sub_location', application.sub_location_of_birth_id],
+                place_of_issue=places.names['county', application.current_county_id],
+                date_of_issue=ready_at.date(), serial_number=f"{prefix}ID{index:09d}",
+                is_printed=True, is_dispatched=True, is_ready_for_collection=True, is_collected=collected,
+                collected_at=steps[-1] if collected else None, collected_by_id=user.pk if collected else None,
+                printed_at=ready_at, dispatched_at=ready_at, created_at=ready_at, updated_at=steps[-1],
+            ))
+            user.national_id = id_number
+        NationalID.objects.bulk_create(national_ids, batch_size=batch_size)
+        CustomUser.objects.bulk_update([citizen[1] for citizen in issued], ['national_id'], batch_size=batch_size)
+
+    return {
+        'users': len(users), 'birth_certificates': len(citizens), 'applications': len(applications),
+        'status_history': len(history), 'payments': len(payments), 'national_ids': len(national_ids),
+    }
+
+
+def _init_worker():
+    # Spawned (not forked) workers start without Django configured
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def shard_count(citizens):
+    return (citizens + SHARD_SIZE - 1) // SHARD_SIZE
+
+
+def seed_citizens(citizens, seed=254, workers=1, batch_size=1000, prefix='LT', days=730, password='!'):
+    """
+    Seed ``citizens`` citizens with their records; yields ``{model name: rows}`` per finished shard.
+
+    ``password`` is stored as given, so pass a hash (``make_password``) for usable logins.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    options = {
+        'citizens': citizens, 'batch_size': batch_size, 'prefix': prefix, 'days': days,
+        'password': password,
+        # One reference time, so a seed gives the same dates in every worker
+        'now': timezone.make_aware(datetime.combine(timezone.localdate(), time(12))),
+    }
+    shards = range(shard_count(citizens))
+    if workers <= 1:
+        for shard in shards:
+            yield seed_shard(shard, seed, options)
+        return
+
+    # Workers open their own connections; a forked copy of ours must never be used
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for counts in pool.map(seed_shard, shards, [seed] * len(shards), [options] * len(shards)):
+            yield counts
@@ -0,0 +1,166 @@
+# signals.py
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .audit import audit_delete, audit_save, record, remember
+from .gazetteer import invalidate_gazetteer
+from .models import (
+    ApplicationStatusHistory, BirthCertificate, ChiefEligibilityLetter, County, CustomUser, Division,
+    IDApplication, Location, NationalID, NotificationTemplate, Payment, SubCounty, SubLocation, Village,
+    WaitingCard,
+)
+from .names import reindex_name, unindex_name
+from .notifications import enqueue_status_notifications, invalidate_templates
+from .qr import schedule_render
+from .search import reindex_instance, unindex_instance
+from .stats import local_date, schedule_refresh
+from .timeline import DIMENSION_FIELDS, create_timeline, stamp_status, update_dimensions
+
+
+# Daily statistics rollup
+@receiver([post_save, post_delete], sender=IDApplication)
+def refresh_application_stats(sender, instance, **kwargs):
+    schedule_refresh(local_date(instance.created_at))
+
+
+@receiver(post_init, sender=Payment)
+def remember_paid_at(sender, instance, **kwargs):
+    instance._loaded_paid_at = instance.__dict__.get('paid_at')
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def refresh_payment_stats(sender, instance, **kwargs):
+    # A payment moved to another day (or no longer dated) leaves its old day's totals stale too
+    schedule_refresh(local_date(getattr(instance, '_loaded_paid_at', None)), local_date(instance.paid_at))
+    instance._loaded_paid_at = instance.paid_at
+
+
+@receiver([post_save, post_delete], sender=NationalID)
+def refresh_collection_stats(sender, instance, **kwargs):
+    schedule_refresh(local_date(instance.collected_at))
+
+
+# Search index
+@receiver(post_save, sender=IDApplication)
+@receiver(post_save, sender=BirthCertificate)
+@receiver(post_save, sender=NationalID)
+@receiver(post_save, sender=WaitingCard)
+@receiver(post_save, sender=CustomUser)
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    reindex_instance(instance, update_fields)
+
+
+@receiver(post_delete, sender=IDApplication)
+@receiver(post_delete, sender=BirthCertificate)
+@receiver(post_delete, sender=NationalID)
+@receiver(post_delete, sender=WaitingCard)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_instance(instance)
+
+
+# Name matching
+@receiver(post_save, sender=IDApplication)
+@receiver(post_save, sender=BirthCertificate)
+@receiver(post_save, sender=NationalID)
+def update_name_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    reindex_name(instance, update_fields)
+
+
+@receiver(post_delete, sender=IDApplication)
+@receiver(post_delete, sender=BirthCertificate)
+@receiver(post_delete, sender=NationalID)
+def remove_from_name_index(sender, instance, **kwargs):
+    unindex_name(instance)
+
+
+# Administrative gazetteer
+@receiver([post_save, post_delete], sender=County)
+@receiver([post_save, post_delete], sender=SubCounty)
+@receiver([post_save, post_delete], sender=Division)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=SubLocation)
+@receiver([post_save, post_delete], sender=Village)
+def refresh_gazetteer(sender, **kwargs):
+    invalidate_gazetteer()
+
+
+# QR codes
+@receiver(post_save, sender=ChiefEligibilityLetter)
+@receiver(post_save, sender=WaitingCard)
+def render_qr_code(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_render(instance)
+
+
+# Notification outbox: a status change recorded one at a time queues its notifications
+# in the same transaction (workflow.py queues its own, its history rows send no signals)
+@receiver(post_save, sender=ApplicationStatusHistory)
+def queue_status_notifications(sender, instance, created, raw=False, **kwargs):
+    if raw or not created or instance.new_status == instance.previous_status:
+        return
+    enqueue_status_notifications([instance.application_id], instance.new_status)
+
+
+# Compiled notification templates
+@receiver([post_save, post_delete], sender=NotificationTemplate)
+def refresh_notification_templates(sender, **kwargs):
+    invalidate_templates()
+
+
+# Audit trail: loaded instances keep a snapshot their next save is compared with
+@receiver(post_init, sender=IDApplication)
+@receiver(post_init, sender=BirthCertificate)
+@receiver(post_init, sender=NationalID)
+def remember_audited_values(sender, instance, **kwargs):
+    remember(instance)
+
+
+@receiver(post_save, sender=IDApplication)
+@receiver(post_save, sender=BirthCertificate)
+@receiver(post_save, sender=NationalID)
+def audit_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    audit_save(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=IDApplication)
+@receiver(post_delete, sender=BirthCertificate)
+@receiver(post_delete, sender=NationalID)
+def audit_deleted(sender, instance, **kwargs):
+    audit_delete(instance)
+
+
+@receiver(user_logged_in)
+def audit_login(sender, request, user, **kwargs):
+    record('login', user, request=request, user=user)
+
+
+@receiver(user_logged_out)
+def audit_logout(sender, request, user, **kwargs):
+    if user is not None:
+        record('logout', user, request=request, user=user)
+
+
+# Application timelines (workflow transitions stamp theirs through an on_enter hook)
+@receiver(post_save, sender=IDApplication)
+def maintain_timeline(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        create_timeline(instance)
+    elif update_fields is None or DIMENSION_FIELDS & set(update_fields):
+        update_dimensions(instance)
+
+
+@receiver(post_save, sender=ApplicationStatusHistory)
+def stamp_timeline(sender, instance, created, raw=False, **kwargs):
+    if raw or not created or instance.new_status == instance.previous_status:
+        return
+    stamp_status([instance.application_id], instance.new_status, instance.timestamp)
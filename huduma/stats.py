@@ -0,0 +1,349 @@
+# stats.py
+"""
+Daily statistics rollup.
+
+``DailyStats`` holds one row per day and per (county, status, application type,
+entry point) with the number of applications created, completed payments and
+revenue received, and IDs collected along with their total processing time.
+Dashboards read these few rows instead of scanning ``IDApplication``,
+``Payment`` and ``NationalID``, usually through ``time_series()``.
+
+The rollup is filled by ``manage.py backfill_daily_stats`` and kept current in
+two steps. The signal handlers in ``signals.py`` mark every day touched by a
+save or delete as stale (a ``StaleDailyStats`` row, one small INSERT once the
+transaction commits), and ``manage.py refresh_daily_stats --loop`` recomputes
+the stale days outside the request path. Recomputing a whole day (rather than
+incrementing counters) keeps the table self-healing; a busy day is recomputed
+once per pass of the worker however many saves touched it, and a per-day lock
+keeps two recomputes of the same day from interleaving.
+
+Payments and collections are filed under the dimensions of their application
+as they were when the day was last recomputed; a status change does not move
+rows of earlier days. Totals are unaffected, and a periodic backfill of the
+last few weeks brings the per-status split back in line::
+
+    HUDUMA_DAILY_STATS = {
+        'live_updates': True,  # mark touched days stale on commit
+    }
+"""
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, DateField, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from .generations import bump_generation, current_generation
+
+
+logger = logging.getLogger(__name__)
+
+DAILY_STATS_DEFAULTS = {
+    'live_updates': True,
+}
+
+DIMENSIONS = ('current_county_id', 'status', 'application_type', 'entry_point')
+
+# pg_advisory_xact_lock class key of the per-day refresh locks ('HUDS')
+DAY_LOCK_CLASS = 0x48554453
+
+PENDING_STATUSES = ['started', 'documents_uploaded', 'chief_review', 'do_review']
+APPROVED_STATUSES = ['do_approved', 'biometrics_scheduled', 'biometrics_taken', 'processing']
+
+
+def daily_stats_config():
+    """Return the effective rollup configuration"""
+    config = dict(DAILY_STATS_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_DAILY_STATS', {}))
+    return config
+
+
+def day_bounds(start, end):
+    """Return aware datetimes covering the dates ``start``..``end`` inclusive"""
+    tz = timezone.get_current_timezone()
+    lower = timezone.make_aware(datetime.combine(start, datetime.min.time()), tz)
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), datetime.min.time()), tz)
+    return lower, upper
+
+
+def _grouped(queryset, date_field, prefix='', **aggregates):
+    """Group ``queryset`` by local date of ``date_field`` and the rollup dimensions"""
+    fields = [f'{prefix}{dimension}' for dimension in DIMENSIONS]
+    rows = (
+        queryset.annotate(day=TruncDate(date_field))
+        .order_by()
+        .values('day', *fields)
+        .annotate(**aggregates)
+    )
+    for row in rows:
+        yield (row['day'], *(row[field] for field in fields)), row
+
+
+def compute_daily_stats(start, end):
+    """Aggregate the raw tables for dates ``start``..``end`` into unsaved ``DailyStats`` rows"""
+    from .models import DailyStats, IDApplication, NationalID, Payment
+
+    lower, upper = day_bounds(start, end)
+    rows = {}
+
+    def row_for(key):
+        if key not in rows:
+            day, county_id, status, application_type, entry_point = key
+            rows[key] = DailyStats(
+                date=day, county_id=county_id, status=status,
+                application_type=application_type, entry_point=entry_point,
+            )
+        return rows[key]
+
+    applications = IDApplication.objects.filter(created_at__gte=lower, created_at__lt=upper)
+    for key, values in _grouped(applications, 'created_at', n=Count('id')):
+        row_for(key).applications = values['n']
+
+    payments = Payment.objects.filter(status='completed', paid_at__gte=lower, paid_at__lt=upper)
+    for key, values in _grouped(payments, 'paid_at', 'application__', n=Count('id'), total=Sum('amount')):
+        row = row_for(key)
+        row.payments = values['n']
+        row.revenue = values['total'] or Decimal('0.00')
+
+    processing = ExpressionWrapper(F('collected_at') - F('application__created_at'), output_field=DurationField())
+    collections = NationalID.objects.filter(is_collected=True, collected_at__gte=lower, collected_at__lt=upper)
+    for key, values in _grouped(collections, 'collected_at', 'application__', n=Count('id'), duration=Sum(processing)):
+        row = row_for(key)
+        row.collected = values['n']
+        row.processing_seconds = int(values['duration'].total_seconds()) if values['duration'] else 0
+
+    return list(rows.values())
+
+
+def lock_days(start, end):
+    """Hold a lock on dates ``start``..``end`` until the current transaction ends"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, day) FROM generate_series(%s, %s) AS day ORDER BY day",
+                [DAY_LOCK_CLASS, start.toordinal(), end.toordinal()],
+            )
+    # SQLite allows a single writer, which serialises refreshes already
+
+
+def refresh_daily_stats(start, end=None):
+    """Recompute the rollup for dates ``start``..``end`` and return the number of rows written"""
+    from .models import DailyStats
+
+    end = end or start
+    with transaction.atomic():
+        # Without the lock a second refresh of the same day could insert before the
+        # first commits and fail on the unique constraint
+        lock_days(start, end)
+        rows = compute_daily_stats(start, end)
+        DailyStats.objects.filter(date__gte=start, date__lte=end).delete()
+        DailyStats.objects.bulk_create(rows, batch_size=1000)
+        if start < timezone.localdate():
+            # Cached time series for closed buckets may include these days
+            bump_stats_generation()
+    return len(rows)
+
+
+# Live updates
+_local = threading.local()
+
+
+def schedule_refresh(*dates):
+    """Mark ``dates`` stale once the current transaction commits"""
+    dates = {date for date in dates if date is not None}
+    if not dates or not daily_stats_config()['live_updates']:
+        return
+    # A transaction saving many rows queues one callback per row; the first one to
+    # run marks the dates of them all and the others find nothing left to do
+    if not hasattr(_local, 'dates'):
+        _local.dates = set()
+    _local.dates |= dates
+    transaction.on_commit(_mark_pending)
+
+
+def _mark_pending():
+    dates, _local.dates = _local.dates, set()
+    if not dates:
+        return
+    try:
+        mark_stale(dates)
+    except DatabaseError:
+        # The data is committed already; the nightly backfill covers the day
+        logger.exception("Could not mark daily stats stale for %s", ', '.join(map(str, sorted(dates))))
+
+
+def mark_stale(dates):
+    """Queue ``dates`` for ``refresh_stale_days``; days already queued keep their place"""
+    from .models import StaleDailyStats
+
+    StaleDailyStats.objects.bulk_create([StaleDailyStats(date=date) for date in sorted(dates)], ignore_conflicts=True)
+
+
+def refresh_stale_days(limit=None):
+    """
+    Recompute the days marked stale, oldest first; yields ``(date, rows written)`` per day.
+
+    Each day is taken off the queue before it is recomputed, so a save that
+    commits meanwhile queues it again rather than being missed. A day that
+    fails is logged, queued again for the next run and yields ``None``.
+    """
+    from .models import StaleDailyStats
+
+    failed = set()
+    done = 0
+    while limit is None or done < limit:
+        with transaction.atomic():
+            stale = (
+                StaleDailyStats.objects.select_for_update(skip_locked=True)
+                .exclude(date__in=failed).order_by('date').first()
+            )
+            if stale is None:
+                break
+            stale.delete()
+        done += 1
+        try:
+            rows = refresh_daily_stats(stale.date)
+        except Exception:
+            logger.exception("Could not refresh daily stats for %s", stale.date)
+            failed.add(stale.date)
+            mark_stale([stale.date])
+            rows = None
+        yield stale.date, rows
+
+
+def local_date(value):
+    """Return the local date of an aware datetime, or None"""
+    return timezone.localdate(value) if value else None
+
+
+# Reading the rollup
+MEASURES = ('applications', 'payments', 'revenue', 'collected', 'processing_seconds')
+
+BUCKETS = ('day', 'week', 'month')
+
+# Query parameter -> DailyStats field usable as a time-series filter
+SERIES_DIMENSIONS = {
+    'county': 'county_id',
+    'status': 'status',
+    'application_type': 'application_type',
+    'entry_point': 'entry_point',
+}
+
+TIMESERIES_DEFAULTS = {
+    'max_buckets': {'day': 366, 'week': 156, 'month': 60},
+    'cache_timeout': 60 * 60,  # closed buckets only; the current bucket is always live
+}
+
+GENERATION = 'daily_stats'
+
+
+def timeseries_config():
+    """Return the effective time-series configuration"""
+    config = dict(TIMESERIES_DEFAULTS)
+    config.update(getattr(settings, 'HUDUMA_TIMESERIES', {}))
+    return config
+
+
+def bucket_start(day, bucket):
+    """Return the first date of the bucket containing ``day`` (weeks start on Monday)"""
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown bucket {bucket!r}, expected one of {', '.join(BUCKETS)}")
+
+
+def next_bucket(day, bucket):
+    """Return the first date of the bucket after the one starting on ``day``"""
+    if bucket == 'day':
+        return day + timedelta(days=1)
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def stats_generation():
+    """Return a counter that changes whenever past days of the rollup are rewritten"""
+    return current_generation(GENERATION)
+
+
+def bump_stats_generation():
+    bump_generation(GENERATION)
+
+
+def _bucket_totals(measures, bucket, start, end, filters):
+    """Sum ``measures`` per bucket for dates ``start``..``end`` in a single grouped query"""
+    from .models import DailyStats
+
+    queryset = DailyStats.objects.filter(date__gte=start, date__lte=end, **filters)
+    rows = (
+        queryset.annotate(bucket=Trunc('date', bucket, output_field=DateField()))
+        .order_by()
+        .values('bucket')
+        .annotate(**{measure: Sum(measure) for measure in measures})
+    )
+    return {row['bucket']: {measure: row[measure] for measure in measures} for row in rows}
+
+
+def time_series(measures, bucket='day', start=None, end=None, filters=None):
+    """
+    Return ``(buckets, series)`` for DailyStats ``measures`` between ``start`` and ``end``.
+
+    ``buckets`` lists the first date of every bucket and ``series`` maps each measure to
+    its totals, zero-filled. ``filters`` maps ``SERIES_DIMENSIONS`` names to lists of
+    values. The range is capped at ``max_buckets`` (the most recent ones are kept), and
+    totals for buckets that have ended are cached until the rollup is rewritten.
+    """
+    config = timeseries_config()
+    for measure in measures:
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure {measure!r}, expected one of {', '.join(MEASURES)}")
+
+    lookups = {}
+    for name, values in sorted((filters or {}).items()):
+        if name not in SERIES_DIMENSIONS:
+            raise ValueError(f"Cannot filter time series by {name!r}")
+        if name == 'county':
+            values = [int(value) for value in values]
+        lookups[f'{SERIES_DIMENSIONS[name]}__in'] = sorted(values)
+
+    today = timezone.localdate()
+    end = end or today
+    buckets = []
+    day = bucket_start(start or end, bucket)
+    while day <= end:
+        buckets.append(day)
+        day = next_bucket(day, bucket)
+    buckets = buckets[-config['max_buckets'][bucket]:]
+    if not buckets:
+        return [], {measure: [] for measure in measures}
+
+    first = buckets[0]
+    current = bucket_start(today, bucket)
+    closed_end = min(end, current - timedelta(days=1))
+
+    totals = {}
+    if first <= closed_end:
+        signature = repr((sorted(measures), bucket, first, closed_end, lookups))
+        key = f"huduma:timeseries:{stats_generation()}:{hashlib.md5(signature.encode()).hexdigest()}"
+        closed = cache.get(key)
+        if closed is None:
+            closed = _bucket_totals(measures, bucket, first, closed_end, lookups)
+            cache.set(key, closed, config['cache_timeout'])
+        totals.update(closed)
+    if end >= current:
+        totals.update(_bucket_totals(measures, bucket, max(first, current), end, lookups))
+
+    series = {
+        measure: [totals.get(day, {}).get(measure) or 0 for day in buckets]
+        for measure in measures
+    }
+    return buckets, series
@@ -1,3 +1,847 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.forms.models import model_to_dict
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from . import gazetteer as gazetteer_module
+from .admin import ADMIN_STATS_CACHE_KEY, IDApplicationForm, admin_site
+from .archive import archived_status_history, write_part
+from .management.commands.generate_ids import Command as GenerateIDs
+from .models import (
+    ApplicationStatusHistory, ApplicationTimeline, ArchivedObject, AuditLog, Chief, ChiefOffice, ChiefStaff, County, CustomUser, DOOffice, DOOfficer,
+    DOStaff, Fee, HistoryArchive, HudumaCentre, HudumaStaff, IDApplication, IDNumberPool, NameToken, Notification, NotificationTemplate,
+    Payment, PaymentCallback, StaleDailyStats, SubLocation, Village, WaitingCard,
+)
+from .generations import _seen as seen_generations
+from .names import match_names, misspelled_names, name_token_rows
+from .numbering import claim_id_numbers, is_valid_id_number, top_up_pool
+from .payments import MPESA_TIMEZONE, mark_paid, process_callbacks
+from . import qr as qr_module
+from . import stats as stats_module
+from .qr import fill_payloads
+from .reconciliation import STATEMENT_COLUMNS, Reconciliation
+from .search import search_backend, search_queryset
+from .timeline import backfill_timelines, stage_percentiles, stamp_status
+from .workflow import InvalidTransition, bulk_transition
+
+
+# Queries an admin changelist or change form may run
+ADMIN_QUERY_BUDGET = 40
+
+
+def seed_county(code, citizens, prefix):
+    """Seed one county's hierarchy, an office of every kind with staff, and ``citizens`` citizens"""
+    call_command('seed_counties', county=[code], stdout=StringIO())
+    county = County.objects.get(code=code)
+    sub_location = SubLocation.objects.filter(county=county).select_related('location__division__sub_county').first()
+    sub_county = sub_location.location.division.sub_county
+
+    def user(role):
+        return CustomUser.objects.create_user(username=f'{prefix}-{role}', password='x', user_type=role)
+
+    chief_office = ChiefOffice.objects.create(
+        name=f'{sub_location.name} Chief Office', location=sub_location.location, sub_location=sub_location,
+        address='-', contact_phone='+254700000000',
+    )
+    chief = Chief.objects.create(
+        user=user('chief'), office=chief_office, employee_id=f'{prefix}-C1', stamp_serial=f'{prefix}-S1',
+        appointment_date=date(2020, 1, 1),
+    )
+    ChiefStaff.objects.create(
+        user=user('chief_staff'), chief_office=chief_office, position='Clerk', employee_id=f'{prefix}-C2',
+        reporting_chief=chief,
+    )
+    do_office = DOOffice.objects.create(
+        name=f'{county.name} DO Office', county=county, address='-', contact_phone='+254700000000',
+        postal_address='-',
+    )
+    officer = DOOfficer.objects.create(
+        user=user('do_officer'), do_office=do_office, employee_id=f'{prefix}-D1', appointment_date=date(2020, 1, 1),
+    )
+    DOStaff.objects.create(
+        user=user('do_staff'), do_office=do_office, position='Clerk', employee_id=f'{prefix}-D2',
+        reporting_officer=officer,
+    )
+    centre = HudumaCentre.objects.create(
+        name=f'{county.name} Huduma Centre', county=county, sub_county=sub_county, address='-',
+        contact_phone='+254700000000', services_offered='ID',
+    )
+    HudumaStaff.objects.create(user=user('huduma_staff'), huduma_centre=centre, position='Clerk', employee_id=f'{prefix}-H1')
+
+    call_command('seed_scale', citizens=citizens, prefix=prefix, seed=len(prefix), workers=1, rebuild=True, stdout=StringIO())
+
+
+def admin_pages():
+    """``(label, url)`` of the changelist and the change form of the first row of every registered model"""
+    for model in admin.site._registry:
+        opts = model._meta
+        yield f'{opts.label} changelist', reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+        obj = model._default_manager.order_by('pk').first()
+        if obj is not None:
+            try:
+                yield f'{opts.label} change', reverse(f'admin:{opts.app_label}_{opts.model_name}_change', args=[obj.pk])
+            except NoReverseMatch:
+                pass
+
+
+class AdminQueryTests(TestCase):
+    """Admin pages run a bounded number of queries, whatever the number of rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 20, 'T1')
+        cls.admin_user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'x', user_type='admin')
+
+    def setUp(self):
+        cache.delete(ADMIN_STATS_CACHE_KEY)
+        self.client.force_login(self.admin_user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries.captured_queries)
+
+    def test_pages_within_budget(self):
+        for label, url in admin_pages():
+            with self.subTest(label):
+                self.assertLessEqual(self.get(url), ADMIN_QUERY_BUDGET)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        urls = [url for label, url in admin_pages() if label.endswith('changelist')]
+        counts = {url: self.get(url) for url in urls}
+        seed_county('001', 40, 'T2')
+        for url in urls:
+            with self.subTest(url):
+                with self.assertNumQueries(counts[url]):
+                    self.client.get(url)
+
+    def test_dashboard_stats_only_on_index(self):
+        request = RequestFactory().get('/admin/')
+        request.user = self.admin_user
+        with self.assertNumQueries(0):
+            context = admin_site.each_context(request)
+        self.assertNotIn('county_stats', context)
+
+        with CaptureQueriesContext(connection) as first:
+            admin_site.index(request)
+        self.assertIsNotNone(cache.get(ADMIN_STATS_CACHE_KEY))
+        # Served from the snapshot the second time
+        with self.assertNumQueries(0):
+            admin_site.index(request)
+        self.assertTrue(first.captured_queries)
+
+
+class ApplicationStatusFormTests(TestCase):
+    """The admin change form only offers status moves the workflow allows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 1, 'T1')
+        cls.application = IDApplication.objects.get()
+
+    def form(self, status):
+        data = {**model_to_dict(self.application), 'status': status}
+        return IDApplicationForm(data, instance=self.application)
+
+    def test_refused_move_is_a_form_error(self):
+        self.application.status = 'started'
+        self.application.save(update_fields=['status'])
+        self.assertIn('Cannot move', self.form('collected').errors['status'][0])
+
+    def test_allowed_move_is_accepted(self):
+        self.application.status = 'chief_review'
+        self.application.save(update_fields=['status'])
+        self.assertNotIn('status', self.form('chief_approved').errors)
+
+    def test_refused_move_stays_on_the_change_form(self):
+        admin_user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'x', user_type='admin')
+        request = RequestFactory().post('/', {'status': 'collected'})
+        request.user = admin_user
+        response = admin.site._registry[IDApplication].response_change(request, self.application)
+        self.assertEqual(response.url, '/')
+
+
+class AddressHierarchyTests(TestCase):
+    """Addresses whose village is not in their sub-location are refused and reported"""
+
+    @classmethod
+    def forget_gazetteer(cls):
+        gazetteer_module._current = None
+
+    @classmethod
+    def setUpTestData(cls):
+        # The tree cached by an earlier test class may carry the same generation number
+        cls.forget_gazetteer()
+        cls.addClassCleanup(cls.forget_gazetteer)
+        seed_county('047', 1, 'A1')
+        cls.application = IDApplication.objects.get()
+        cls.stray_village = Village.objects.exclude(sub_location=cls.application.sub_location_of_birth_id).first()
+
+    def test_create_refuses_village_outside_sub_location(self):
+        application = self.application
+        data = {
+            'birth_certificate': application.birth_certificate.certificate_number, 'application_type': 'new',
+            'full_name': application.full_name, 'date_of_birth': application.date_of_birth.isoformat(),
+            'place_of_birth': application.place_of_birth, 'gender': application.gender,
+            'village_of_birth': self.stray_village.pk,
+        }
+        for address in ('birth', 'current'):
+            for field in gazetteer_module.ADDRESS_FIELDS[address]:
+                data.setdefault(field, getattr(application, f'{field}_id'))
+        self.client.force_login(CustomUser.objects.get(username='A1-huduma_staff'))
+        response = self.client.post(reverse('applications_create'), data)
+
+        self.assertEqual(response.status_code, 200)
+        errors = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(len(errors), 1)
+        self.assertIn(f"Village {self.stray_village.name!r} is not in sub location", errors[0])
+        self.assertEqual(IDApplication.objects.count(), 1)
+
+    def test_command_reports_row(self):
+        out = StringIO()
+        call_command('check_address_hierarchy', model=['application'], stdout=out)
+        self.assertIn('0 inconsistent', out.getvalue())
+
+        IDApplication.objects.filter(pk=self.application.pk).update(village_of_birth=self.stray_village)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = Path(directory.name) / 'inconsistent.csv'
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_address_hierarchy', model=['application'], output=str(output), fail=True, stdout=out)
+        self.assertIn(f'application {self.application.pk}: village_of_birth: Village', out.getvalue())
+        self.assertIn('1 inconsistent', out.getvalue())
+        with open(output, newline='') as handle:
+            rows = list(csv.DictReader(handle))
+        self.assertEqual(
+            [(row['model'], row['pk'], row['field']) for row in rows],
+            [('application', str(self.application.pk), 'village_of_birth')],
+        )
+
+
+@override_settings(HUDUMA_AUDIT={'background': False})
+class BulkAuditTests(TestCase):
+    """Bulk writes, which send no signals, still audit every application they change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 5, 'T1')
+        cls.user = CustomUser.objects.get(username='T1-chief')
+        cls.ids = list(IDApplication.objects.order_by('pk').values_list('pk', flat=True)[:3])
+
+    def audit_changes(self):
+        return {
+            int(object_id): changes for object_id, changes in AuditLog.objects.filter(
+                action='update', content_type='IDApplication', object_id__in=[str(pk) for pk in self.ids],
+            ).values_list('object_id', 'changes')
+        }
+
+    def test_bulk_transition(self):
+        IDApplication.objects.filter(pk__in=self.ids).update(status='chief_review', submitted_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transition(IDApplication.objects.filter(pk__in=self.ids), {'chief_review': 'chief_approved'}, self.user)
+        self.assertEqual(self.audit_changes(), dict.fromkeys(self.ids, {'status': ['chief_review', 'chief_approved']}))
+
+    def test_mark_paid(self):
+        IDApplication.objects.filter(pk__in=self.ids).update(fee_paid=False, payment_reference=None)
+        payments = {pk: Payment(payment_reference=f'REF{pk}', paid_at=timezone.now()) for pk in self.ids}
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_paid(payments)
+        self.assertEqual(self.audit_changes(), {
+            pk: {'fee_paid': [False, True], 'payment_reference': [None, f'REF{pk}']} for pk in self.ids
+        })
+        # Marking them paid again changes nothing, so records nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_paid(payments)
+        self.assertEqual(AuditLog.objects.filter(action='update', content_type='IDApplication').count(), len(self.ids))
+
+
+@override_settings(HUDUMA_GENERATIONS={'check_interval': 0})
+class BulkTransitionTests(TestCase):
+    """bulk_transition moves whole status groups with one statement each and leaves other rows alone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 6, 'T1')
+        cls.user = CustomUser.objects.get(username='T1-chief')
+        # The template's generation bump is rolled back with the class; forget it so later tests recompile
+        cls.addClassCleanup(seen_generations.clear)
+        cls.template = NotificationTemplate.objects.create(
+            name='chief approved', subject='Application {{ application.application_number }}',
+            message_template='{{ application.application_number }} is {{ status_display }}',
+            notification_type='sms', trigger_status='chief_approved',
+        )
+        ids = list(IDApplication.objects.order_by('pk').values_list('pk', flat=True))
+        cls.chief_review, cls.do_review, cls.started = ids[:3], ids[3:4], ids[4:]
+        for status, group in (('chief_review', cls.chief_review), ('do_review', cls.do_review), ('started', cls.started)):
+            IDApplication.objects.filter(pk__in=group).update(status=status)
+
+    def approve(self, **kwargs):
+        return bulk_transition(
+            IDApplication.objects.all(), {'chief_review': 'chief_approved', 'do_review': 'do_approved'}, self.user,
+            reason='Batch approval', **kwargs,
+        )
+
+    def test_moves_each_source_status(self):
+        with CaptureQueriesContext(connection) as queries:
+            moved = self.approve()
+        self.assertEqual(moved, {'chief_approved': 3, 'do_approved': 1})
+
+        statements = [query['sql'] for query in queries.captured_queries]
+        updates = [sql for sql in statements if sql.startswith(f'UPDATE "{IDApplication._meta.db_table}"')]
+        history_inserts = [sql for sql in statements if sql.startswith(f'INSERT INTO "{ApplicationStatusHistory._meta.db_table}"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(len(history_inserts), 2)
+
+        history = set(
+            ApplicationStatusHistory.objects.filter(change_reason='Batch approval')
+            .values_list('application_id', 'previous_status', 'new_status', 'changed_by')
+        )
+        self.assertEqual(history, {
+            *((pk, 'chief_review', 'chief_approved', self.user.pk) for pk in self.chief_review),
+            *((pk, 'do_review', 'do_approved', self.user.pk) for pk in self.do_review),
+        })
+        self.assertEqual(
+            set(Notification.objects.filter(template=self.template).values_list('application_id', flat=True)),
+            set(self.chief_review),
+        )
+        self.assertEqual(
+            set(IDApplication.objects.filter(pk__in=self.started).values_list('status', flat=True)), {'started'},
+        )
+
+    def test_notifications_can_be_skipped(self):
+        self.approve(notify=False)
+        self.assertFalse(Notification.objects.filter(template=self.template).exists())
+
+    def test_disallowed_transition_changes_nothing(self):
+        with self.assertRaises(InvalidTransition):
+            bulk_transition(IDApplication.objects.all(), {'chief_review': 'chief_approved', 'started': 'collected'}, self.user)
+        self.assertEqual(IDApplication.objects.filter(status='chief_review').count(), 3)
+        self.assertFalse(ApplicationStatusHistory.objects.filter(new_status='chief_approved', changed_by=self.user).exists())
+
+
+class IDNumberPoolTests(TestCase):
+    """Pooled National ID numbers carry a valid check digit and are handed out once"""
+
+    def test_top_up_counts_the_rows_it_inserts(self):
+        self.assertEqual(top_up_pool(500, batch_size=200, rng=random.Random(3)), 500)
+        self.assertEqual(IDNumberPool.objects.count(), 500)
+        # The same shuffle again: every first candidate is pooled already
+        self.assertEqual(top_up_pool(200, batch_size=200, rng=random.Random(3)), 200)
+        self.assertEqual(IDNumberPool.objects.count(), 700)
+        self.assertFalse(IDNumberPool.objects.filter(claim_token__isnull=False).exists())
+
+    @override_settings(HUDUMA_ID_POOL={'refill_size': 100})
+    def test_claimed_numbers_are_valid_and_unique(self):
+        top_up_pool(250, rng=random.Random(5))
+        claimed = [number for size in (100, 100, 120, 80) for number in claim_id_numbers(size)]
+        self.assertEqual(len(claimed), 400)
+        self.assertEqual(len(set(claimed)), len(claimed))
+        self.assertTrue(all(is_valid_id_number(number) for number in claimed))
+        self.assertEqual(IDNumberPool.objects.filter(claimed_at__isnull=False).count(), 400)
+        # The next claim does not reuse a claimed number
+        self.assertNotIn(claim_id_numbers(1)[0], claimed)
+
+
+class PaymentStatsTests(TestCase):
+    """Saving or deleting a payment marks every day whose totals it changes as stale"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 1, 'P1')
+        cls.paid_at = timezone.make_aware(datetime(2026, 3, 10, 9))
+        fee = Fee.objects.first()
+        cls.pk = Payment.objects.create(
+            application=IDApplication.objects.get(), fee=fee, amount=fee.amount, payment_method='mpesa',
+            status='completed', paid_at=cls.paid_at,
+        ).pk
+
+    def setUp(self):
+        # Days queued by earlier tests whose transactions never committed
+        stats_module._local.dates = set()
+
+    def stale_days(self, change):
+        StaleDailyStats.objects.all().delete()
+        payment = Payment.objects.get(pk=self.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            change(payment)
+        return set(StaleDailyStats.objects.values_list('date', flat=True))
+
+    def move(self, payment):
+        payment.paid_at = self.paid_at + timedelta(days=3)
+        payment.save()
+
+    def refund(self, payment):
+        payment.status, payment.paid_at = 'refunded', None
+        payment.save()
+
+    def test_moved_payment_refreshes_both_days(self):
+        self.assertEqual(self.stale_days(self.move), {date(2026, 3, 10), date(2026, 3, 13)})
+
+    def test_refund_refreshes_the_day_it_was_paid(self):
+        self.assertEqual(self.stale_days(self.refund), {date(2026, 3, 10)})
+
+    def test_delete_after_a_move_refreshes_both_days(self):
+        def move_and_delete(payment):
+            payment.paid_at = self.paid_at - timedelta(days=1)
+            payment.delete()
+        self.assertEqual(self.stale_days(move_and_delete), {date(2026, 3, 9), date(2026, 3, 10)})
+
+
+@override_settings(HUDUMA_PAYMENTS={'callback_token': 'secret'})
+class PaymentCallbackTests(TestCase):
+    """M-Pesa confirmations are staged once and pay an application at most once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 3, 'T1')
+        cls.fee = Fee.objects.update_or_create(
+            fee_type='new_id', defaults={'amount': Decimal('1000.00'), 'description': 'New ID', 'effective_from': date(2020, 1, 1)},
+        )[0]
+        Payment.objects.all().delete()
+        IDApplication.objects.update(application_type='new', fee_paid=False, payment_reference=None)
+        cls.unpaid, cls.paid, cls.pending = IDApplication.objects.order_by('pk')
+        IDApplication.objects.filter(pk=cls.paid.pk).update(fee_paid=True, payment_reference='EARLIER')
+        cls.pending_payment = Payment.objects.create(
+            application=cls.pending, fee=cls.fee, amount=Decimal('1000.00'), payment_method='mpesa',
+            payment_reference='PAYPENDING1', status='pending',
+        )
+
+    def post(self, trans_id, account, amount='1000.00', token='secret'):
+        payload = {
+            'TransID': trans_id, 'TransAmount': amount, 'TransTime': '20250118143015',
+            'BillRefNumber': account, 'MSISDN': '254700000000', 'FirstName': 'WANJIRU',
+        }
+        return self.client.post(
+            f"{reverse('mpesa_callback')}?token={token}", json.dumps(payload), content_type='application/json',
+        )
+
+    def process(self):
+        totals = {}
+        for totals in process_callbacks():
+            pass
+        return totals
+
+    def callback(self, trans_id):
+        return PaymentCallback.objects.get(external_reference=trans_id)
+
+    def test_rejected_with_wrong_token(self):
+        self.assertEqual(self.post('QAZ0000001', self.unpaid.application_number, token='guess').status_code, 403)
+        self.assertFalse(PaymentCallback.objects.exists())
+
+    def test_retried_confirmation_pays_once(self):
+        for _ in range(2):
+            self.assertEqual(self.post('QAZ0000001', self.unpaid.application_number).status_code, 200)
+        self.assertEqual(PaymentCallback.objects.count(), 1)
+        self.assertEqual(self.process(), {'matched': 1})
+
+        payment = Payment.objects.get(external_reference='QAZ0000001')
+        self.assertEqual((payment.status, payment.application_id, payment.amount), ('completed', self.unpaid.pk, self.fee.amount))
+        self.unpaid.refresh_from_db()
+        self.assertEqual((self.unpaid.fee_paid, self.unpaid.payment_reference), (True, 'MPQAZ0000001'))
+
+    def test_recorded_transaction_is_a_duplicate(self):
+        Payment.objects.create(
+            application=self.paid, fee=self.fee, amount=Decimal('1000.00'), payment_method='mpesa',
+            payment_reference='EARLIER', external_reference='QAZ0000002', status='completed',
+        )
+        self.post('QAZ0000002', self.unpaid.application_number)
+        self.assertEqual(self.process(), {'duplicate': 1})
+        self.assertEqual(Payment.objects.filter(external_reference='QAZ0000002').count(), 1)
+        self.unpaid.refresh_from_db()
+        self.assertFalse(self.unpaid.fee_paid)
+
+    def test_underpayment_is_unmatched(self):
+        self.post('QAZ0000003', self.unpaid.application_number, amount='999.00')
+        self.assertEqual(self.process(), {'unmatched': 1})
+        self.assertIn('the fee is KES 1000.00', self.callback('QAZ0000003').error_message)
+        self.assertFalse(Payment.objects.filter(application=self.unpaid).exists())
+        self.unpaid.refresh_from_db()
+        self.assertFalse(self.unpaid.fee_paid)
+
+    def test_paid_application_is_not_paid_twice(self):
+        self.post('QAZ0000004', self.paid.application_number)
+        self.post('QAZ0000005', self.unpaid.application_number)
+        self.post('QAZ0000006', self.unpaid.application_number)
+        self.assertEqual(self.process(), {'unmatched': 2, 'matched': 1})
+        self.assertEqual(self.callback('QAZ0000004').error_message, 'Application is already paid')
+        self.assertEqual(self.callback('QAZ0000006').error_message, 'Application is already paid')
+        self.assertFalse(Payment.objects.filter(application=self.paid).exists())
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.payment_reference, 'EARLIER')
+
+    def test_pending_payment_reference_completes_that_payment(self):
+        self.post('QAZ0000007', 'paypending1')
+        self.assertEqual(self.process(), {'matched': 1})
+        self.pending_payment.refresh_from_db()
+        self.assertEqual((self.pending_payment.status, self.pending_payment.external_reference), ('completed', 'QAZ0000007'))
+        self.assertEqual(Payment.objects.filter(application=self.pending).count(), 1)
+        self.pending.refresh_from_db()
+        self.assertEqual((self.pending.fee_paid, self.pending.payment_reference), (True, 'PAYPENDING1'))
+
+
+class ReconciliationTests(TestCase):
+    """Every statement line lands in one outcome; --apply fixes only what it may"""
+
+    # (receipt, amount, account) of the statement, read on 18 January 2025 from 10:00
+    statement = (
+        ('R1', '1,000.00', ''),          # matched
+        ('R2', '900.00', ''),            # amount_mismatch
+        ('R3', '1,000.00', ''),          # payment_not_completed (failed)
+        ('R4', '1,000.00', ''),          # payment_refunded
+        ('R5', '1,000.00', ''),          # application_not_paid
+        ('R6', '1,000.00', 'paypend6'),  # pending_confirmed
+        ('R7', '1,000.00', 'ZZZ'),       # orphan_line
+        ('R1', '1,000.00', ''),          # duplicate
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 7, 'T1')
+        Payment.objects.all().delete()
+        fee = Fee.objects.update_or_create(
+            fee_type='new_id', defaults={'amount': Decimal('1000.00'), 'description': 'New ID', 'effective_from': date(2020, 1, 1)},
+        )[0]
+        IDApplication.objects.update(fee_paid=False, payment_reference=None)
+        cls.applications = list(IDApplication.objects.order_by('pk'))
+        at = datetime(2025, 1, 18, 10, 3, tzinfo=MPESA_TIMEZONE)
+        for number, (status, reference) in enumerate((
+            ('completed', 'R1'), ('completed', 'R2'), ('failed', 'R3'), ('refunded', 'R4'), ('completed', 'R5'),
+            ('pending', None), ('completed', 'R8'),
+        ), start=1):
+            Payment.objects.create(
+                application=cls.applications[number - 1], fee=fee, amount=fee.amount, payment_method='mpesa',
+                payment_reference=f'PAYPEND{number}' if status == 'pending' else f'PAY{number}',
+                external_reference=reference, status=status, paid_at=at if status == 'completed' else None,
+            )
+        IDApplication.objects.filter(pk=cls.applications[0].pk).update(fee_paid=True, payment_reference='PAY1')
+
+    def reconcile(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path, report = Path(directory) / 'statement.csv', Path(directory) / 'report.csv'
+            with open(path, 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(STATEMENT_COLUMNS.values())
+                for minute, (reference, amount, account) in enumerate(self.statement):
+                    writer.writerow((reference, f'2025-01-18 10:{minute:02d}:00', amount, account, '254700000000 - PAYER', 'Completed'))
+                writer.writerow(('R9', '2025-01-18 12:00:00', '', '', '', 'Completed'))  # withdrawal, skipped
+            call_command('reconcile_payments', str(path), '--report', str(report), *args, stdout=StringIO())
+            with open(report, newline='') as handle:
+                return [(row['outcome'], row['reference']) for row in csv.DictReader(handle)]
+
+    def payment(self, number):
+        return Payment.objects.get(application=self.applications[number - 1])
+
+    def application(self, number):
+        return IDApplication.objects.get(pk=self.applications[number - 1].pk)
+
+    def test_report(self):
+        self.assertEqual(sorted(self.reconcile()), sorted([
+            ('duplicate', 'R1'), ('amount_mismatch', 'R2'), ('payment_not_completed', 'R3'),
+            ('payment_refunded', 'R4'), ('application_not_paid', 'R5'), ('pending_confirmed', 'R6'),
+            ('orphan_line', 'R7'), ('orphan_payment', 'R8'),
+        ]))
+        # A dry run changes nothing
+        self.assertEqual(self.payment(3).status, 'failed')
+        self.assertFalse(self.application(5).fee_paid)
+        self.assertFalse(PaymentCallback.objects.exists())
+
+    def test_apply(self):
+        self.reconcile('--apply')
+        self.assertEqual((self.payment(3).status, self.application(3).fee_paid), ('completed', True))
+        self.assertTrue(self.application(5).fee_paid)
+        pending = self.payment(6)
+        self.assertEqual((pending.status, pending.external_reference), ('completed', 'R6'))
+        self.assertEqual(self.application(6).payment_reference, 'PAYPEND6')
+        staged = PaymentCallback.objects.get()
+        self.assertEqual((staged.provider, staged.external_reference, staged.account_reference), ('statement', 'R7', 'ZZZ'))
+        # Only reported: the refund stays refunded, the mismatch unpaid
+        self.assertEqual((self.payment(4).status, self.application(4).fee_paid), ('refunded', False))
+        self.assertFalse(self.application(2).fee_paid)
+
+    def test_duplicates_are_found_within_the_window(self):
+        lines = [
+            (number, reference, 100000, None, '', '')
+            for number, reference in enumerate(('X', 'Y', 'X', 'Z', 'W', 'X'), start=2)
+        ]
+        result = Reconciliation(chunk_size=1, duplicate_window=2).run(lines)
+        # The second X is one block after the first; the third is past the window
+        self.assertEqual((result.counts['duplicate'], result.counts['orphan_line']), (1, 5))
+
+
+class QRCodeTests(TestCase):
+    """Pages never store a missing QR payload; render_qr_codes does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 1, 'Q1')
+        cls.card = WaitingCard.objects.create(
+            application=IDApplication.objects.get(), expected_collection_date=date(2026, 1, 5),
+            collection_location=DOOffice.objects.get(), collection_instructions='-',
+        )
+        # A card saved before payloads were stored
+        WaitingCard.objects.filter(pk=cls.card.pk).update(qr_payload='')
+
+    def setUp(self):
+        # Rendered images go to a scratch file cache, not MEDIA_ROOT
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(HUDUMA_QR={'cache_dir': directory.name})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        qr_module._cache = None
+        self.addCleanup(setattr, qr_module, '_cache', None)
+
+    def stored_payload(self):
+        return WaitingCard.objects.values_list('qr_payload', flat=True).get(pk=self.card.pk)
+
+    def test_legacy_row_is_served_unversioned_without_a_write(self):
+        card = WaitingCard.objects.get(pk=self.card.pk)
+        url = card.qr_url
+        self.assertNotIn('?v=', url)
+
+        self.client.force_login(CustomUser.objects.get(username='Q1-do_officer'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.stored_payload(), '')
+
+    def test_fill_payloads_versions_the_url(self):
+        self.assertEqual(fill_payloads('waiting_card'), 1)
+        card = WaitingCard.objects.get(pk=self.card.pk)
+        self.assertEqual(self.stored_payload(), card.build_qr_payload())
+        self.assertIn('?v=', card.qr_url)
+
+
+class SearchIndexTests(TestCase):
+    """Saves and deletes keep the full-text index of applications current"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 1, 'S1')
+        cls.template = IDApplication.objects.get()
+
+    def search(self, query):
+        return list(search_queryset(IDApplication.objects.all(), 'application', query).values_list('pk', flat=True))
+
+    def test_create_rename_delete(self):
+        self.assertIsNotNone(search_backend(connection))
+        application = IDApplication.objects.get(pk=self.template.pk)
+        application.pk, application.application_id, application.application_number = None, uuid.uuid4(), ''
+        application.full_name = 'Wanjiru Kamau Njeri'
+        application.save()
+        self.assertEqual(self.search('wanjiru kamau'), [application.pk])
+        self.assertEqual(self.search('wanj kam'), [application.pk])
+        self.assertEqual(self.search(application.application_number), [application.pk])
+
+        application.full_name = 'Atieno Odhiambo'
+        application.save(update_fields=['full_name'])
+        self.assertEqual(self.search('wanjiru'), [])
+        self.assertEqual(self.search('atieno odhiambo'), [application.pk])
+
+        applicant = application.applicant
+        applicant.username = 'odhiambo-applicant'
+        applicant.save()
+        self.assertIn(application.pk, self.search('odhiambo-applicant'))
+
+        pk = application.pk
+        application.delete()
+        self.assertEqual(self.search('atieno'), [])
+        self.assertEqual(self.search(f'{self.template.application_number}'), [self.template.pk])
+        self.assertNotIn(pk, self.search('odhiambo-applicant'))
+
+
+class HistoryArchiveTests(TestCase):
+    """Old status history moves to indexed monthly files and reads back in order"""
+
+    # (new status, timestamp) of one application's history
+    moments = (
+        ('documents_uploaded', timezone.make_aware(datetime(2024, 1, 5, 9))),
+        ('chief_review', timezone.make_aware(datetime(2024, 1, 20, 9))),
+        ('chief_approved', timezone.make_aware(datetime(2024, 1, 31, 9))),
+        ('do_review', timezone.make_aware(datetime(2024, 2, 2, 9))),
+        ('do_approved', timezone.make_aware(datetime(2025, 3, 1, 9))),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 1, 'T1')
+        ApplicationStatusHistory.objects.all().delete()
+        cls.application = IDApplication.objects.get()
+        cls.user = CustomUser.objects.get(username='T1-chief')
+        previous = 'started'
+        for status, moment in cls.moments:
+            row = ApplicationStatusHistory.objects.create(
+                application=cls.application, previous_status=previous, new_status=status, changed_by=cls.user,
+            )
+            ApplicationStatusHistory.objects.filter(pk=row.pk).update(timestamp=moment)
+            previous = status
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(HUDUMA_ARCHIVE={'directory': directory.name, 'file_rows': 2})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def archive(self):
+        call_command('archive_history', before='2025-01-01', table=['status_history'], stdout=StringIO())
+
+    def test_round_trip(self):
+        self.archive()
+        self.assertEqual(list(ApplicationStatusHistory.objects.values_list('new_status', flat=True)), ['do_approved'])
+
+        # January fills two parts of at most two rows, February one
+        archives = list(HistoryArchive.objects.order_by('first_timestamp'))
+        self.assertEqual([(archive.month, archive.rows) for archive in archives],
+                         [(date(2024, 1, 1), 2), (date(2024, 1, 1), 1), (date(2024, 2, 1), 1)])
+        for archive in archives:
+            self.assertTrue((self.directory / archive.path).is_file())
+        self.assertEqual(
+            sum(ArchivedObject.objects.filter(content_type='IDApplication', object_id=str(self.application.pk))
+                .values_list('rows', flat=True)),
+            4,
+        )
+
+        history = archived_status_history(self.application)
+        self.assertEqual(
+            [(row.new_status, row.timestamp) for row in history],
+            [moment for moment in reversed(self.moments[:4])],
+        )
+        self.assertEqual({row.changed_by for row in history}, {self.user})
+
+    def test_part_without_index_row_is_ignored(self):
+        # An interrupted run wrote a part but never recorded it; its rows are still in the table
+        rows = list(ApplicationStatusHistory.objects.filter(new_status='documents_uploaded').values())
+        write_part(self.directory / 'status_history' / '2024-01' / 'interrupted.jsonl.gz', rows)
+        self.assertEqual(archived_status_history(self.application), [])
+
+        self.archive()
+        self.assertEqual([row.new_status for row in archived_status_history(self.application)],
+                         ['do_review', 'chief_approved', 'chief_review', 'documents_uploaded'])
+
+
+class TimelineTests(TestCase):
+    """Timelines keep the first time each stage was reached; percentiles interpolate like percentile_cont"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_county('047', 5, 'T1')
+        cls.applications = list(IDApplication.objects.order_by('pk'))
+        cls.county = County.objects.get(code='047')
+        cls.start = timezone.make_aware(datetime(2025, 1, 1))
+
+    def timeline(self, application):
+        return ApplicationTimeline.objects.get(application=application)
+
+    def test_stage_percentiles(self):
+        for application, days in zip(self.applications, (1, 2, 3, 4, 10)):
+            ApplicationTimeline.objects.filter(application=application).update(
+                county=self.county, created_at=self.start, chief_review_at=self.start + timedelta(days=days),
+            )
+        self.assertEqual(stage_percentiles('submission'), {
+            self.county.pk: {'count': 5, 'p50': timedelta(days=3), 'p90': timedelta(days=7.6)},
+        })
+        self.assertEqual(
+            stage_percentiles('submission', percentiles=(0, 1), until=self.start + timedelta(days=5)),
+            {self.county.pk: {'count': 4, 'p0': timedelta(days=1), 'p100': timedelta(days=4)}},
+        )
+
+    def test_percentiles_out_of_range_are_refused(self):
+        with self.assertRaises(ValueError):
+            stage_percentiles('submission', percentiles=(1.5,))
+        with self.assertRaises(CommandError):
+            call_command('stage_durations', 'submission', percentile=[150.0], stdout=StringIO())
+
+    def test_stamp_keeps_the_first_time(self):
+        first, later = self.applications[:2]
+        ApplicationTimeline.objects.filter(application=first).update(do_review_at=None)
+        stamp_status([first.pk], 'do_review', self.start)
+        stamp_status([first.pk], 'do_review', self.start + timedelta(days=1))
+        self.assertEqual(self.timeline(first).do_review_at, self.start)
+
+        # An application loaded without signals gets its row on the first stamp
+        ApplicationTimeline.objects.filter(application=later).delete()
+        stamp_status([later.pk], 'do_review', self.start)
+        timeline = self.timeline(later)
+        self.assertEqual((timeline.created_at, timeline.do_review_at), (later.created_at, self.start))
+
+    def test_backfill_from_history(self):
+        application = self.applications[2]
+        ApplicationStatusHistory.objects.filter(application=application).delete()
+        # A stamp with no history left (archived) is kept
+        ApplicationTimeline.objects.filter(application=application).update(
+            chief_review_at=None, chief_decided_at=None, do_review_at=self.start - timedelta(days=1),
+        )
+        user = CustomUser.objects.get(username='T1-chief')
+        moments = [self.start + timedelta(days=days) for days in range(4)]
+        for status, moment in zip(('chief_review', 'chief_rejected', 'chief_review', 'chief_approved'), moments):
+            row = ApplicationStatusHistory.objects.create(application=application, new_status=status, changed_by=user)
+            ApplicationStatusHistory.objects.filter(pk=row.pk).update(timestamp=moment)
+
+        list(backfill_timelines(queryset=IDApplication.objects.filter(pk=application.pk)))
+        timeline = self.timeline(application)
+        self.assertEqual(
+            (timeline.chief_review_at, timeline.chief_decided_at, timeline.do_review_at),
+            (moments[0], moments[1], self.start - timedelta(days=1)),
+        )
+
+
+class NameMatchingRecallTests(TestCase):
+    """Misspelled Kenyan names find the person they were taken from"""
+
+    kind = 'recall'
+    corpus_size = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(254)
+        cls.groups = list(GenerateIDs().kenyan_names.values())
+        rows = []
+        for number in range(cls.corpus_size):
+            names = rng.choice(cls.groups)
+            given = names['male'] + names['female']
+            rows.extend(name_token_rows(
+                cls.kind, number, f"{rng.choice(given)} {rng.choice(given)} {rng.choice(names['surnames'])}",
+            ))
+        NameToken.objects.bulk_create(rows, batch_size=2000)
+
+    def recall_set(self):
+        """Every first name with a surname of its group, both misspelled, and the tokens expected back"""
+        return list(misspelled_names(self.groups, random.Random(47)))
+
+    def test_recall(self):
+        queries = self.recall_set()
+        found = {1: 0, 10: 0}
+        for query, expected in queries:
+            matches = match_names(query, [self.kind], limit=10)
+            ranks = [rank for rank, match in enumerate(matches, 1) if expected <= set(match['name'].split())]
+            for cutoff in found:
+                if ranks and ranks[0] <= cutoff:
+                    found[cutoff] += 1
+        self.assertGreaterEqual(found[1] / len(queries), 0.9)
+        self.assertGreaterEqual(found[10] / len(queries), 0.95)
+
+    def test_exact_spelling_ranks_first(self):
+        match = match_names("Chepng'eno", [self.kind], limit=1)
+        self.assertTrue(match)
+        self.assertIn('chepngeno', match[0]['name'].split())
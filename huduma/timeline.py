@@ -0,0 +1,212 @@
+# timeline.py
+"""
+Per-application stage timestamps for processing-time analysis.
+
+``ApplicationTimeline`` has one row per application with the time it first
+reached each stage (``STATUS_COLUMNS``) and the county and offices it is
+handled by. Stage durations are then differences of two columns of one row,
+and ``stage_percentiles`` answers "median DO review time per county" with a
+single grouped query instead of replaying ``ApplicationStatusHistory``.
+
+Rows are kept current without reading history:
+
+* a new application gets its row from the ``post_save`` handler in
+  ``signals.py``, and later saves that touch the county or offices copy
+  them over;
+* every status change stamps the column of the new status, unless it is
+  already set, with one ``UPDATE`` per status: through an ``on_enter``
+  hook for ``workflow.transition`` and ``bulk_transition``, and from the
+  ``post_save`` of history rows written one at a time elsewhere.
+
+``manage.py backfill_timelines`` builds the rows of existing applications
+from ``ApplicationStatusHistory``, one grouped query per batch. It keeps
+timestamps already in the table, so it can run after ``archive_history``
+has moved the old history out.
+"""
+from django.db import connection
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.db.models.aggregates import Aggregate
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ApplicationStatusHistory, ApplicationTimeline, IDApplication
+from .workflow import on_enter
+
+
+TIMELINE_BATCH_SIZE = 2000
+
+# Fields copied from the application to its timeline
+DIMENSIONS = {
+    'application_type': 'application_type',
+    'county_id': 'current_county_id',
+    'chief_office_id': 'chief_office_id',
+    'do_office_id': 'do_office_id',
+    'huduma_centre_id': 'huduma_centre_id',
+}
+
+# Fields of IDApplication whose change is copied to the timeline
+DIMENSION_FIELDS = frozenset({'application_type', 'current_county', 'chief_office', 'do_office', 'huduma_centre'})
+
+# stage -> (column it starts at, column it ends at)
+STAGES = {
+    'submission': ('created_at', 'chief_review_at'),
+    'chief_review': ('chief_review_at', 'chief_decided_at'),
+    'do_review': ('do_review_at', 'do_decided_at'),
+    'biometrics': ('biometrics_scheduled_at', 'biometrics_taken_at'),
+    'printing': ('processing_at', 'ready_at'),
+    'collection': ('ready_at', 'collected_at'),
+    'total': ('created_at', 'collected_at'),
+}
+
+# group name -> timeline column durations can be grouped by
+GROUPS = {
+    'county': 'county_id',
+    'chief_office': 'chief_office_id',
+    'do_office': 'do_office_id',
+    'huduma_centre': 'huduma_centre_id',
+    'application_type': 'application_type',
+}
+
+
+def timeline_for(application):
+    """Unsaved timeline row of an application with its dimensions and creation time"""
+    return ApplicationTimeline(
+        application_id=application.pk, created_at=application.created_at,
+        **{column: getattr(application, field) for column, field in DIMENSIONS.items()},
+    )
+
+
+def create_timeline(application):
+    ApplicationTimeline.objects.bulk_create([timeline_for(application)], ignore_conflicts=True)
+
+
+def update_dimensions(application):
+    ApplicationTimeline.objects.filter(application_id=application.pk).update(
+        **{column: getattr(application, field) for column, field in DIMENSIONS.items()}
+    )
+
+
+def stamp_status(application_ids, status, when=None):
+    """Stamp the column of ``status`` on the timelines of ``application_ids`` where it is not set yet"""
+    column = ApplicationTimeline.STATUS_COLUMNS.get(status)
+    if column is None or not application_ids:
+        return
+    when = when or timezone.now()
+    ids = list(application_ids)
+    updated = ApplicationTimeline.objects.filter(application_id__in=ids).update(**{column: Coalesce(column, when)})
+    if updated < len(ids):
+        # Applications created without signals (bulk loads) have no row yet
+        missing = IDApplication.objects.filter(pk__in=ids).exclude(timeline__isnull=False)
+        ApplicationTimeline.objects.bulk_create(
+            [timeline_for(application) for application in missing.only('pk', 'created_at', *DIMENSIONS.values())],
+            ignore_conflicts=True,
+        )
+        ApplicationTimeline.objects.filter(application_id__in=ids).update(**{column: Coalesce(column, when)})
+
+
+@on_enter(*ApplicationTimeline.STATUS_COLUMNS)
+def stamp_transition(application_ids, previous, status, changed_by):
+    stamp_status(application_ids, status)
+
+
+def backfill_timelines(batch_size=TIMELINE_BATCH_SIZE, queryset=None):
+    """
+    Build or refresh the timelines of ``queryset`` (default every application) from their history.
+
+    Yields the number of rows written after each batch.
+    """
+    queryset = (queryset if queryset is not None else IDApplication.objects.all()).order_by('pk')
+    fields = ('pk', 'created_at', *DIMENSIONS.values())
+    columns = sorted(set(ApplicationTimeline.STATUS_COLUMNS.values()))
+    last_pk = 0
+    while True:
+        applications = list(queryset.filter(pk__gt=last_pk).only(*fields)[:batch_size])
+        if not applications:
+            break
+        last_pk = applications[-1].pk
+        ids = [application.pk for application in applications]
+        rows = {application.pk: timeline_for(application) for application in applications}
+
+        first_reached = (
+            ApplicationStatusHistory.objects.filter(application_id__in=ids).order_by()
+            .values('application_id', 'new_status').annotate(first=Min('timestamp'))
+        )
+        stamped = ApplicationTimeline.objects.filter(application_id__in=ids).values('application_id', *columns)
+        for values in (
+            *({'application_id': row['application_id'], ApplicationTimeline.STATUS_COLUMNS.get(row['new_status']): row['first']}
+              for row in first_reached),
+            *stamped,
+        ):
+            row = rows[values['application_id']]
+            for column in columns:
+                value = values.get(column)
+                if value is not None and (getattr(row, column) is None or value < getattr(row, column)):
+                    setattr(row, column, value)
+
+        ApplicationTimeline.objects.bulk_create(
+            rows.values(), update_conflicts=True, unique_fields=['application'],
+            update_fields=[*DIMENSIONS, 'created_at', *columns],
+        )
+        yield len(rows)
+
+
+class PercentileCont(Aggregate):
+    """``percentile_cont(p) WITHIN GROUP (ORDER BY expression)``; Postgres only"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def interpolate(values, fraction):
+    """``percentile_cont`` of a sorted list"""
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def stage_percentiles(stage, group='county', percentiles=(0.5, 0.9), since=None, until=None):
+    """
+    Percentiles of the duration of ``stage`` per ``group``, for stages that ended in ``[since, until)``.
+
+    Returns ``{group value: {'count': n, 'p50': timedelta, ...}}``. On Postgres this
+    is one aggregate query; elsewhere the durations are read sorted and
+    interpolated the same way.
+    """
+    if any(not 0 <= fraction <= 1 for fraction in percentiles):
+        raise ValueError(f"Percentiles are fractions between 0 and 1, got {list(percentiles)}")
+    start, end = STAGES[stage]
+    column = GROUPS[group]
+    duration = ExpressionWrapper(F(end) - F(start), output_field=DurationField())
+    queryset = ApplicationTimeline.objects.filter(Q(**{f'{start}__isnull': False}), Q(**{f'{end}__isnull': False}))
+    if since is not None:
+        queryset = queryset.filter(**{f'{end}__gte': since})
+    if until is not None:
+        queryset = queryset.filter(**{f'{end}__lt': until})
+    names = {f'p{round(fraction * 100):g}': fraction for fraction in percentiles}
+
+    if connection.vendor == 'postgresql':
+        rows = queryset.order_by().values(column).annotate(
+            count=Count('pk'),
+            **{name: PercentileCont(duration, fraction, output_field=DurationField()) for name, fraction in names.items()},
+        )
+        return {row[column]: {key: value for key, value in row.items() if key != column} for row in rows}
+
+    result = {}
+    current, durations = object(), []
+
+    def close():
+        if durations:
+            result[current] = {'count': len(durations), **{
+                name: interpolate(durations, fraction) for name, fraction in names.items()
+            }}
+
+    for key, value in queryset.annotate(duration=duration).order_by(column, 'duration').values_list(column, 'duration').iterator():
+        if key != current:
+            close()
+            current, durations = key, []
+        durations.append(value)
+    close()
+    return result
@@ -24,6 +24,7 @@ urlpatterns = [
     # API endpoints for dashboard data
     path('api/dashboard/stats/', views.dashboard_api_stats, name='dashboard_api_stats'),
     path('api/dashboard/applications-trend/', views.dashboard_api_applications_trend, name='dashboard_api_applications_trend'),
+    path('api/dashboard/timeseries/', views.dashboard_api_timeseries, name='dashboard_api_timeseries'),
 
      path('applications/', views.id_applications_list, name='applications_list'),
     path('create/applications/', views.id_application_create, name='applications_create'),
@@ -35,6 +36,7 @@ urlpatterns = [
     path('api/<uuid:application_id>/detail/', views.id_application_api_detail, name='applications_api_detail'),
     
     # Location API endpoints for cascading dropdowns
+    path('api/gazetteer/', views.gazetteer_api, name='gazetteer_api'),
     path('api/counties/<int:county_id>/sub-counties/', views.get_sub_counties, name='get_sub_counties'),
     path('api/sub-counties/<int:sub_county_id>/divisions/', views.get_divisions, name='get_divisions'),
     path('api/divisions/<int:division_id>/locations/', views.get_locations, name='get_locations'),
@@ -48,6 +50,9 @@ urlpatterns = [
     path('birth-certificates/<str:certificate_number>/update/', views.birth_certificate_update, name='birth_certificate_update'),
     path('birth-certificates/<str:certificate_number>/delete/', views.birth_certificate_delete, name='birth_certificate_delete'),
 
+    # Name matching
+    path('api/names/match/', views.name_match_api, name='name_match_api'),
+
     # List and dashboard
     path('national_id/', views.national_id_list, name='national_id_list'),
     path('statistics/', views.national_id_statistics, name='national_id_statistics'),
@@ -90,4 +95,10 @@ urlpatterns = [
     path('waiting-cards/<str:serial_number>/', views.waiting_card_detail, name='waiting_card_detail'),
     path('waiting-cards/<str:serial_number>/update/', views.waiting_card_update, name='waiting_card_update'),
     path('waiting-cards/<str:serial_number>/delete/', views.waiting_card_delete, name='waiting_card_delete'),
+
+    # QR codes, rendered on demand
+    path('qr/<str:kind>/<int:pk>.<str:fmt>', views.qr_code_image, name='qr_code_image'),
+
+    # Payment gateway callbacks
+    path('payments/mpesa/callback/', views.mpesa_callback, name='mpesa_callback'),
 ]
\ No newline at end of file
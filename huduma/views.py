@@ -6,15 +6,16 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.db.models import Count, Q, Sum
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 import json
 
 from .models import (
     CustomUser, IDApplication, BirthCertificate, ChiefOffice, DOOffice, 
     HudumaCentre, Payment, Fee, ApplicationStatusHistory, County,
-    BiometricAppointment, NationalID, Notification
+    BiometricAppointment, NationalID, Notification, DailyStats
 )
+from .stats import APPROVED_STATUSES, BUCKETS, PENDING_STATUSES, SERIES_DIMENSIONS, time_series
 
 
 def login_view(request):
@@ -95,123 +96,78 @@ def admin_dashboard(request):
         return redirect('dashboard')
     
     # Date ranges for filtering
-    today = timezone.now().date()
+    today = timezone.localdate()
     last_30_days = today - timedelta(days=30)
-    last_7_days = today - timedelta(days=7)
+    last_7_days = today - timedelta(days=6)
     current_month = today.replace(day=1)
     
-    # Basic Statistics
-    total_applications = IDApplication.objects.count()
-    pending_applications = IDApplication.objects.filter(
-        status__in=['started', 'documents_uploaded', 'chief_review', 'do_review']
-    ).count()
-    
-    approved_applications = IDApplication.objects.filter(
-        status__in=['do_approved', 'biometrics_scheduled', 'biometrics_taken', 'processing']
-    ).count()
-    
-    completed_applications = IDApplication.objects.filter(
-        status='collected'
-    ).count()
+    # Basic Statistics, read from the DailyStats rollup
+    totals = DailyStats.objects.aggregate(
+        total_applications=Sum('applications'),
+        pending_applications=Sum('applications', filter=Q(status__in=PENDING_STATUSES)),
+        approved_applications=Sum('applications', filter=Q(status__in=APPROVED_STATUSES)),
+        completed_applications=Sum('applications', filter=Q(status='collected')),
+        total_revenue=Sum('revenue'),
+        monthly_revenue=Sum('revenue', filter=Q(date__gte=current_month)),
+        recent_collected=Sum('collected', filter=Q(date__gte=last_30_days)),
+        recent_processing_seconds=Sum('processing_seconds', filter=Q(date__gte=last_30_days)),
+    )
+    total_applications = totals['total_applications'] or 0
+    pending_applications = totals['pending_applications'] or 0
+    approved_applications = totals['approved_applications'] or 0
+    completed_applications = totals['completed_applications'] or 0
     
     total_users = CustomUser.objects.count()
     new_users_today = CustomUser.objects.filter(date_joined__date=today).count()
     
     # Revenue Statistics
-    total_revenue = Payment.objects.filter(
-        status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    
-    monthly_revenue = Payment.objects.filter(
-        status='completed',
-        paid_at__date__gte=current_month
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    total_revenue = totals['total_revenue'] or Decimal('0.00')
+    monthly_revenue = totals['monthly_revenue'] or Decimal('0.00')
     
     # Application Status Distribution for Pie Chart
-    status_distribution = IDApplication.objects.values('status').annotate(
-        count=Count('status')
-    ).order_by('-count')
+    status_distribution = DailyStats.objects.values('status').annotate(
+        count=Sum('applications')
+    ).filter(count__gt=0).order_by('-count')
     
     status_labels = [item['status'].replace('_', ' ').title() for item in status_distribution]
     status_counts = [item['count'] for item in status_distribution]
     
-    # Daily Applications Chart (Last 7 days)
-    daily_applications = []
-    daily_labels = []
-    
-    for i in range(6, -1, -1):  # Last 7 days
-        date = today - timedelta(days=i)
-        count = IDApplication.objects.filter(created_at__date=date).count()
-        daily_applications.append(count)
-        daily_labels.append(date.strftime('%m/%d'))
+    # Daily Applications and Revenue Charts (Last 7 days)
+    daily_buckets, daily = time_series(['applications', 'revenue'], 'day', last_7_days, today)
+    daily_labels = [day.strftime('%m/%d') for day in daily_buckets]
+    daily_applications = daily['applications']
+    revenue_labels = daily_labels
+    revenue_data = [float(revenue) for revenue in daily['revenue']]
     
     # Monthly Applications Trend (Last 6 months)
-    monthly_applications = []
-    monthly_labels = []
-    
-    for i in range(5, -1, -1):  # Last 6 months
-        date = today.replace(day=1) - timedelta(days=30*i)
-        start_date = date.replace(day=1)
-        if i == 0:
-            end_date = today
-        else:
-            next_month = date.replace(day=28) + timedelta(days=4)
-            end_date = next_month - timedelta(days=next_month.day)
-        
-        count = IDApplication.objects.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
-        ).count()
-        
-        monthly_applications.append(count)
-        monthly_labels.append(date.strftime('%b %Y'))
+    monthly_buckets, monthly = time_series(['applications'], 'month', today - timedelta(days=150), today)
+    monthly_buckets, monthly_applications = monthly_buckets[-6:], monthly['applications'][-6:]
+    monthly_labels = [month.strftime('%b %Y') for month in monthly_buckets]
     
     # County-wise Applications
-    county_applications = IDApplication.objects.values(
-        'current_county__name'
+    county_applications = DailyStats.objects.values(
+        'county__name'
     ).annotate(
-        count=Count('id')
-    ).order_by('-count')[:10]  # Top 10 counties
+        count=Sum('applications')
+    ).filter(count__gt=0).order_by('-count')[:10]  # Top 10 counties
     
-    county_labels = [item['current_county__name'] or 'Unknown' for item in county_applications]
+    county_labels = [item['county__name'] or 'Unknown' for item in county_applications]
     county_counts = [item['count'] for item in county_applications]
     
     # Application Type Distribution
-    type_distribution = IDApplication.objects.values('application_type').annotate(
-        count=Count('application_type')
-    )
+    type_distribution = DailyStats.objects.values('application_type').annotate(
+        count=Sum('applications')
+    ).filter(count__gt=0).order_by('application_type')
     
     type_labels = [item['application_type'].replace('_', ' ').title() for item in type_distribution]
     type_counts = [item['count'] for item in type_distribution]
     
-    # Revenue Trend (Last 7 days)
-    revenue_data = []
-    revenue_labels = []
-    
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        revenue = Payment.objects.filter(
-            status='completed',
-            paid_at__date=date
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        revenue_data.append(float(revenue))
-        revenue_labels.append(date.strftime('%m/%d'))
-    
-    # Processing Time Analysis - FIXED: Use NationalID.collected_at instead of IDApplication.collected_at
-    completed_ids = NationalID.objects.select_related('application').filter(
-        is_collected=True,
-        collected_at__gte=timezone.now() - timedelta(days=30)
+    # Processing Time Analysis (IDs collected in the last 30 days)
+    recent_collected = totals['recent_collected'] or 0
+    avg_processing_time = (
+        (totals['recent_processing_seconds'] or 0) / 86400 / recent_collected if recent_collected else 0
     )
     
-    processing_times = []
-    for national_id in completed_ids:
-        if national_id.collected_at and national_id.application.created_at:
-            days = (national_id.collected_at.date() - national_id.application.created_at.date()).days
-            processing_times.append(days)
-    
-    avg_processing_time = sum(processing_times) / len(processing_times) if processing_times else 0
-    
     # Recent Activities
     recent_applications = IDApplication.objects.select_related(
         'applicant', 'current_county'
@@ -290,21 +246,21 @@ def dashboard_api_stats(request):
     if request.user.user_type != 'admin':
         return JsonResponse({'error': 'Access denied'}, status=403)
     
-    today = timezone.now().date()
+    today = timezone.localdate()
+    today_totals = DailyStats.objects.aggregate(
+        total_applications=Sum('applications'),
+        pending_applications=Sum('applications', filter=Q(status__in=PENDING_STATUSES)),
+        revenue_today=Sum('revenue', filter=Q(date=today)),
+    )
     
     stats = {
-        'total_applications': IDApplication.objects.count(),
-        'pending_applications': IDApplication.objects.filter(
-            status__in=['started', 'documents_uploaded', 'chief_review', 'do_review']
-        ).count(),
+        'total_applications': today_totals['total_applications'] or 0,
+        'pending_applications': today_totals['pending_applications'] or 0,
         'completed_today': IDApplication.objects.filter(
             status='collected',
             updated_at__date=today
         ).count(),
-        'revenue_today': float(Payment.objects.filter(
-            status='completed',
-            paid_at__date=today
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')),
+        'revenue_today': float(today_totals['revenue_today'] or Decimal('0.00')),
         'new_users_today': CustomUser.objects.filter(
             date_joined__date=today
         ).count(),
@@ -319,22 +275,52 @@ def dashboard_api_applications_trend(request):
     if request.user.user_type != 'admin':
         return JsonResponse({'error': 'Access denied'}, status=403)
     
-    period = request.GET.get('period', '7')  # days
-    days = int(period)
-    today = timezone.now().date()
+    try:
+        days = int(request.GET.get('period', '7'))
+    except ValueError:
+        return JsonResponse({'error': 'period must be a number of days'}, status=400)
+    today = timezone.localdate()
+    
+    buckets, series = time_series(['applications'], 'day', today - timedelta(days=max(days, 1) - 1), today)
     
-    trend_data = []
-    labels = []
+    return JsonResponse({
+        'labels': [day.strftime('%m/%d') for day in buckets],
+        'data': series['applications']
+    })
+
+
+@login_required
+def dashboard_api_timeseries(request):
+    """
+    Bucketed time series of DailyStats measures.
+
+    Query parameters: ``measure`` (repeatable, default applications), ``bucket``
+    (day, week or month), ``start``/``end`` (YYYY-MM-DD) and the dimension filters
+    ``county``, ``status``, ``application_type`` and ``entry_point`` (repeatable).
+    """
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    bucket = request.GET.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return JsonResponse({'error': f"bucket must be one of {', '.join(BUCKETS)}"}, status=400)
+    measures = request.GET.getlist('measure') or ['applications']
+    filters = {name: request.GET.getlist(name) for name in SERIES_DIMENSIONS if request.GET.getlist(name)}
     
-    for i in range(days-1, -1, -1):
-        date = today - timedelta(days=i)
-        count = IDApplication.objects.filter(created_at__date=date).count()
-        trend_data.append(count)
-        labels.append(date.strftime('%m/%d'))
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+        buckets, series = time_series(measures, bucket, start, end, filters)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
     return JsonResponse({
-        'labels': labels,
-        'data': trend_data
+        'bucket': bucket,
+        'buckets': [day.isoformat() for day in buckets],
+        'series': {
+            measure: [float(value) if isinstance(value, Decimal) else value for value in values]
+            for measure, values in series.items()
+        },
     })
 
 
@@ -401,11 +387,12 @@ def citizen_dashboard(request):
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.db.models import Q
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.forms import model_to_dict
 from decimal import Decimal
 import json
@@ -416,6 +403,9 @@ from .models import (
     HudumaCentre, DocumentType, Document, ApplicationDocument,
     ApplicationStatusHistory
 )
+from .archive import archived_status_history
+from .gazetteer import LEVELS, address_errors, gazetteer
+from .search import search_queryset
 
 
 @login_required
@@ -429,13 +419,7 @@ def id_applications_list(request):
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        applications = applications.filter(
-            Q(application_number__icontains=search_query) |
-            Q(full_name__icontains=search_query) |
-            Q(applicant__username__icontains=search_query) |
-            Q(applicant__phone_number__icontains=search_query) |
-            Q(birth_certificate__certificate_number__icontains=search_query)
-        )
+        applications = search_queryset(applications, 'application', search_query)
     
     # Filter by status
     status_filter = request.GET.get('status', '')
@@ -513,8 +497,11 @@ def id_application_detail(request, application_id):
     # Get application documents
     app_documents = application.application_documents.select_related('document', 'document_type')
     
-    # Get status history
-    status_history = application.status_history.select_related('changed_by').order_by('-timestamp')
+    # Get status history; months moved out by archive_history are read back from their files
+    status_history = [
+        *application.status_history.select_related('changed_by').order_by('-timestamp'),
+        *archived_status_history(application),
+    ]
     
     # Get notifications
     notifications = application.notifications.order_by('-created_at')
@@ -542,6 +529,11 @@ def id_application_create(request):
             cert_number = request.POST.get('birth_certificate')
             birth_certificate = get_object_or_404(BirthCertificate, certificate_number=cert_number)
             
+            # Both addresses must nest (village in sub-location, ...)
+            problems = address_errors(request.POST, 'birth') + address_errors(request.POST, 'current')
+            if problems:
+                raise ValueError('; '.join(message for _, message in problems))
+            
             # Create application
             application = IDApplication.objects.create(
                 applicant=request.user,
@@ -614,7 +606,7 @@ def id_application_create(request):
             messages.error(request, f'Error creating application: {str(e)}')
     
     # Get data for form dropdowns
-    counties = County.objects.all().order_by('name')
+    counties = gazetteer().children_of(None, None)
     birth_certificates = BirthCertificate.objects.filter(is_active=True).order_by('full_name')
     
     context = {
@@ -656,6 +648,9 @@ def id_application_update(request, application_id):
             application.current_location_id = request.POST.get('current_location')
             application.current_sub_location_id = request.POST.get('current_sub_location')
             application.current_village_id = request.POST.get('current_village')
+            problems = address_errors(application, 'current')
+            if problems:
+                raise ValueError('; '.join(message for _, message in problems))
             
             # Update family info
             application.clan_name = request.POST.get('clan_name')
@@ -696,12 +691,13 @@ def id_application_update(request, application_id):
             messages.error(request, f'Error updating application: {str(e)}')
     
     # Get data for form dropdowns
-    counties = County.objects.all().order_by('name')
-    sub_counties = SubCounty.objects.filter(county=application.current_county).order_by('name') if application.current_county else []
-    divisions = Division.objects.filter(sub_county=application.current_sub_county).order_by('name') if application.current_sub_county else []
-    locations = Location.objects.filter(division=application.current_division).order_by('name') if application.current_division else []
-    sub_locations = SubLocation.objects.filter(location=application.current_location).order_by('name') if application.current_location else []
-    villages = Village.objects.filter(sub_location=application.current_sub_location).order_by('name') if application.current_sub_location else []
+    tree = gazetteer()
+    counties = tree.children_of(None, None)
+    sub_counties = tree.children_of('county', application.current_county_id)
+    divisions = tree.children_of('sub_county', application.current_sub_county_id)
+    locations = tree.children_of('division', application.current_division_id)
+    sub_locations = tree.children_of('location', application.current_location_id)
+    villages = tree.children_of('sub_location', application.current_sub_location_id)
     
     context = {
         'application': application,
@@ -832,44 +828,75 @@ def id_application_api_detail(request, application_id):
 
 
 # Location API endpoints for cascading dropdowns (keep these as AJAX)
+@login_required
+def gazetteer_api(request):
+    """
+    The administrative tree as one JSON bundle, or the subtree under ``level``/``id``.
+
+    Bundles are served gzip-compressed when the client accepts it, with an ETag
+    so repeat requests get a 304. A request carrying the current ``version`` as
+    ``v`` may be cached by the browser for good; the URL changes with the tree.
+    """
+    level = request.GET.get('level') or None
+    if level is not None and (level not in LEVELS or not request.GET.get('id')):
+        return JsonResponse({'error': f"level must be one of {', '.join(LEVELS)} and needs an id"}, status=400)
+    try:
+        pk = int(request.GET['id']) if level else None
+    except ValueError:
+        return JsonResponse({'error': 'id must be an integer'}, status=400)
+    
+    tree = gazetteer()
+    try:
+        etag, body, compressed = tree.bundle(level, pk)
+    except KeyError:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    
+    if request.GET.get('v') == tree.version:
+        cache_control = 'private, max-age=31536000, immutable'
+    else:
+        cache_control = 'private, no-cache'
+    
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(compressed, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
 @login_required
 def get_sub_counties(request, county_id):
     """Get sub-counties for a given county"""
-    sub_counties = SubCounty.objects.filter(county_id=county_id).order_by('name')
-    data = [{'id': sc.id, 'name': sc.name} for sc in sub_counties]
-    return JsonResponse(data, safe=False)
+    return JsonResponse(gazetteer().children_of('county', county_id), safe=False)
 
 
 @login_required
 def get_divisions(request, sub_county_id):
     """Get divisions for a given sub-county"""
-    divisions = Division.objects.filter(sub_county_id=sub_county_id).order_by('name')
-    data = [{'id': d.id, 'name': d.name} for d in divisions]
-    return JsonResponse(data, safe=False)
+    return JsonResponse(gazetteer().children_of('sub_county', sub_county_id), safe=False)
 
 
 @login_required
 def get_locations(request, division_id):
     """Get locations for a given division"""
-    locations = Location.objects.filter(division_id=division_id).order_by('name')
-    data = [{'id': l.id, 'name': l.name} for l in locations]
-    return JsonResponse(data, safe=False)
+    return JsonResponse(gazetteer().children_of('division', division_id), safe=False)
 
 
 @login_required
 def get_sub_locations(request, location_id):
     """Get sub-locations for a given location"""
-    sub_locations = SubLocation.objects.filter(location_id=location_id).order_by('name')
-    data = [{'id': sl.id, 'name': sl.name} for sl in sub_locations]
-    return JsonResponse(data, safe=False)
+    return JsonResponse(gazetteer().children_of('location', location_id), safe=False)
 
 
 @login_required
 def get_villages(request, sub_location_id):
     """Get villages for a given sub-location"""
-    villages = Village.objects.filter(sub_location_id=sub_location_id).order_by('name')
-    data = [{'id': v.id, 'name': v.name} for v in villages]
-    return JsonResponse(data, safe=False)
+    return JsonResponse(gazetteer().children_of('sub_location', sub_location_id), safe=False)
 
 
 
@@ -885,6 +912,8 @@ from .models import (
     BirthCertificate, County, SubCounty, Division, 
     Location, SubLocation, Village
 )
+from .names import NAME_MODELS, match_names, name_model
+from .search import search_queryset
 from .forms import BirthCertificateForm
 import json
 
@@ -912,15 +941,7 @@ def birth_certificates_list(request):
     
     # Apply filters
     if search_query:
-        certificates = certificates.filter(
-            Q(certificate_number__icontains=search_query) |
-            Q(serial_number__icontains=search_query) |
-            Q(full_name__icontains=search_query) |
-            Q(father_name__icontains=search_query) |
-            Q(mother_name__icontains=search_query) |
-            Q(father_id__icontains=search_query) |
-            Q(mother_id__icontains=search_query)
-        )
+        certificates = search_queryset(certificates, 'birth_certificate', search_query)
     
     if county_filter:
         certificates = certificates.filter(county_of_birth_id=county_filter)
@@ -1064,6 +1085,43 @@ def birth_certificate_delete(request, certificate_number):
     
     return redirect('birth_certificates_list')
 
+
+@login_required
+def name_match_api(request):
+    """
+    Ranked fuzzy matches for a person's name.
+
+    Query parameters: ``q`` (the name), ``kind`` (repeatable: application,
+    birth_certificate, national_id; default all) and ``limit`` (default 20, max 100).
+    """
+    if request.user.user_type == 'mwananchi':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    kinds = request.GET.getlist('kind') or list(NAME_MODELS)
+    unknown = [kind for kind in kinds if kind not in NAME_MODELS]
+    if unknown:
+        return JsonResponse({'error': f"kind must be one of {', '.join(NAME_MODELS)}"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    matches = match_names(request.GET.get('q', ''), kinds, limit)
+    
+    # Attach the stored record's full name, one query per kind
+    records = {}
+    for kind in kinds:
+        pks = [match['object_pk'] for match in matches if match['kind'] == kind]
+        if pks:
+            records[kind] = {
+                str(pk): full_name
+                for pk, full_name in name_model(kind).objects.filter(pk__in=pks).values_list('pk', 'full_name')
+            }
+    for match in matches:
+        match['full_name'] = records.get(match['kind'], {}).get(match['object_pk'])
+    
+    return JsonResponse({'query': request.GET.get('q', ''), 'matches': matches})
+
 # national_ids/views.py
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
@@ -1082,7 +1140,11 @@ from .models import (
     NationalID, IDApplication, County, SubCounty, Division, 
     Location, SubLocation, Village, CustomUser, BirthCertificate
 )
+from django.db import transaction
+from .gazetteer import gazetteer
+from .search import search_queryset
 from .forms import NationalIDForm, NationalIDFilterForm
+from .workflow import InvalidTransition, transition
 
 
 @login_required
@@ -1108,13 +1170,7 @@ def national_id_list(request):
     
     # Apply search filter
     if search_query:
-        national_ids = national_ids.filter(
-            Q(id_number__icontains=search_query) |
-            Q(full_name__icontains=search_query) |
-            Q(application__application_number__icontains=search_query) |
-            Q(serial_number__icontains=search_query) |
-            Q(place_of_birth__icontains=search_query)
-        )
+        national_ids = search_queryset(national_ids, 'national_id', search_query)
     
     # Apply county filter
     if county_filter:
@@ -1298,17 +1354,19 @@ def national_id_mark_collected(request, id_number):
     
     if request.method == 'POST':
         if not national_id.is_collected:
-            national_id.is_collected = True
-            national_id.collected_at = timezone.now()
-            national_id.collected_by = request.user
-            national_id.save()
-            
-            # Update application status
-            if hasattr(national_id, 'application'):
-                national_id.application.status = 'collected'
-                national_id.application.save()
-            
-            messages.success(request, f'National ID {national_id.id_number} marked as collected.')
+            try:
+                with transaction.atomic():
+                    national_id.is_collected = True
+                    national_id.collected_at = timezone.now()
+                    national_id.collected_by = request.user
+                    national_id.save(update_fields=['is_collected', 'collected_at', 'collected_by', 'updated_at'])
+                    
+                    # Update application status
+                    transition(national_id.application, 'collected', request.user, reason='National ID collected')
+            except InvalidTransition as e:
+                messages.error(request, f'National ID {national_id.id_number} cannot be marked as collected: {e}.')
+            else:
+                messages.success(request, f'National ID {national_id.id_number} marked as collected.')
         else:
             messages.info(request, f'National ID {national_id.id_number} is already marked as collected.')
     
@@ -1340,17 +1398,19 @@ def national_id_mark_dispatched(request, id_number):
     
     if request.method == 'POST':
         if not national_id.is_dispatched:
-            national_id.is_dispatched = True
-            national_id.dispatched_at = timezone.now()
-            national_id.is_ready_for_collection = True
-            national_id.save()
-            
-            # Update application status
-            if hasattr(national_id, 'application'):
-                national_id.application.status = 'ready_for_collection'
-                national_id.application.save()
-            
-            messages.success(request, f'National ID {national_id.id_number} marked as dispatched and ready for collection.')
+            try:
+                with transaction.atomic():
+                    national_id.is_dispatched = True
+                    national_id.dispatched_at = timezone.now()
+                    national_id.is_ready_for_collection = True
+                    national_id.save(update_fields=['is_dispatched', 'dispatched_at', 'is_ready_for_collection', 'updated_at'])
+                    
+                    # Update application status
+                    transition(national_id.application, 'ready_for_collection', request.user, reason='National ID dispatched')
+            except InvalidTransition as e:
+                messages.error(request, f'National ID {national_id.id_number} cannot be marked as dispatched: {e}.')
+            else:
+                messages.success(request, f'National ID {national_id.id_number} marked as dispatched and ready for collection.')
         else:
             messages.info(request, f'National ID {national_id.id_number} is already marked as dispatched.')
     
@@ -1363,9 +1423,8 @@ def ajax_sub_counties(request):
     county_id = request.GET.get('county_id')
     sub_counties = []
     
-    if county_id:
-        sub_counties_qs = SubCounty.objects.filter(county_id=county_id).order_by('name')
-        sub_counties = [{'id': sc.id, 'name': sc.name} for sc in sub_counties_qs]
+    if county_id and county_id.isdigit():
+        sub_counties = gazetteer().children_of('county', int(county_id))
     
     return JsonResponse({'sub_counties': sub_counties})
 
@@ -1423,9 +1482,14 @@ from .models import (
     Location, SubLocation, Village, ChiefOffice, DOOffice, HudumaCentre,
     CustomUser
 )
+from .forms import AddressChainMixin
+from .gazetteer import gazetteer
+from .search import search_queryset
 
 
-class ReplacementIDApplicationForm(ModelForm):
+class ReplacementIDApplicationForm(AddressChainMixin, ModelForm):
+    addresses = ('birth', 'current')
+    
     class Meta:
         model = IDApplication
         fields = [
@@ -1501,14 +1565,7 @@ def replacement_id_list(request):
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        applications = applications.filter(
-            Q(application_number__icontains=search_query) |
-            Q(full_name__icontains=search_query) |
-            Q(previous_id_number__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(police_ob_number__icontains=search_query) |
-            Q(applicant__username__icontains=search_query)
-        )
+        applications = search_queryset(applications, 'application', search_query)
     
     # Filters
     status_filter = request.GET.get('status')
@@ -1663,41 +1720,41 @@ def replacement_id_delete(request, application_id):
 @login_required
 def ajax_sub_counties(request):
     """Get sub-counties for a county via AJAX"""
-    county_id = request.GET.get('county_id')
-    sub_counties = SubCounty.objects.filter(county_id=county_id).values('id', 'name')
-    return JsonResponse({'sub_counties': list(sub_counties)})
+    county_id = request.GET.get('county_id', '')
+    sub_counties = gazetteer().children_of('county', int(county_id)) if county_id.isdigit() else []
+    return JsonResponse({'sub_counties': sub_counties})
 
 
 @login_required
 def ajax_divisions(request):
     """Get divisions for a sub-county via AJAX"""
-    sub_county_id = request.GET.get('sub_county_id')
-    divisions = Division.objects.filter(sub_county_id=sub_county_id).values('id', 'name')
-    return JsonResponse({'divisions': list(divisions)})
+    sub_county_id = request.GET.get('sub_county_id', '')
+    divisions = gazetteer().children_of('sub_county', int(sub_county_id)) if sub_county_id.isdigit() else []
+    return JsonResponse({'divisions': divisions})
 
 
 @login_required
 def ajax_locations(request):
     """Get locations for a division via AJAX"""
-    division_id = request.GET.get('division_id')
-    locations = Location.objects.filter(division_id=division_id).values('id', 'name')
-    return JsonResponse({'locations': list(locations)})
+    division_id = request.GET.get('division_id', '')
+    locations = gazetteer().children_of('division', int(division_id)) if division_id.isdigit() else []
+    return JsonResponse({'locations': locations})
 
 
 @login_required
 def ajax_sub_locations(request):
     """Get sub-locations for a location via AJAX"""
-    location_id = request.GET.get('location_id')
-    sub_locations = SubLocation.objects.filter(location_id=location_id).values('id', 'name')
-    return JsonResponse({'sub_locations': list(sub_locations)})
+    location_id = request.GET.get('location_id', '')
+    sub_locations = gazetteer().children_of('location', int(location_id)) if location_id.isdigit() else []
+    return JsonResponse({'sub_locations': sub_locations})
 
 
 @login_required
 def ajax_villages(request):
     """Get villages for a sub-location via AJAX"""
-    sub_location_id = request.GET.get('sub_location_id')
-    villages = Village.objects.filter(sub_location_id=sub_location_id).values('id', 'name')
-    return JsonResponse({'villages': list(villages)})
+    sub_location_id = request.GET.get('sub_location_id', '')
+    villages = gazetteer().children_of('sub_location', int(sub_location_id)) if sub_location_id.isdigit() else []
+    return JsonResponse({'villages': villages})
 
 
 
@@ -1903,8 +1960,10 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.paginator import Paginator
 from django.db.models import Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from .models import WaitingCard, IDApplication, DOOffice, County, SubCounty
+from .qr import QR_FORMATS, QR_MODELS, qr_cache, qr_model, qr_payload
+from .search import search_queryset
 from .forms import WaitingCardForm  # You'll need to create this form
 
 
@@ -1940,13 +1999,7 @@ def waiting_cards_list(request):
     
     # Apply search filter
     if search_query:
-        waiting_cards = waiting_cards.filter(
-            Q(serial_number__icontains=search_query) |
-            Q(application__full_name__icontains=search_query) |
-            Q(application__application_number__icontains=search_query) |
-            Q(application__applicant__username__icontains=search_query) |
-            Q(application__applicant__phone_number__icontains=search_query)
-        )
+        waiting_cards = search_queryset(waiting_cards, 'waiting_card', search_query)
     
     # Apply filters
     if collection_location_filter:
@@ -2082,4 +2135,58 @@ def waiting_card_delete(request, serial_number):
         'waiting_card': waiting_card,
     }
     
-    return render(request, 'waiting_cards/waiting_card_delete.html', context)
\ No newline at end of file
+    return render(request, 'waiting_cards/waiting_card_delete.html', context)
+
+
+@login_required
+def qr_code_image(request, kind, pk, fmt):
+    """
+    QR code of a chief letter or waiting card as PNG or SVG, rendered from its payload.
+
+    Staff see every code and applicants the codes of their own applications. The
+    ETag is the payload hash, and requests carrying it as ``v`` (see ``qr_url``)
+    may be cached by the browser for good.
+    """
+    if kind not in QR_MODELS or fmt not in QR_FORMATS:
+        raise Http404("Unknown QR code")
+    instance = get_object_or_404(qr_model(kind).objects.select_related('application'), pk=pk)
+    if not is_admin_or_staff(request.user) and instance.application.applicant_id != request.user.pk:
+        raise Http404("Unknown QR code")
+
+    digest, image = qr_cache().get(qr_payload(instance), fmt)
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(image, content_type=QR_FORMATS[fmt])
+    response['ETag'] = etag
+    if request.GET.get('v') == digest:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# M-Pesa payment callbacks
+from django.views.decorators.http import require_POST
+from .payments import CallbackError, callback_allowed, stage_callback
+
+
+@csrf_exempt
+@require_POST
+def mpesa_callback(request):
+    """
+    M-Pesa C2B confirmation URL.
+
+    The confirmation is only staged (see ``payments.py``); matching it to a
+    payment happens in ``process_payment_callbacks``. Retried confirmations
+    are accepted again and ignored. Every callback is rejected while no
+    token is configured.
+    """
+    if not callback_allowed(request.GET.get('token'), request.META.get('REMOTE_ADDR')):
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Rejected'}, status=403)
+    try:
+        stage_callback(json.loads(request.body))
+    except (ValueError, CallbackError) as e:
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': str(e)}, status=400)
+    return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Accepted'})
@@ -0,0 +1,199 @@
+# workflow.py
+"""
+Application status workflow.
+
+``ALLOWED_TRANSITIONS`` lists, for every status, the statuses an application
+may move to; every status change goes through this module so the list is
+enforced. A change has the same side effects whichever way it is made:
+``submitted_at`` and ``approved_at`` are stamped the first time the status
+calls for them (``IDApplication.stamp_status_timestamps``), an
+``ApplicationStatusHistory`` row is written, the status notifications are
+queued and the hooks registered with ``on_enter`` for the new status run,
+all in the transaction of the change.
+
+``transition`` moves one application: it locks the row, checks the move
+against the status in the database and saves only the status and
+timestamp columns (``update_fields``), so the model's signals still run.
+``bulk_transition`` applies a set of transitions to many applications at
+once: inside one transaction it locks the affected rows, runs one
+``UPDATE`` per source status, writes the history rows with ``bulk_create``,
+queues the notifications in batches and records an audit event per
+application (``audit.record_updates``), as the ``UPDATE`` sends no signals.
+
+Hooks receive the ids of the applications that entered the status, so one
+call covers a whole bulk transition::
+
+    @on_enter('ready_for_collection')
+    def notify_collection_centre(application_ids, previous, status, changed_by):
+        ...
+"""
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .audit import record_updates
+from .models import ApplicationStatusHistory, IDApplication
+from .notifications import enqueue_status_notifications
+from .stats import local_date, schedule_refresh
+
+
+ALLOWED_TRANSITIONS = {
+    'started': ('documents_uploaded', 'cancelled'),
+    'documents_uploaded': ('chief_review', 'cancelled'),
+    'chief_review': ('chief_approved', 'chief_rejected'),
+    'chief_approved': ('do_review',),
+    'chief_rejected': ('chief_review', 'rejected'),
+    'do_review': ('do_approved', 'do_rejected'),
+    'do_approved': ('biometrics_scheduled',),
+    'do_rejected': ('do_review', 'rejected'),
+    'biometrics_scheduled': ('biometrics_taken', 'cancelled'),
+    'biometrics_taken': ('processing',),
+    'processing': ('ready_for_collection',),
+    'ready_for_collection': ('collected',),
+    'collected': (),
+    'rejected': (),
+    'cancelled': (),
+}
+
+# Statuses that stamp submitted_at / approved_at the first time they are reached (as IDApplication.save does)
+UNSUBMITTED_STATUSES = IDApplication.UNSUBMITTED_STATUSES
+APPROVAL_STATUSES = IDApplication.APPROVAL_STATUSES
+
+_allowed = {source: frozenset(targets) for source, targets in ALLOWED_TRANSITIONS.items()}
+_hooks = {}
+
+# Upper bound on ids per UPDATE, well inside the bind-parameter limits of SQLite and Postgres
+UPDATE_CHUNK_SIZE = 20000
+
+
+class InvalidTransition(ValueError):
+    """Raised when a requested status change is not in ALLOWED_TRANSITIONS"""
+
+
+def check_transition(source, target):
+    if target not in _allowed.get(source, ()):
+        raise InvalidTransition(f"Cannot move an application from {source!r} to {target!r}")
+
+
+def on_enter(*statuses):
+    """Register a hook run, inside the transaction, when applications enter one of ``statuses``"""
+    def register(hook):
+        for status in statuses:
+            _hooks.setdefault(status, []).append(hook)
+        return hook
+    return register
+
+
+def run_hooks(application_ids, previous, status, changed_by):
+    for hook in _hooks.get(status, ()):
+        hook(application_ids, previous, status, changed_by)
+
+
+def transition(application, to, by, reason=None, notes=None, location_type=None, notify=True):
+    """
+    Move one application to ``to`` and return it.
+
+    The move is checked against the status in the database, with the row locked,
+    so a stale instance cannot skip a step; raises ``InvalidTransition``.
+    """
+    with transaction.atomic():
+        source = (
+            IDApplication.objects.select_for_update().filter(pk=application.pk)
+            .values_list('status', flat=True).get()
+        )
+        check_transition(source, to)
+        application.status = to
+        # save() adds the timestamps the new status stamps
+        application.save(update_fields=['status', 'updated_at'])
+        ApplicationStatusHistory.objects.bulk_create([
+            ApplicationStatusHistory(
+                application_id=application.pk,
+                previous_status=source,
+                new_status=to,
+                changed_by=by,
+                change_reason=reason,
+                notes=notes,
+                location_type=location_type,
+            )
+        ])
+        if notify:
+            enqueue_status_notifications([application.pk], to)
+        run_hooks([application.pk], source, to, by)
+    return application
+
+
+def bulk_transition(queryset, transitions, changed_by, reason=None, notes=None, location_type=None, notify=True):
+    """
+    Move the applications in ``queryset`` along ``transitions`` (a ``{source: target}`` dict).
+
+    Applications whose current status is not a key of ``transitions`` are left alone.
+    Returns ``{target: number of applications moved}``.
+    """
+    for source, target in transitions.items():
+        check_transition(source, target)
+
+    moved = {}
+    touched_dates = set()
+    with transaction.atomic():
+        # Lock and capture every source set before updating, so chained transitions
+        # ({'a': 'b', 'b': 'c'}) never move an application twice. The lock is taken on
+        # the base table only; the admin queryset may carry outer joins.
+        selected = {
+            source: list(
+                IDApplication.objects.filter(pk__in=queryset.filter(status=source).values('pk'))
+                .select_for_update()
+                .only('pk', 'created_at', 'full_name', 'application_number', 'submitted_at', 'approved_at')
+            )
+            for source in transitions
+        }
+
+        for source, rows in selected.items():
+            if not rows:
+                continue
+            target = transitions[source]
+            ids = [application.pk for application in rows]
+            touched_dates.update(local_date(application.created_at) for application in rows)
+
+            now = timezone.now()
+            changes = {'status': target, 'updated_at': now}
+            stamps = []
+            if target not in UNSUBMITTED_STATUSES:
+                changes['submitted_at'] = Coalesce('submitted_at', Value(now))
+                stamps.append('submitted_at')
+            if target in APPROVAL_STATUSES:
+                changes['approved_at'] = Coalesce('approved_at', Value(now))
+                stamps.append('approved_at')
+            for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+                IDApplication.objects.filter(pk__in=ids[start:start + UPDATE_CHUNK_SIZE], status=source).update(**changes)
+
+            ApplicationStatusHistory.objects.bulk_create(
+                [
+                    ApplicationStatusHistory(
+                        application_id=pk,
+                        previous_status=source,
+                        new_status=target,
+                        changed_by=changed_by,
+                        change_reason=reason,
+                        notes=notes,
+                        location_type=location_type,
+                    )
+                    for pk in ids
+                ],
+                batch_size=1000,
+            )
+            record_updates({
+                application: {
+                    'status': (source, target),
+                    **{field: (None, now) for field in stamps if getattr(application, field) is None},
+                }
+                for application in rows
+            }, notes=reason, user=changed_by)
+            if notify:
+                enqueue_status_notifications(ids, target)
+            run_hooks(ids, source, target, changed_by)
+            moved[target] = moved.get(target, 0) + len(ids)
+
+        # update() sends no signals, so refresh the daily stats rollup here
+        schedule_refresh(*touched_dates)
+    return moved
@@ -39,6 +39,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'huduma.audit.AuditMiddleware',
 ]
 
 ROOT_URLCONF = 'online_id_application.urls'
@@ -125,3 +126,103 @@ MEDIA_ROOT = BASE_DIR / "media"   # absolute path where uploads are stored
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# ------------------------
+# Number sequences (see huduma/numbering.py)
+# ------------------------
+HUDUMA_SEQUENCES = {
+    'application_number': {'block_size': 1000, 'rollover': 'yearly'},
+}
+
+# ------------------------
+# Daily statistics rollup (see huduma/stats.py)
+# ------------------------
+HUDUMA_DAILY_STATS = {
+    'live_updates': True,   # mark touched days stale when a save commits (refresh_daily_stats --loop
+                            # recomputes them); turn off for bulk loads
+}
+
+# ------------------------
+# Dashboard time series (see huduma/stats.py)
+# ------------------------
+HUDUMA_TIMESERIES = {
+    'max_buckets': {'day': 366, 'week': 156, 'month': 60},  # longer ranges keep the most recent buckets
+    'cache_timeout': 60 * 60,   # seconds closed buckets stay cached
+}
+
+# ------------------------
+# Per-process cache invalidation (see huduma/generations.py)
+# ------------------------
+# The gazetteer, notification templates and time-series buckets are cached in
+# each process; their generation counters live in the database, so the default
+# per-process cache is enough and no shared CACHES backend is required.
+HUDUMA_GENERATIONS = {
+    'check_interval': 5,    # seconds a process trusts the counters it read last
+}
+
+# ------------------------
+# Admin index statistics
+# ------------------------
+HUDUMA_ADMIN_STATS_TTL = 300   # seconds the admin index statistics snapshot is cached
+
+# ------------------------
+# QR code rendering (see huduma/qr.py)
+# ------------------------
+HUDUMA_QR = {
+    'local_runner': False,  # also store a PNG in qr_code after each save (pages use the /qr/ endpoint)
+    'batch_size': 200,      # rows rendered per batch by render_qr_codes
+    'memory_items': 2048,   # rendered images kept in each process
+    'cache_dir': None,      # rendered image files; defaults to MEDIA_ROOT/qr_cache
+}
+
+# ------------------------
+# Notification delivery (see huduma/dispatch.py)
+# ------------------------
+HUDUMA_NOTIFICATIONS = {
+    'backends': {
+        'sms': 'huduma.dispatch.ConsoleBackend',     # replace with the SMS gateway backend in production
+        'email': 'huduma.dispatch.ConsoleBackend',   # huduma.dispatch.EmailBackend sends through EMAIL_BACKEND
+        'system': 'huduma.dispatch.InAppBackend',
+    },
+    'batch_size': 500,      # notifications claimed per batch by dispatch_notifications
+    'concurrency': 8,       # messages in flight per worker
+    'lease': 300,           # seconds a claimed batch stays with its worker
+    'max_attempts': 5,
+    'retry_delay': 60,      # seconds before the first retry; doubles with every attempt
+    'max_retry_delay': 6 * 60 * 60,
+}
+
+# ------------------------
+# Payment callbacks (see huduma/payments.py)
+# ------------------------
+HUDUMA_PAYMENTS = {
+    'callback_token': os.environ.get('HUDUMA_MPESA_CALLBACK_TOKEN'),  # required as ?token=; unset rejects every callback
+    # Addresses callbacks may come from, e.g. Safaricom's published Daraja ranges;
+    # empty accepts any. Behind a proxy REMOTE_ADDR must already be the client's.
+    'callback_networks': [
+        network.strip() for network in os.environ.get('HUDUMA_MPESA_CALLBACK_NETWORKS', '').split(',') if network.strip()
+    ],
+    'batch_size': 500,      # callbacks matched per transaction by process_payment_callbacks
+}
+
+# ------------------------
+# Audit trail (see huduma/audit.py)
+# ------------------------
+HUDUMA_AUDIT = {
+    'enabled': True,
+    'background': True,     # False writes each event when its transaction commits
+    'flush_interval': 0.5,  # seconds between writes of the queued events
+    'batch_size': 500,      # events per write; a full batch is written at once
+    'max_queue': 50_000,    # queued events beyond this go to the spool
+    'slow_flush': 1.0,      # seconds; a slower or failed write sends batches to the spool...
+    'spool_for': 30,        # ...for this many seconds
+    'spool_dir': None,      # defaults to BASE_DIR/audit_spool; load it with replay_audit_spool
+}
+
+# ------------------------
+# History archival (see huduma/archive.py)
+# ------------------------
+HUDUMA_ARCHIVE = {
+    'directory': None,      # archived AuditLog and status history files; defaults to BASE_DIR/archive
+    'file_rows': 100_000,   # rows per compressed file, moved out of the table in one transaction
+}
@@ -0,0 +1,24 @@
+// Address dropdowns are filled from the gazetteer: one request per county subtree,
+// then revalidated (or, once the version is known, served from the browser cache)
+const gazetteerLevels = ['county', 'sub_county', 'division', 'location', 'sub_location', 'village'];
+const gazetteerIndex = {};
+let gazetteerVersion = '';
+
+function indexGazetteer(level, node) {
+    if (!node.children) return;
+    const childLevel = gazetteerLevels[gazetteerLevels.indexOf(level) + 1];
+    gazetteerIndex[`${level}:${node.id}`] = node.children;
+    node.children.forEach(child => indexGazetteer(childLevel, child));
+}
+
+function gazetteerChildren(level, id) {
+    const key = `${level}:${id}`;
+    if (gazetteerIndex[key]) return Promise.resolve(gazetteerIndex[key]);
+    return fetch(`/api/gazetteer/?level=${level}&id=${id}&v=${gazetteerVersion}`)
+        .then(response => response.json())
+        .then(data => {
+            gazetteerVersion = data.version;
+            indexGazetteer(level, data.tree);
+            return gazetteerIndex[key] || [];
+        });
+}